@@ -1,25 +1,116 @@
 from passlib.context import CryptContext
 from jose import JWTError, jwt
-from datetime import datetime, timedelta
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+import hashlib
 import os
+import secrets
+import uuid
+from .cache import TTLCache
+from . import hashing, metrics, models
 
-# For password hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# For password hashing. Hashes made with any other cost are upgraded on the next successful login.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS,
+)
 
 # Secret key for JWT
 SECRET_KEY = os.getenv("SECRET_KEY", "your_default_secret_key_if_missing")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+# Refresh tokens let clients get new access tokens without sending the password (and paying
+# for a bcrypt verify) again. They are random strings stored only as a SHA-256 digest, and are
+# rotated on every use; every token descended from one login shares a "family".
+REFRESH_TOKEN_EXPIRE_DAYS = float(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "30"))
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
+# Put the user id in the token ("uid" claim) so requests can be authenticated without a user lookup.
+# Off by default: such a token keeps resolving to its user id for its whole lifetime, even if the
+# user is deleted or renamed, so only turn it on where users never change.
+JWT_EMBED_USER_ID = os.getenv("JWT_EMBED_USER_ID", "0") == "1"
+
+# Users allowed to call the /admin endpoints, as a comma-separated list of usernames
+ADMIN_USERNAMES = {name.strip() for name in os.getenv("ADMIN_USERNAMES", "").split(",") if name.strip()}
+
+# Tokens already resolved to a user, so repeat requests skip jwt.decode and the user query
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+PRINCIPAL_CACHE_TTL_SECONDS = float(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", "300"))
+
+# The authenticated user, as much of it as routes need
+@dataclass(frozen=True)
+class Principal:
+    id: int
+    username: str
+    family: Optional[str] = None
+
+principal_cache = TTLCache(maxsize=PRINCIPAL_CACHE_SIZE, ttl=PRINCIPAL_CACHE_TTL_SECONDS)
+metrics.CACHES.add("principal", principal_cache)
+
+# Call when a user is changed or deleted so their cached tokens are resolved again
+def invalidate_user(user_id: int):
+    return principal_cache.discard_where(lambda principal: principal.id == user_id)
+
+# Refresh token families revoked by a logout or a detected token reuse. Access tokens carry
+# their family ("fam" claim) and are refused while it is listed; entries only need to outlive
+# the access tokens, as the refresh tokens themselves are revoked in the database.
+# It is never trimmed to a size, so a revoked family cannot be pushed out while its access tokens
+# are still valid; it holds at most the revocations of the last ACCESS_TOKEN_EXPIRE_MINUTES.
+# The set is per process: other workers stop accepting the family's refresh tokens at once,
+# but accept its access tokens until they expire.
+revoked_families = TTLCache(maxsize=None, ttl=ACCESS_TOKEN_EXPIRE_MINUTES * 60)
+
+def revoke_family(family: str):
+    revoked_families.set(family, True)
+
+def is_revoked(family: Optional[str]):
+    return family is not None and family in revoked_families
+
+def new_token_family():
+    return uuid.uuid4().hex
+
+def hash_refresh_token(token: str):
+    return hashlib.sha256(token.encode()).hexdigest()
+
+# Returns the token to hand to the client and the row to store for it
+def new_refresh_token(user_id: int, family: str):
+    token = secrets.token_urlsafe(32)
+    row = models.RefreshToken(
+        token_hash=hash_refresh_token(token),
+        family=family,
+        user_id=user_id,
+        expires_at=datetime.utcnow() + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS),
+    )
+    return token, row
+
+# These run on the bounded hashing pool and raise hashing.HasherSaturated when it is full
+async def verify_password(plain_password, hashed_password):
+    return await hashing.executor.run_async(pwd_context.verify, plain_password, hashed_password)
+
+# Returns (matched, new_hash); new_hash is None unless the stored hash should be replaced
+async def verify_and_update_password(plain_password, hashed_password):
+    return await hashing.executor.run_async(pwd_context.verify_and_update, plain_password, hashed_password)
+
+async def get_password_hash(password):
+    return await hashing.executor.run_async(pwd_context.hash, password)
 
 def create_access_token(data: dict, expires_delta: timedelta = None):
     to_encode = data.copy()
-    expire = datetime.now() + (expires_delta if expires_delta else timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
+    # An aware UTC time: jose turns it into a correct epoch `exp` whatever the server's timezone
+    expire = datetime.now(timezone.utc) + (expires_delta if expires_delta else timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
     to_encode.update({"exp": expire})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
+
+def token_claims(user, family: str = None):
+    claims = {"sub": user.username}
+    if JWT_EMBED_USER_ID:
+        claims["uid"] = user.id
+    if family is not None:
+        claims["fam"] = family
+    return claims
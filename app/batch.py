@@ -0,0 +1,53 @@
+import os
+from pydantic import ValidationError
+from sqlalchemy import insert
+from sqlalchemy.exc import DBAPIError
+
+# Largest number of items accepted by one batch request
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "1000"))
+
+def error_message(exc: ValidationError):
+    return "; ".join(f"{'.'.join(str(part) for part in error['loc']) or 'item'}: {error['msg']}" for error in exc.errors())
+
+# Validates each raw item on its own, so one bad item does not reject the whole batch.
+# Returns [(index, validated item)] and {index: error message}.
+def validate_items(items, schema):
+    valid, errors = [], {}
+    for index, item in enumerate(items):
+        try:
+            valid.append((index, schema.model_validate(item)))
+        except ValidationError as exc:
+            errors[index] = error_message(exc)
+    return valid, errors
+
+# Inserts rows with one executemany INSERT ... RETURNING inside a savepoint. If the database
+# rejects any row, falls back to one savepoint per row so only the offending rows fail.
+# Runs on a plain Session; async callers go through `await db.run_sync(insert_rows, ...)`.
+# Returns {index: returned row} and {index: error message}.
+def insert_rows(session, model, rows):
+    statement = insert(model).returning(model.id, model.timestamp, sort_by_parameter_order=True)
+    if not rows:
+        return {}, {}
+    try:
+        with session.begin_nested():
+            returned = session.execute(statement, [values for _, values in rows]).all()
+        return {index: row for (index, _), row in zip(rows, returned)}, {}
+    except DBAPIError:
+        pass
+    created, errors = {}, {}
+    for index, values in rows:
+        try:
+            with session.begin_nested():
+                created[index] = session.execute(statement, [values]).one()
+        except DBAPIError as exc:
+            errors[index] = str(exc.orig)
+    return created, errors
+
+def results(count, created, errors):
+    items = []
+    for index in range(count):
+        if index in created:
+            items.append({"index": index, "status": "created", "id": created[index].id, "timestamp": created[index].timestamp})
+        else:
+            items.append({"index": index, "status": "error", "error": errors.get(index, "not processed")})
+    return {"created": len(created), "failed": count - len(created), "results": items}
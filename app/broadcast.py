@@ -0,0 +1,123 @@
+import asyncio
+import os
+from fastapi.responses import StreamingResponse
+from . import serialization
+
+# In-process pub/sub for the server-sent event streams. Routes publish new posts and comments
+# to a topic; every open stream on that topic has its own bounded queue. A subscriber that
+# falls SSE_QUEUE_SIZE events behind is handled by SSE_SLOW_CONSUMER: "disconnect" ends its
+# stream (the client reconnects with Last-Event-ID and catches up from the database), "drop"
+# discards the events it has no room for. Only streams served by the same process see an event.
+SSE_QUEUE_SIZE = int(os.getenv("SSE_QUEUE_SIZE", "100"))
+SSE_SLOW_CONSUMER = os.getenv("SSE_SLOW_CONSUMER", "disconnect")
+# Comment lines sent on idle streams, so proxies do not time them out
+SSE_HEARTBEAT_SECONDS = float(os.getenv("SSE_HEARTBEAT_SECONDS", "15"))
+# Most rows replayed to a client reconnecting with Last-Event-ID
+SSE_BACKLOG_LIMIT = int(os.getenv("SSE_BACKLOG_LIMIT", "1000"))
+
+POSTS_TOPIC = "posts"
+
+def comments_topic(post_id: int):
+    return f"comments:{post_id}"
+
+# Put in a queue to end its stream
+CLOSED = object()
+
+class Subscription:
+    __slots__ = ("topic", "queue", "dropped")
+
+    def __init__(self, topic, size):
+        self.topic = topic
+        self.queue = asyncio.Queue(maxsize=size)
+        self.dropped = 0
+
+    # The next event, CLOSED, or None when `timeout` passes first
+    async def get(self, timeout: float = None):
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+class Broadcaster:
+    def __init__(self, queue_size: int = SSE_QUEUE_SIZE, slow_consumer: str = SSE_SLOW_CONSUMER):
+        if slow_consumer not in ("disconnect", "drop"):
+            raise ValueError(f"slow_consumer must be 'disconnect' or 'drop', not {slow_consumer!r}")
+        self.queue_size = queue_size
+        self.slow_consumer = slow_consumer
+        self._topics = {}
+
+    def subscribe(self, topic):
+        subscription = Subscription(topic, self.queue_size)
+        self._topics.setdefault(topic, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        subscribers = self._topics.get(subscription.topic)
+        if subscribers is not None:
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._topics[subscription.topic]
+
+    def subscribers(self, topic=None):
+        if topic is not None:
+            return len(self._topics.get(topic, ()))
+        return sum(len(subscribers) for subscribers in self._topics.values())
+
+    # Must run on the event loop that serves the streams, i.e. from async routes
+    def publish(self, topic, event):
+        for subscription in list(self._topics.get(topic, ())):
+            try:
+                subscription.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                subscription.dropped += 1
+                if self.slow_consumer == "disconnect":
+                    # Discard everything it has not sent yet, so its Last-Event-ID marks where
+                    # the catch-up has to start
+                    self.unsubscribe(subscription)
+                    while not subscription.queue.empty():
+                        subscription.queue.get_nowait()
+                    subscription.queue.put_nowait(CLOSED)
+
+    # The stream for a subscription: `backlog` (rows since Last-Event-ID) first, then, if `live`,
+    # new events, skipping any the backlog already sent. Unsubscribes when the client goes away.
+    async def stream(self, subscription, event_type, backlog=(), live=True, heartbeat: float = SSE_HEARTBEAT_SECONDS):
+        try:
+            sent = set()
+            for item in backlog:
+                sent.add(item["id"])
+                yield format_event(event_type, item)
+            while live:
+                item = await subscription.get(timeout=heartbeat)
+                if item is CLOSED:
+                    return
+                if item is None:
+                    yield ": keep-alive\n\n"
+                elif item["id"] not in sent:
+                    yield format_event(event_type, item)
+        finally:
+            self.unsubscribe(subscription)
+
+# Server-sent events for a subscription. The subscription is dropped when the response ends,
+# whatever ends it: stream() cleans up only once it has started, which it never does if the
+# client is gone before the first chunk. Content-Encoding: identity keeps GZipMiddleware from
+# holding events back.
+class EventStreamResponse(StreamingResponse):
+    media_type = "text/event-stream"
+
+    def __init__(self, broadcaster, subscription, content):
+        headers = {"Cache-Control": "no-cache", "Content-Encoding": "identity", "X-Accel-Buffering": "no"}
+        super().__init__(content, headers=headers)
+        self.broadcaster = broadcaster
+        self.subscription = subscription
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.broadcaster.unsubscribe(self.subscription)
+
+# One event in the text/event-stream format, with the row id as its event id
+def format_event(event_type: str, item):
+    return f"id: {item['id']}\nevent: {event_type}\ndata: {serialization.dumps(item).decode()}\n\n"
+
+broadcaster = Broadcaster()
@@ -0,0 +1,81 @@
+import threading
+import time
+from collections import OrderedDict
+
+# A small thread-safe LRU cache whose entries also expire.
+# Each entry lives for `ttl` seconds, or until its own `expires_at` (epoch seconds) if that is sooner.
+# With maxsize=None nothing is evicted before it expires; expired entries are dropped as new ones come in.
+class TTLCache:
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > time.time():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value, expires_at: float = None):
+        if self.maxsize is not None and self.maxsize <= 0:
+            return
+        deadline = time.time() + self.ttl
+        if expires_at is not None:
+            deadline = min(deadline, expires_at)
+        with self._lock:
+            self._entries[key] = (value, deadline)
+            self._entries.move_to_end(key)
+            if self.maxsize is None:
+                now = time.time()
+                while self._entries and next(iter(self._entries.values()))[1] <= now:
+                    self._entries.popitem(last=False)
+                return
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def __contains__(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry is not None and entry[1] > time.time()
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            return default if entry is None else entry[0]
+
+    # Drops every entry whose value matches, e.g. all cached tokens of one user
+    def discard_where(self, predicate):
+        with self._lock:
+            stale = [key for key, (value, _) in self._entries.items() if predicate(value)]
+            for key in stale:
+                del self._entries[key]
+            return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,99 @@
+import argparse
+from . import database, search, migrations, maintenance, sharding, compression
+
+# Maintenance commands for an existing database, e.g.
+#   python -m app.cli migrate
+#   python -m app.cli rebuild-search-index
+#   python -m app.cli recount-comments
+#   python -m app.cli compress-content
+#   python -m app.cli purge-orphans
+
+# The primary database, then each shard when SHARD_URLS is set
+def databases():
+    yield "primary", database.engine
+    for shard in sharding.shard_set or []:
+        yield f"shard {shard.index}", shard.engine
+
+def rebuild_search_index(args):
+    for label, target in databases():
+        with target.begin() as connection:
+            if not search.is_supported(connection):
+                print(f"{label}: full-text search needs SQLite FTS5; nothing to rebuild.")
+                continue
+            search.rebuild_index(connection)
+        print(f"{label}: search index rebuilt.")
+
+def migrate(args):
+    for label, target in databases():
+        if args.status:
+            for name, applied in migrations.status(target):
+                print(f"{label}: {'applied' if applied else 'pending'}  {name}")
+            continue
+        applied = migrations.prepare(target)
+        for name in applied:
+            print(f"{label}: applied {name}")
+        if not applied:
+            print(f"{label}: database is up to date.")
+    # The same schema the app's startup sets up, so it can run with MIGRATE_ON_STARTUP=0
+    if not args.status and sharding.shard_set is not None:
+        sharding.shard_set.setup()
+        print(f"{len(sharding.shard_set)} shards: id sequences ready.")
+
+def recount_comments(args):
+    for label, target in databases():
+        fixed = maintenance.recount_comments(target, batch_size=args.batch_size)
+        print(f"{label}: corrected the comment count of {fixed} posts.")
+
+def compress_content(args):
+    method = "" if args.method == "none" else args.method
+    for label, target in databases():
+        changed = maintenance.recompress_content(target, method, min_bytes=args.min_bytes, batch_size=args.batch_size)
+        print(f"{label}: rewrote {changed} bodies as {method or 'plain text'}.")
+
+def purge_orphans(args):
+    for label, target in databases():
+        deleted = maintenance.delete_orphan_comments(target, batch_size=args.batch_size)
+        print(f"{label}: deleted {deleted} orphaned comments.")
+        if args.enable_incremental_vacuum and maintenance.auto_vacuum_mode(target) != "incremental":
+            maintenance.enable_incremental_vacuum(target)
+            print(f"{label}: switched to incremental auto-vacuum.")
+        if maintenance.auto_vacuum_mode(target) != "incremental":
+            print(f"{label}: auto_vacuum is not incremental; rerun with --enable-incremental-vacuum (a one-off full VACUUM) to reclaim space.")
+            continue
+        freed = maintenance.incremental_vacuum(target, pages=args.vacuum_pages)
+        print(f"{label}: returned {freed} free pages to the file system.")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.cli", description="Blog API maintenance commands")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    migrate_parser = commands.add_parser("migrate", help="Apply pending schema migrations and build the search index and shard id sequences")
+    migrate_parser.add_argument("--status", action="store_true", help="List migrations without applying them")
+    migrate_parser.set_defaults(handler=migrate)
+
+    rebuild = commands.add_parser("rebuild-search-index", help="Create and repopulate the full-text search index")
+    rebuild.set_defaults(handler=rebuild_search_index)
+
+    recount = commands.add_parser("recount-comments", help="Recompute posts.comment_count from the comments table")
+    recount.add_argument("--batch-size", type=int, default=1000)
+    recount.set_defaults(handler=recount_comments)
+
+    compress = commands.add_parser("compress-content", help="Store post and comment bodies in the CONTENT_COMPRESSION format")
+    compress.add_argument("--method", choices=["zlib", "zstd", "none"], default=compression.CONTENT_COMPRESSION or "none")
+    compress.add_argument("--min-bytes", type=int, default=compression.CONTENT_COMPRESSION_MIN_BYTES)
+    compress.add_argument("--batch-size", type=int, default=1000)
+    compress.set_defaults(handler=compress_content)
+
+    orphans = commands.add_parser("purge-orphans", help="Delete comments whose post is gone, then run an incremental vacuum")
+    orphans.add_argument("--batch-size", type=int, default=1000)
+    orphans.add_argument("--vacuum-pages", type=int, default=0, help="Most free pages to release (default: all)")
+    orphans.add_argument("--enable-incremental-vacuum", action="store_true", help="Switch the database to auto_vacuum=INCREMENTAL first (rewrites the whole file)")
+    orphans.set_defaults(handler=purge_orphans)
+
+    args = parser.parse_args(argv)
+    database.open_engines()
+    sharding.open_shards()
+    args.handler(args)
+
+if __name__ == "__main__":
+    main()
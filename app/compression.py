@@ -0,0 +1,93 @@
+import os
+import sqlite3
+import zlib
+from sqlalchemy import Text, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.functions import FunctionElement
+from sqlalchemy.types import TypeDecorator
+
+# zstd is optional: install `zstandard` to use CONTENT_COMPRESSION=zstd
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Optional compression of post and comment bodies at rest. With CONTENT_COMPRESSION set to
+# "zlib" or "zstd", bodies of at least CONTENT_COMPRESSION_MIN_BYTES are stored as a BLOB: one
+# format marker byte followed by the compressed UTF-8 text. Shorter bodies, and bodies that
+# would not shrink, stay plain TEXT. Reads handle every format whatever the setting, so it can
+# be switched on or off at any time; `python -m app.cli compress-content` converts older rows.
+CONTENT_COMPRESSION = os.getenv("CONTENT_COMPRESSION", "")
+CONTENT_COMPRESSION_MIN_BYTES = int(os.getenv("CONTENT_COMPRESSION_MIN_BYTES", "1024"))
+CONTENT_COMPRESSION_LEVEL = int(os.getenv("CONTENT_COMPRESSION_LEVEL", "6"))
+
+ZLIB = b"\x01"
+ZSTD = b"\x02"
+MARKERS = {"zlib": ZLIB, "zstd": ZSTD}
+
+if CONTENT_COMPRESSION and CONTENT_COMPRESSION not in MARKERS:
+    raise ValueError(f"CONTENT_COMPRESSION must be one of {', '.join(MARKERS)}, not {CONTENT_COMPRESSION!r}")
+if CONTENT_COMPRESSION == "zstd" and zstandard is None:
+    raise RuntimeError("CONTENT_COMPRESSION=zstd needs the zstandard package")
+
+# The stored form of `text`: the text itself, or marker + compressed bytes
+def compress(text: str, method: str = None, min_bytes: int = None):
+    method = CONTENT_COMPRESSION if method is None else method
+    min_bytes = CONTENT_COMPRESSION_MIN_BYTES if min_bytes is None else min_bytes
+    if not method:
+        return text
+    raw = text.encode()
+    if len(raw) < min_bytes:
+        return text
+    if method == "zstd":
+        packed = ZSTD + zstandard.ZstdCompressor(level=CONTENT_COMPRESSION_LEVEL).compress(raw)
+    else:
+        packed = ZLIB + zlib.compress(raw, CONTENT_COMPRESSION_LEVEL)
+    return packed if len(packed) < len(raw) else text
+
+def decompress(value):
+    if not isinstance(value, (bytes, memoryview)):
+        return value
+    value = bytes(value)
+    marker, payload = value[:1], value[1:]
+    if marker == ZLIB:
+        return zlib.decompress(payload).decode()
+    if marker == ZSTD:
+        if zstandard is None:
+            raise RuntimeError("this row is zstd-compressed; install the zstandard package to read it")
+        return zstandard.ZstdDecompressor().decompress(payload).decode()
+    raise ValueError(f"unknown content format marker {marker!r}")
+
+def is_compressed(value):
+    return isinstance(value, (bytes, memoryview))
+
+class CompressedText(TypeDecorator):
+    impl = Text
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return None if value is None else compress(value)
+
+    def process_result_value(self, value, dialect):
+        return decompress(value)
+
+# decompress(x) in SQL: the full-text triggers index the text rather than the stored bytes,
+# and excerpts are cut from it. Registered on every SQLite connection the process opens.
+@event.listens_for(Engine, "connect")
+def _register_function(dbapi_connection, connection_record):
+    if isinstance(dbapi_connection, sqlite3.Connection) or type(dbapi_connection).__module__.endswith("aiosqlite"):
+        dbapi_connection.create_function("decompress", 1, decompress, deterministic=True)
+
+# The text of a CompressedText column, inside SQL
+class content_text(FunctionElement):
+    type = Text()
+    inherit_cache = True
+
+@compiles(content_text)
+def _content_text(element, compiler, **kw):
+    return compiler.process(element.clauses, **kw)
+
+@compiles(content_text, "sqlite")
+def _content_text_sqlite(element, compiler, **kw):
+    return f"decompress({compiler.process(element.clauses, **kw)})"
@@ -1,10 +1,254 @@
-from sqlalchemy import create_engine
+import asyncio
+import os
+import weakref
+from contextlib import asynccontextmanager
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import CursorResult, make_url
 # from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import QueuePool, StaticPool
+from starlette.concurrency import run_in_threadpool
+from . import metrics, profiling
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./blog.db"
+SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./blog.db")
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
+# "sync" runs queries with the regular driver on the threadpool, one query at a time;
+# "async" uses aiosqlite through an AsyncSession so requests never hold a thread.
+DB_MODE = os.getenv("DB_MODE", "sync")
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# SQLite engine profile, applied to every new connection.
+# WAL lets readers run alongside the single writer; busy_timeout makes a blocked writer
+# wait for the lock instead of failing with "database is locked".
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+# Negative values are KiB, positive values are pages (SQLite's own convention)
+SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", "-65536"))
+# Only takes effect on a new database file; `python -m app.cli purge-orphans --enable-incremental-vacuum`
+# converts an existing one. INCREMENTAL lets space freed by deletes be returned to the OS later.
+SQLITE_AUTO_VACUUM = os.getenv("SQLITE_AUTO_VACUUM", "INCREMENTAL")
+
+# Separate pools for writes and reads, so GET routes never wait behind writers for a connection
+DB_WRITE_POOL_SIZE = int(os.getenv("DB_WRITE_POOL_SIZE", "5"))
+DB_WRITE_MAX_OVERFLOW = int(os.getenv("DB_WRITE_MAX_OVERFLOW", "5"))
+DB_READ_POOL_SIZE = int(os.getenv("DB_READ_POOL_SIZE", "20"))
+DB_READ_MAX_OVERFLOW = int(os.getenv("DB_READ_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+
+def is_sqlite(url):
+    return make_url(url).get_backend_name() == "sqlite"
+
+def is_sqlite_memory(url):
+    return make_url(url).database in (None, "", ":memory:")
+
+def apply_sqlite_pragmas(dbapi_connection, read_only=False, memory=False):
+    cursor = dbapi_connection.cursor()
+    if not memory:
+        cursor.execute(f"PRAGMA auto_vacuum={SQLITE_AUTO_VACUUM}")
+        cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute(f"PRAGMA cache_size={SQLITE_CACHE_SIZE}")
+    if read_only:
+        cursor.execute("PRAGMA query_only=ON")
+    cursor.close()
+
+def pool_name(read_only):
+    return "read" if read_only else "write"
+
+# Every engine the process has built. A child forked from a process that already opened
+# connections (gunicorn --preload workers) must not use the parent's pooled connections: the
+# pools are replaced without closing them, so the parent's connections stay usable, and each
+# child opens its own.
+_engines = weakref.WeakSet()
+
+def _reset_after_fork():
+    for engine in list(_engines):
+        engine.dispose(close=False)
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+def configure_engine(engine, url, read_only=False):
+    _engines.add(engine)
+    if metrics.METRICS_ENABLED:
+        metrics.instrument_engine(engine, pool_name(read_only))
+    if profiling.SLOW_QUERY_LOG:
+        profiling.instrument_engine(engine)
+    if is_sqlite(url):
+        memory = is_sqlite_memory(url)
+
+        @event.listens_for(engine, "connect")
+        def _on_connect(dbapi_connection, connection_record):
+            apply_sqlite_pragmas(dbapi_connection, read_only=read_only, memory=memory)
+    return engine
+
+def pool_options(url, pool_size, max_overflow, pool_class=QueuePool, read_only=False):
+    # An in-memory SQLite database lives and dies with its connection, so every thread has to
+    # share that one connection; there is no pool to size
+    if is_sqlite(url) and is_sqlite_memory(url):
+        return {"poolclass": StaticPool}
+    if metrics.METRICS_ENABLED:
+        pool_class = metrics.timed_pool(pool_class, pool_name(read_only))
+    return {"poolclass": pool_class, "pool_size": pool_size, "max_overflow": max_overflow, "pool_timeout": DB_POOL_TIMEOUT}
+
+def build_engine(url, pool_size, max_overflow, read_only=False):
+    connect_args = {"check_same_thread": False} if is_sqlite(url) else {}
+    options = pool_options(url, pool_size, max_overflow, read_only=read_only)
+    engine = create_engine(url, connect_args=connect_args, **options)
+    if options["poolclass"] is not StaticPool and max_overflow >= 0:
+        _connection_slots[engine] = asyncio.Semaphore(pool_size + max_overflow)
+    return configure_engine(engine, url, read_only=read_only)
+
+# In sync mode a request's session runs each query on the threadpool and keeps its connection
+# in between. A request left waiting for a pooled connection on a worker thread could take the
+# thread another request needs to finish and give its connection back, and under load every
+# thread ends up waiting until DB_POOL_TIMEOUT. So a request waits for one of its engine's
+# connections here, on the event loop, before its session takes one: no thread ever waits on
+# the pool, whatever the pool size.
+_connection_slots = weakref.WeakKeyDictionary()
+
+@asynccontextmanager
+async def connection_slot(engine):
+    slots = _connection_slots.get(engine)
+    if slots is None:
+        yield
+        return
+    async with slots:
+        yield
+
+# The write engine and the read-only engine for a database. A second engine on an in-memory
+# SQLite URL would open a second, empty database, so there the reads share the write engine.
+def build_engines(url):
+    engine = build_engine(url, DB_WRITE_POOL_SIZE, DB_WRITE_MAX_OVERFLOW)
+    if is_sqlite(url) and is_sqlite_memory(url):
+        return engine, engine
+    return engine, build_engine(url, DB_READ_POOL_SIZE, DB_READ_MAX_OVERFLOW, read_only=True)
+
+# The primary database's engines and session factories. The engines are built by
+# open_engines() when the app starts (or a CLI command runs), not at import, so importing the
+# app touches no database; the session factories are bound to them then.
+engine = None
+read_engine = None
+SessionLocal = sessionmaker(autocommit=False, autoflush=False)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False)
 Base = declarative_base()
+
+def to_async_url(url: str):
+    return url.replace("sqlite://", "sqlite+aiosqlite://", 1) if url.startswith("sqlite://") else url
+
+def build_async_engine(url, pool_size, max_overflow, read_only=False):
+    from sqlalchemy.ext.asyncio import create_async_engine
+    from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+    # Migrations and the background workers use the sync engine, which could not see it
+    if is_sqlite(url) and is_sqlite_memory(url):
+        raise ValueError("DB_MODE=async needs an SQLite database file, not an in-memory database")
+
+    # aiosqlite defaults to opening a connection per checkout; pool them like the sync engines
+    options = pool_options(url, pool_size, max_overflow, pool_class=AsyncAdaptedQueuePool, read_only=read_only)
+    async_engine = create_async_engine(to_async_url(url), **options)
+    configure_engine(async_engine.sync_engine, url, read_only=read_only)
+    return async_engine
+
+async_engine = None
+async_read_engine = None
+AsyncSessionLocal = None
+AsyncReadSessionLocal = None
+
+def open_engines(url: str = SQLALCHEMY_DATABASE_URL):
+    global engine, read_engine, async_engine, async_read_engine, AsyncSessionLocal, AsyncReadSessionLocal
+    engine, read_engine = build_engines(url)
+    SessionLocal.configure(bind=engine)
+    ReadSessionLocal.configure(bind=read_engine)
+    if DB_MODE == "async":
+        from sqlalchemy.ext.asyncio import async_sessionmaker
+
+        async_engine = build_async_engine(url, DB_WRITE_POOL_SIZE, DB_WRITE_MAX_OVERFLOW)
+        async_read_engine = build_async_engine(url, DB_READ_POOL_SIZE, DB_READ_MAX_OVERFLOW, read_only=True)
+        AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+        AsyncReadSessionLocal = async_sessionmaker(async_read_engine, autoflush=False, expire_on_commit=False)
+    return engine
+
+async def dispose_engines():
+    global engine, read_engine, async_engine, async_read_engine, AsyncSessionLocal, AsyncReadSessionLocal
+    if async_engine is not None:
+        await async_engine.dispose()
+        await async_read_engine.dispose()
+    if engine is not None:
+        engine.dispose()
+        read_engine.dispose()
+    engine = read_engine = async_engine = async_read_engine = None
+    AsyncSessionLocal = AsyncReadSessionLocal = None
+
+# The subset of the AsyncSession API the routes use, backed by a regular Session whose
+# blocking calls run on the threadpool. Lets the same async route code serve both modes.
+# Open it with open_threaded_session() so it holds a connection slot (see above).
+class ThreadedSession:
+    def __init__(self, session):
+        self.sync_session = session
+
+    @property
+    def info(self):
+        return self.sync_session.info
+
+    def add(self, instance):
+        self.sync_session.add(instance)
+
+    def add_all(self, instances):
+        self.sync_session.add_all(instances)
+
+    def get_bind(self):
+        return self.sync_session.get_bind()
+
+    async def execute(self, statement, params=None, **kw):
+        return await run_in_threadpool(self._execute_buffered, statement, params, **kw)
+
+    # Rows are fetched on the worker thread, like AsyncSession's buffered results
+    def _execute_buffered(self, statement, params, **kw):
+        result = self.sync_session.execute(statement, params, **kw)
+        if isinstance(result, CursorResult) and not result.returns_rows:
+            return result
+        return result.freeze()()
+
+    async def scalars(self, statement, params=None, **kw):
+        return (await self.execute(statement, params, **kw)).scalars()
+
+    async def scalar(self, statement, params=None, **kw):
+        return (await self.execute(statement, params, **kw)).scalar()
+
+    async def get(self, entity, ident, **kw):
+        return await run_in_threadpool(self.sync_session.get, entity, ident, **kw)
+
+    async def delete(self, instance):
+        await run_in_threadpool(self.sync_session.delete, instance)
+
+    async def flush(self):
+        await run_in_threadpool(self.sync_session.flush)
+
+    async def commit(self):
+        await run_in_threadpool(self.sync_session.commit)
+
+    async def rollback(self):
+        await run_in_threadpool(self.sync_session.rollback)
+
+    async def refresh(self, instance, attribute_names=None):
+        await run_in_threadpool(self.sync_session.refresh, instance, attribute_names)
+
+    async def run_sync(self, fn, *args, **kw):
+        return await run_in_threadpool(fn, self.sync_session, *args, **kw)
+
+    async def close(self):
+        await run_in_threadpool(self.sync_session.close)
+
+# A ThreadedSession on `db` for as long as the caller needs it, holding one of the
+# connection slots of the engine `db` is bound to; closes `db` before giving the slot back
+@asynccontextmanager
+async def open_threaded_session(db):
+    async with connection_slot(db.get_bind()):
+        try:
+            yield ThreadedSession(db)
+        finally:
+            await run_in_threadpool(db.close)
@@ -0,0 +1,79 @@
+import heapq
+import itertools
+import json
+import os
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+# Rows fetched from the cursor per round trip, and per chunk written to the response
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+
+def encode_row(row):
+    return json.dumps({key: value.isoformat() if hasattr(value, "isoformat") else value for key, value in row.items()})
+
+def encode_partition(partition):
+    return "".join(encode_row(row) + "\n" for row in partition)
+
+# The export opens its own session rather than using the request's, because the response body
+# is produced after the request's dependencies have been closed. Rows come off a server-side
+# cursor `EXPORT_BATCH_SIZE` at a time, so memory stays flat whatever the table size.
+def stream_sync(session_factory, statement):
+    with session_factory() as session:
+        result = session.execute(statement.execution_options(yield_per=EXPORT_BATCH_SIZE))
+        for partition in result.mappings().partitions():
+            yield encode_partition(partition)
+
+async def stream_async(session_factory, statement):
+    async with session_factory() as session:
+        result = await session.stream(statement.execution_options(yield_per=EXPORT_BATCH_SIZE))
+        async for partition in result.mappings().partitions():
+            yield encode_partition(partition)
+
+# Sync generators are run on the threadpool by StreamingResponse; async ones on the event loop
+def stream_ndjson(session_factory, statement):
+    if isinstance(session_factory, async_sessionmaker):
+        return stream_async(session_factory, statement)
+    return stream_sync(session_factory, statement)
+
+# The same stream merged from several databases (shards), each read in `key` order
+def stream_ndjson_merged(session_factories, statement, key):
+    if isinstance(session_factories[0], async_sessionmaker):
+        return stream_merged_async(session_factories, statement, key)
+    return stream_merged_sync(session_factories, statement, key)
+
+def rows_sync(session_factory, statement):
+    with session_factory() as session:
+        yield from session.execute(statement.execution_options(yield_per=EXPORT_BATCH_SIZE)).mappings()
+
+def stream_merged_sync(session_factories, statement, key):
+    rows = heapq.merge(*(rows_sync(factory, statement) for factory in session_factories), key=key)
+    while partition := list(itertools.islice(rows, EXPORT_BATCH_SIZE)):
+        yield encode_partition(partition)
+
+async def rows_async(session_factory, statement):
+    async with session_factory() as session:
+        result = await session.stream(statement.execution_options(yield_per=EXPORT_BATCH_SIZE))
+        async for row in result.mappings():
+            yield row
+
+async def stream_merged_async(session_factories, statement, key):
+    sources = [rows_async(factory, statement) for factory in session_factories]
+    heap = []
+    for index, source in enumerate(sources):
+        row = await anext(source, None)
+        if row is not None:
+            heap.append((key(row), index, row))
+    heapq.heapify(heap)
+    partition = []
+    while heap:
+        _, index, row = heap[0]
+        partition.append(row)
+        if len(partition) == EXPORT_BATCH_SIZE:
+            yield encode_partition(partition)
+            partition = []
+        following = await anext(sources[index], None)
+        if following is None:
+            heapq.heappop(heap)
+        else:
+            heapq.heapreplace(heap, (key(following), index, following))
+    if partition:
+        yield encode_partition(partition)
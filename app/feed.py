@@ -0,0 +1,70 @@
+import asyncio
+import heapq
+from sqlalchemy import func, select
+from . import models, schemas
+from .pagination import newest_first
+
+# The home page feed: a page of posts with their author's username and each post's newest
+# comments. Always two queries, whatever the page size: one for the posts joined to their
+# authors, one window-function query for the top comments of every post on the page.
+
+COMMENT_FIELDS = list(schemas.FeedComment.model_fields)
+
+async def load_feed(db, cursor: str = None, limit: int = 10, comments_per_post: int = 3):
+    post_rows = (await db.execute(
+        newest_first(
+            select(models.Post, models.User.username).outerjoin(models.User, models.User.id == models.Post.author_id),
+            models.Post, cursor,
+        ).limit(limit)
+    )).all()
+    post_ids = [post.id for post, _ in post_rows]
+
+    latest = {post_id: [] for post_id in post_ids}
+    if post_ids and comments_per_post > 0:
+        ranked = (
+            select(
+                models.Comment,
+                func.row_number().over(partition_by=models.Comment.post_id, order_by=models.Comment.id.desc()).label("rank"),
+            )
+            .where(models.Comment.post_id.in_(post_ids))
+            .subquery()
+        )
+        comment_rows = (await db.execute(
+            select(ranked, models.User.username.label("author_username"))
+            .outerjoin(models.User, models.User.id == ranked.c.author_id)
+            .where(ranked.c.rank <= comments_per_post)
+            .order_by(ranked.c.post_id, ranked.c.id.desc())
+        )).mappings().all()
+        for row in comment_rows:
+            latest[row["post_id"]].append({field: row[field] for field in COMMENT_FIELDS})
+
+    return [
+        {
+            "id": post.id,
+            "title": post.title,
+            "content": post.content,
+            "timestamp": post.timestamp,
+            "author_id": post.author_id,
+            "author_username": username,
+            "comment_count": post.comment_count,
+            "latest_comments": latest[post.id],
+        }
+        for post, username in post_rows
+    ]
+
+# The same feed when posts are sharded: each shard's page, merged newest first, with the
+# usernames looked up on the primary database, where the users are. Two queries per shard,
+# plus one for the usernames.
+async def load_sharded_feed(shard_dbs, users_db, cursor: str = None, limit: int = 10, comments_per_post: int = 3):
+    pages = await asyncio.gather(*(load_feed(db, cursor, limit, comments_per_post) for db in shard_dbs))
+    posts = list(heapq.merge(*pages, key=lambda post: (post["timestamp"], post["id"]), reverse=True))[:limit]
+    items = posts + [comment for post in posts for comment in post["latest_comments"]]
+    author_ids = {item["author_id"] for item in items}
+    usernames = {}
+    if author_ids:
+        usernames = dict((await users_db.execute(
+            select(models.User.id, models.User.username).where(models.User.id.in_(author_ids))
+        )).all())
+    for item in items:
+        item["author_username"] = usernames.get(item["author_id"])
+    return posts
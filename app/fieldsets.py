@@ -0,0 +1,44 @@
+import os
+from typing import Optional
+from fastapi import HTTPException, status
+from sqlalchemy import String, func, type_coerce
+from . import models, schemas
+from .compression import content_text
+
+# Sparse fieldsets for the post listings. `fields=id,title,timestamp` selects just those
+# columns, so the ones left out (above all `content`) are never read from the database.
+# `excerpt` is the start of `content`, cut to `excerpt_length` characters by SQLite itself
+# (decompressing it first when it is stored compressed).
+POST_FIELDS = list(schemas.Post.model_fields)
+EXCERPT = "excerpt"
+EXCERPT_LENGTH = int(os.getenv("EXCERPT_LENGTH", "200"))
+MAX_EXCERPT_LENGTH = 10000
+
+# Listings always select these too: they order, page, merge and tag the results
+KEY_COLUMNS = [models.Post.id, models.Post.timestamp]
+
+def parse_fields(fields: Optional[str]):
+    if fields is None:
+        return POST_FIELDS
+    names = list(dict.fromkeys(name.strip() for name in fields.split(",") if name.strip()))
+    unknown = [name for name in names if name not in POST_FIELDS and name != EXCERPT]
+    if unknown or not names:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown fields: {', '.join(unknown)}" if unknown else "No fields requested",
+        )
+    return names
+
+def excerpt_column(length: int):
+    return type_coerce(func.substr(content_text(models.Post.content), 1, length), String).label(EXCERPT)
+
+# The columns to select for `fields`, key columns first; select them and
+# serialization.rows_to_dicts(rows, fields) gives the response items
+def post_columns(fields, excerpt_length: int = EXCERPT_LENGTH):
+    columns = list(KEY_COLUMNS)
+    for name in fields:
+        if name == EXCERPT:
+            columns.append(excerpt_column(excerpt_length))
+        elif name not in ("id", "timestamp"):
+            columns.append(getattr(models.Post, name))
+    return columns
@@ -0,0 +1,120 @@
+import asyncio
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from . import batch
+
+# Optional group commit for single-row creates. Instead of one transaction (and one WAL sync)
+# per request, a background writer collects the inserts that arrive within
+# GROUP_COMMIT_WINDOW_MS, up to GROUP_COMMIT_MAX_ROWS, and commits them together.
+# Each caller still gets its own row back, or its own error.
+GROUP_COMMIT = os.getenv("GROUP_COMMIT", "0") == "1"
+GROUP_COMMIT_WINDOW_MS = float(os.getenv("GROUP_COMMIT_WINDOW_MS", "2"))
+GROUP_COMMIT_MAX_ROWS = int(os.getenv("GROUP_COMMIT_MAX_ROWS", "256"))
+
+# The database rejected this row; the rest of its group was still committed
+class WriteRejected(Exception):
+    pass
+
+class _Pending:
+    __slots__ = ("model", "values", "follow_up", "future")
+
+    def __init__(self, model, values, follow_up):
+        self.model = model
+        self.values = values
+        self.follow_up = follow_up
+        self.future = Future()
+
+_STOP = object()
+
+class GroupCommitWriter:
+    def __init__(self, session_factory, window_ms: float = GROUP_COMMIT_WINDOW_MS, max_rows: int = GROUP_COMMIT_MAX_ROWS):
+        self.session_factory = session_factory
+        self.window = window_ms / 1000
+        self.max_rows = max_rows
+        self.commits = 0
+        self.rows = 0
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    # Queues an insert of `values` into `model`. `follow_up`, if given, is a statement run in
+    # the same transaction once the row is in, e.g. bumping a counter on its parent.
+    # Returns a Future resolving to the inserted (id, timestamp) row or raising WriteRejected.
+    def submit(self, model, values, follow_up=None):
+        self._start()
+        pending = _Pending(model, values, follow_up)
+        self._queue.put(pending)
+        return pending.future
+
+    async def insert(self, model, values, follow_up=None):
+        return await asyncio.wrap_future(self.submit(model, values, follow_up))
+
+    def _start(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="group-commit", daemon=True)
+                    self._thread.start()
+
+    # Commits what is queued and stops the background writer
+    def shutdown(self):
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(_STOP)
+            thread.join()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            group, stopping = [item], False
+            deadline = time.monotonic() + self.window
+            while len(group) < self.max_rows:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                group.append(item)
+            self._commit(group)
+            if stopping:
+                return
+
+    def _commit(self, group):
+        session = self.session_factory()
+        try:
+            created, errors = {}, {}
+            for model in {pending.model for pending in group}:
+                rows = [(index, pending.values) for index, pending in enumerate(group) if pending.model is model]
+                model_created, model_errors = batch.insert_rows(session, model, rows)
+                created.update(model_created)
+                errors.update(model_errors)
+            for index in created:
+                if group[index].follow_up is not None:
+                    session.execute(group[index].follow_up)
+            session.commit()
+        except Exception as exc:
+            session.rollback()
+            for pending in group:
+                pending.future.set_exception(exc)
+            return
+        finally:
+            session.close()
+
+        self.commits += 1
+        self.rows += len(created)
+        for index, pending in enumerate(group):
+            if index in created:
+                pending.future.set_result(created[index])
+            else:
+                pending.future.set_exception(WriteRejected(errors.get(index, "not processed")))
@@ -0,0 +1,52 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from . import metrics
+
+# bcrypt is deliberately slow, so it runs on its own small pool instead of the request threads.
+# HASH_WORKERS caps how many hashes run at once and HASH_QUEUE_LIMIT how many may wait;
+# past that, callers get HasherSaturated (a 503) instead of piling up behind the pool.
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+HASH_QUEUE_LIMIT = int(os.getenv("HASH_QUEUE_LIMIT", "64"))
+
+class HasherSaturated(Exception):
+    pass
+
+# Records the time spent in the hash itself, not waiting for a worker
+def _timed(fn, *args):
+    started = time.perf_counter()
+    try:
+        return fn(*args)
+    finally:
+        metrics.HASH_SECONDS.observe(time.perf_counter() - started, getattr(fn, "__name__", "unknown"))
+
+class BoundedExecutor:
+    def __init__(self, workers: int, queue_limit: int):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash")
+        self._slots = threading.BoundedSemaphore(workers + queue_limit)
+
+    def submit(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            metrics.HASH_REJECTED.inc()
+            raise HasherSaturated()
+        try:
+            future = self._executor.submit(_timed, fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def run(self, fn, *args):
+        return self.submit(fn, *args).result()
+
+    # For async routes: waits without holding a threadpool thread
+    async def run_async(self, fn, *args):
+        return await asyncio.wrap_future(self.submit(fn, *args))
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+executor = BoundedExecutor(HASH_WORKERS, HASH_QUEUE_LIMIT)
@@ -0,0 +1,42 @@
+import hashlib
+import os
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from fastapi import Request, Response
+
+# Cache-Control sent with cacheable reads. The default makes clients and CDNs revalidate
+# every time, which is cheap now that unchanged resources answer 304 without a body.
+HTTP_CACHE_CONTROL = os.getenv("HTTP_CACHE_CONTROL", "no-cache")
+
+def make_etag(*parts):
+    digest = hashlib.blake2b(repr(parts).encode(), digest_size=12).hexdigest()
+    return f'"{digest}"'
+
+def http_date(value: datetime):
+    return format_datetime(value.replace(tzinfo=timezone.utc, microsecond=0), usegmt=True)
+
+def cache_headers(etag, last_modified: datetime = None):
+    headers = {"ETag": etag, "Cache-Control": HTTP_CACHE_CONTROL}
+    if last_modified is not None:
+        headers["Last-Modified"] = http_date(last_modified)
+    return headers
+
+# If-None-Match wins over If-Modified-Since, as RFC 9110 requires
+def is_not_modified(request: Request, etag, last_modified: datetime = None):
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in candidates or etag in candidates
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        return last_modified.replace(tzinfo=timezone.utc, microsecond=0) <= since
+    return False
+
+def not_modified(headers):
+    return Response(status_code=304, headers=headers)
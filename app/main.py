@@ -1,17 +1,23 @@
 from math import e
-from typing import List
-from fastapi import FastAPI, Depends, HTTPException, status
+from contextlib import AsyncExitStack, asynccontextmanager
+from typing import Any, List, Optional, Union
+from fastapi import APIRouter, FastAPI, Body, Depends, Header, HTTPException, Query, Request, Response, status
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import delete, select, update
 from sqlalchemy.orm import Session
-from . import models, schemas, auth
-from .database import SessionLocal, engine
+from . import models, schemas, auth, search, hashing, migrations, http_cache, batch, export, feed, serialization, metrics, profiling, group_commit, replicas, sharding, fieldsets, broadcast, trending, purge
+from .pagination import encode_cursor, encode_id_cursor, decode_id_cursor, newest_first
+from . import database
+from .database import SessionLocal
+from .settings import Settings
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from datetime import timedelta
+from datetime import datetime, timedelta
 from jose import JWTError, jwt
 from sqlalchemy.exc import IntegrityError
 
-# Create the database tables
-models.Base.metadata.create_all(bind=engine)
-app = FastAPI()
+router = APIRouter()
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 
 # Dependency to get a database session
@@ -22,13 +28,109 @@ def get_db():
     finally:
         db.close()
 
-# Helper function to get the current user based on the JWT token
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+# Same, on the read-only connection pool (or the next healthy replica); for routes that never write
+def get_read_db():
+    db = replicas.read_sessionmaker()()
+    try:
+        yield db
+    finally:
+        db.close()
+
+# Dependencies for the async routes. DB_MODE picks a real AsyncSession (aiosqlite) or the
+# regular session with its blocking calls moved to the threadpool; both expose the same API.
+async def get_async_db():
+    async with database.AsyncSessionLocal() as db:
+        yield db
+
+async def get_async_read_db():
+    async with replicas.async_read_sessionmaker()() as db:
+        yield db
+
+async def get_threaded_db(db: Session = Depends(get_db)):
+    async with database.open_threaded_session(db) as threaded_db:
+        yield threaded_db
+
+async def get_threaded_read_db(db: Session = Depends(get_read_db)):
+    async with database.open_threaded_session(db) as threaded_db:
+        yield threaded_db
+
+if database.DB_MODE == "async":
+    get_session, get_read_session = get_async_db, get_async_read_db
+else:
+    get_session, get_read_session = get_threaded_db, get_threaded_read_db
+
+# For responses that outlive the request's session, like streamed exports
+def get_read_sessionmaker():
+    return replicas.async_read_sessionmaker() if database.DB_MODE == "async" else replicas.read_sessionmaker()
+
+# With sharding on, routes about one post and its comments use the post's shard, new posts go
+# to each shard in turn, and lists that span shards get a read session on every shard.
+# Without it these are the usual sessions (and None for the per-shard list).
+async def get_post_session(post_id: int, db = Depends(get_session)):
+    if sharding.shard_set is None:
+        yield db
+        return
+    async with sharding.open_session(sharding.shard_set.shard_for(post_id)) as shard_db:
+        yield shard_db
+
+async def get_post_read_session(post_id: int, db = Depends(get_read_session)):
+    if sharding.shard_set is None:
+        yield db
+        return
+    async with sharding.open_session(sharding.shard_set.shard_for(post_id), read=True) as shard_db:
+        yield shard_db
+
+async def get_new_post_session(db = Depends(get_session)):
+    if sharding.shard_set is None:
+        yield db
+        return
+    async with sharding.open_session(sharding.shard_set.next_shard()) as shard_db:
+        yield shard_db
+
+async def get_shard_read_sessions():
+    if sharding.shard_set is None:
+        yield None
+        return
+    async with AsyncExitStack() as stack:
+        yield [await stack.enter_async_context(sharding.open_session(shard, read=True)) for shard in sharding.shard_set]
+
+def get_post_read_sessionmaker(post_id: int, session_factory = Depends(get_read_sessionmaker)):
+    if sharding.shard_set is None:
+        return session_factory
+    return sharding.shard_set.shard_for(post_id).read_sessionmaker()
+
+# The group-commit writer for single-row creates, or None when GROUP_COMMIT is off
+# (not used with sharding, where each post's insert has to go to its own shard)
+def get_writer(request: Request):
+    return request.app.state.group_writer
+
+# The trending ranking, or None when TRENDING is off
+def get_trending(request: Request):
+    return request.app.state.trending_ranker
+
+# The background purger for the comments of deleted posts, or None before startup
+def get_purger(request: Request):
+    return request.app.state.comment_purger
+
+# The database holding post `post_id` and its comments
+def post_engine(post_id: int):
+    if sharding.shard_set is None:
+        return database.engine
+    return sharding.shard_set.shard_for(post_id).engine
+
+# Helper function to get the current user based on the JWT token.
+# Resolved tokens are cached until they expire; tokens carrying a "uid" claim need no user query.
+async def get_current_user(token: str = Depends(oauth2_scheme), db = Depends(get_session)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    principal = auth.principal_cache.get(token)
+    if principal is not None:
+        if auth.is_revoked(principal.family):
+            raise credentials_exception
+        return principal
     try:
         payload = jwt.decode(token, auth.SECRET_KEY, algorithms=[auth.ALGORITHM])
         username: str = payload.get("sub")
@@ -36,19 +138,68 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
             raise credentials_exception
     except JWTError:
         raise credentials_exception
-    user = db.query(models.User).filter(models.User.username == username).first()
-    if user is None:
+    family = payload.get("fam")
+    if auth.is_revoked(family):
         raise credentials_exception
-    return user
+    user_id = payload.get("uid")
+    if user_id is None:
+        user_id = await db.scalar(select(models.User.id).where(models.User.username == username))
+        if user_id is None:
+            raise credentials_exception
+    principal = auth.Principal(id=user_id, username=username, family=family)
+    auth.principal_cache.set(token, principal, expires_at=payload.get("exp"))
+    return principal
+
+# For the /admin endpoints: only users named in ADMIN_USERNAMES
+async def get_admin_user(current_user: auth.Principal = Depends(get_current_user)):
+    if current_user.username not in auth.ADMIN_USERNAMES:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin access required"
+        )
+    return current_user
+
+# The database refused a row queued for group commit
+async def write_rejected_handler(request: Request, exc: group_commit.WriteRejected):
+    return JSONResponse(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        content={"detail": str(exc)},
+    )
+
+# Password hashing is at capacity; shed the request instead of queueing it
+async def hasher_saturated_handler(request: Request, exc: hashing.HasherSaturated):
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Server busy, please retry"},
+        headers={"Retry-After": "1"},
+    )
+
+# Prometheus scrape target; see app/metrics.py for what is recorded
+@router.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def read_metrics():
+    if not metrics.METRICS_ENABLED:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+# The slowest recent statements captured by the slow-query log (SLOW_QUERY_LOG=1), slowest first
+@router.get("/admin/slow-queries")
+async def read_slow_queries(limit: int = Query(20, ge=1, le=1000), admin: auth.Principal = Depends(get_admin_user)):
+    return {
+        "enabled": profiling.SLOW_QUERY_LOG,
+        "threshold_ms": profiling.slow_queries.threshold_ms,
+        "queries": profiling.slow_queries.worst(limit),
+    }
 
-@app.get("/")
+@router.get("/")
 async def read_home():
     return {"message": "Welcome to the Blog API! Mmanage your blog posts and comments."}
 
-@app.post("/register", response_model=schemas.UserResponse)
-def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
+# Both routes give their database connection back before hashing: bcrypt takes a while, and a
+# request waiting on the hashing pool should hold neither a connection nor a threadpool thread.
+@router.post("/register", response_model=schemas.UserResponse)
+async def register(user: schemas.UserCreate, db = Depends(get_session)):
     try:
-        existing_user = db.query(models.User).filter(models.User.username == user.username).first()
+        existing_user = await db.scalar(select(models.User.id).where(models.User.username == user.username))
         if existing_user:
             print(f"User {user.username} already exists.")
             raise HTTPException(
@@ -56,101 +207,502 @@ def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
                 detail="Username already registered"
             )
 
-        hashed_password = auth.get_password_hash(user.password)
+        await db.close()
+        hashed_password = await auth.get_password_hash(user.password)
         db_user = models.User(username=user.username, hashed_password=hashed_password)
         db.add(db_user)
-        db.commit()
-        db.refresh(db_user)
+        await db.commit()
+        await db.refresh(db_user)
         return db_user
     
     except IntegrityError:
         print(f"Integrity Error: {e}")
-        db.rollback()  # Rollback transaction on error
+        await db.rollback()  # Rollback transaction on error
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Username already registered"
         )
 
-@app.post("/login", response_model=schemas.Token)
-def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    user = db.query(models.User).filter(models.User.username == form_data.username).first()
-    if not user or not auth.verify_password(form_data.password, user.hashed_password):
+@router.post("/login", response_model=schemas.Token)
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db = Depends(get_session)):
+    user = await db.scalar(select(models.User).where(models.User.username == form_data.username))
+    verified, new_hash = (False, None)
+    if user:
+        await db.close()
+        verified, new_hash = await auth.verify_and_update_password(form_data.password, user.hashed_password)
+    if not verified:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    
-    access_token = auth.create_access_token(data={"sub": user.username})
-    return {"access_token": access_token, "token_type": "bearer"}
+    # The stored hash uses an outdated bcrypt cost; swap in one made with the current cost
+    if new_hash:
+        await db.execute(update(models.User).where(models.User.id == user.id).values(hashed_password=new_hash))
+
+    family = auth.new_token_family()
+    refresh_token, refresh_row = auth.new_refresh_token(user.id, family)
+    db.add(refresh_row)
+    await db.commit()
+
+    access_token = auth.create_access_token(data=auth.token_claims(user, family))
+    return {"access_token": access_token, "token_type": "bearer", "refresh_token": refresh_token}
+
+# Marks every refresh token of a family revoked, and refuses its access tokens from now on
+async def revoke_token_family(db, family: str):
+    await db.execute(
+        update(models.RefreshToken)
+        .where(models.RefreshToken.family == family, models.RefreshToken.revoked_at.is_(None))
+        .values(revoked_at=datetime.utcnow())
+    )
+    await db.commit()
+    auth.revoke_family(family)
+
+# Trade a refresh token for a new access token and a new refresh token, without the password.
+# Each refresh token works once: presenting one that was already exchanged means it leaked,
+# so the whole family (this login's tokens) is revoked and the client has to log in again.
+@router.post("/token/refresh", response_model=schemas.Token)
+async def refresh_access_token(request: schemas.RefreshRequest, db = Depends(get_session)):
+    invalid_token = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Invalid refresh token",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    row = (await db.execute(
+        select(models.RefreshToken, models.User)
+        .join(models.User, models.User.id == models.RefreshToken.user_id)
+        .where(models.RefreshToken.token_hash == auth.hash_refresh_token(request.refresh_token))
+    )).first()
+    if row is None:
+        raise invalid_token
+    stored, user = row
+    # Read before any rollback, which expires `stored` (and an AsyncSession cannot reload it implicitly)
+    family = stored.family
+    now = datetime.utcnow()
+    if stored.revoked_at is not None or stored.expires_at <= now:
+        raise invalid_token
+    # Claim the token atomically, so two concurrent uses cannot both succeed
+    claimed = await db.execute(
+        update(models.RefreshToken)
+        .where(models.RefreshToken.id == stored.id, models.RefreshToken.rotated_at.is_(None), models.RefreshToken.revoked_at.is_(None))
+        .values(rotated_at=now)
+    )
+    if claimed.rowcount != 1:
+        await db.rollback()
+        await revoke_token_family(db, family)
+        raise invalid_token
+
+    refresh_token, refresh_row = auth.new_refresh_token(user.id, family)
+    db.add(refresh_row)
+    await db.commit()
+    access_token = auth.create_access_token(data=auth.token_claims(user, family))
+    return {"access_token": access_token, "token_type": "bearer", "refresh_token": refresh_token}
+
+# Log out: revoke the refresh token's family, and with it the access tokens issued from it
+@router.post("/token/revoke", status_code=status.HTTP_204_NO_CONTENT)
+async def revoke_refresh_token(request: schemas.RefreshRequest, db = Depends(get_session)):
+    family = await db.scalar(
+        select(models.RefreshToken.family)
+        .where(models.RefreshToken.token_hash == auth.hash_refresh_token(request.refresh_token))
+    )
+    if family is not None:
+        await revoke_token_family(db, family)
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
 
 # Create a blog post
-@app.post("/posts", response_model=schemas.Post)
-def create_post(post: schemas.PostCreate, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
-    db_post = models.Post(**post.dict(), author_id=current_user.id)
+@router.post("/posts", response_model=schemas.Post)
+async def create_post(post: schemas.PostCreate, db = Depends(get_new_post_session), current_user: auth.Principal = Depends(get_current_user), writer = Depends(get_writer), ranker = Depends(get_trending)):
+    if writer is not None:
+        values = {**post.model_dump(), "author_id": current_user.id}
+        row = await writer.insert(models.Post, values)
+        created = {**values, "id": row.id, "timestamp": row.timestamp, "comment_count": 0}
+        publish_post(created, ranker)
+        return created
+    db_post = models.Post(**post.model_dump(), author_id=current_user.id)
+    await sharding.assign_ids(db, models.Post, [db_post])
     db.add(db_post)
-    db.commit()
-    db.refresh(db_post)
+    await db.commit()
+    await db.refresh(db_post)
+    publish_post({field: getattr(db_post, field) for field in fieldsets.POST_FIELDS}, ranker)
     return db_post
 
-# Get all blog posts
-@app.get("/posts", response_model=List[schemas.Post])
-def get_posts(skip: int = 0, limit: int = 10, db: Session = Depends(get_db)):
-    return db.query(models.Post).offset(skip).limit(limit).all()
+# Tells the event streams and the trending ranking about new rows
+def publish_post(post, ranker):
+    broadcast.broadcaster.publish(broadcast.POSTS_TOPIC, post)
+    if ranker is not None:
+        ranker.record(trending.POSTS, post["id"], post["id"], post["timestamp"])
+
+def publish_comment(comment, ranker):
+    broadcast.broadcaster.publish(broadcast.comments_topic(comment["post_id"]), comment)
+    if ranker is not None:
+        ranker.record(trending.COMMENTS, comment["id"], comment["post_id"], comment["timestamp"])
+
+def check_batch_size(items):
+    if len(items) > batch.BATCH_MAX_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Batch exceeds {batch.BATCH_MAX_SIZE} items"
+        )
+
+# Create many blog posts in one transaction. Each item is validated and reported on its own;
+# valid items are inserted with a single executemany even if others fail.
+@router.post("/posts/batch", response_model=schemas.BatchResult)
+async def create_posts_batch(items: List[Any] = Body(...), db = Depends(get_new_post_session), current_user: auth.Principal = Depends(get_current_user), ranker = Depends(get_trending)):
+    check_batch_size(items)
+    valid, errors = batch.validate_items(items, schemas.PostCreate)
+    rows = [(index, {**post.model_dump(), "author_id": current_user.id}) for index, post in valid]
+    await sharding.assign_ids(db, models.Post, [values for _, values in rows])
+    created, failed = await db.run_sync(batch.insert_rows, models.Post, rows)
+    await db.commit()
+    for post in created_rows(rows, created, comment_count=0):
+        publish_post(post, ranker)
+    return batch.results(len(items), created, {**errors, **failed})
+
+# The rows a batch insert created, with their ids and timestamps
+def created_rows(rows, created, **extra):
+    return [{**values, "id": created[index].id, "timestamp": created[index].timestamp, **extra} for index, values in rows if index in created]
+
+# Sends list items as they are when fast serialization is on, otherwise through the response model
+def list_response(response: Response, items, headers=None):
+    if serialization.FAST_SERIALIZATION:
+        return serialization.json_response(items, headers)
+    response.headers.update(headers or {})
+    return items
+
+# List endpoints select just these columns and build responses from the row tuples
+# (post listings narrow them further with `fields=`, see app/fieldsets.py)
+COMMENT_FIELDS = list(schemas.Comment.model_fields)
+COMMENT_COLUMNS = serialization.columns_for(models.Comment, schemas.Comment)
+
+# Get all blog posts, newest first.
+# Pass the X-Next-Cursor header from the previous page as `cursor` to page with a keyset
+# seek on (timestamp, id), so deep pages cost the same as the first one. `skip` still works.
+# `fields=id,title,excerpt` returns only those fields and never reads the rest from the database.
+@router.get("/posts", response_model=List[Union[schemas.Post, schemas.PostSummary]], response_model_exclude_unset=True)
+async def get_posts(request: Request, response: Response, skip: int = 0, limit: int = 10, cursor: Optional[str] = None, fields: Optional[str] = None, excerpt_length: int = Query(fieldsets.EXCERPT_LENGTH, ge=1, le=fieldsets.MAX_EXCERPT_LENGTH), db = Depends(get_read_session), shard_dbs = Depends(get_shard_read_sessions)):
+    fields = fieldsets.parse_fields(fields)
+    columns = select(*fieldsets.post_columns(fields, excerpt_length), models.Post.version, models.Post.comments_version, models.Post.updated_at)
+    if shard_dbs is None:
+        rows = (await db.execute(newest_first(columns, models.Post, cursor, skip).limit(limit))).all()
+    else:
+        # Every shard's first skip + limit rows, merged newest first
+        skip = skip if cursor is None else 0
+        query = newest_first(columns, models.Post, cursor).limit(skip + limit)
+        results = await sharding.fan_out(shard_dbs, lambda shard_db: shard_db.execute(query))
+        rows = sharding.merge([result.all() for result in results], key=lambda row: (row.timestamp, row.id), reverse=True, skip=skip, limit=limit)
+
+    # ETag only: a deleted post leaves the newest timestamp on the page as it was, so
+    # If-Modified-Since would answer 304 for a page that lost a row
+    etag = http_cache.make_etag("posts", fields, excerpt_length, [(row.id, row.timestamp, row.version, row.comments_version) for row in rows])
+    headers = http_cache.cache_headers(etag)
+    if limit > 0 and len(rows) == limit:
+        headers["X-Next-Cursor"] = encode_cursor(rows[-1].timestamp, rows[-1].id)
+    if http_cache.is_not_modified(request, etag):
+        return http_cache.not_modified(headers)
+    return list_response(response, serialization.rows_to_dicts(rows, fields), headers)
+
+# Home page feed: newest posts with their author and latest comments, in a constant number of
+# queries. Pages with X-Next-Cursor like GET /posts.
+@router.get("/feed", response_model=List[schemas.FeedPost])
+async def get_feed(response: Response, limit: int = Query(10, ge=1, le=100), comments: int = Query(3, ge=0, le=20), cursor: Optional[str] = None, db = Depends(get_read_session), shard_dbs = Depends(get_shard_read_sessions)):
+    if shard_dbs is None:
+        posts = await feed.load_feed(db, cursor=cursor, limit=limit, comments_per_post=comments)
+    else:
+        posts = await feed.load_sharded_feed(shard_dbs, db, cursor=cursor, limit=limit, comments_per_post=comments)
+    headers = {}
+    if len(posts) == limit:
+        headers["X-Next-Cursor"] = encode_cursor(posts[-1]["timestamp"], posts[-1]["id"])
+    return list_response(response, posts, headers)
+
+# The posts with the most recent activity (new comments, and being new), scored with
+# exponential decay over the last `window_hours`. Served from memory; see app/trending.py.
+@router.get("/posts/trending", response_model=List[schemas.TrendingPost])
+async def get_trending_posts(response: Response, limit: int = Query(10, ge=1, le=100), window_hours: float = Query(24, gt=0, le=trending.TRENDING_MAX_WINDOW_HOURS), ranker = Depends(get_trending)):
+    if ranker is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    return list_response(response, await run_in_threadpool(ranker.top, limit, window_hours))
+
+# Server-sent events for `subscription`, which the response gives up when it ends. Routes
+# subscribe before reading the backlog, so nothing published meanwhile is missed, and give the
+# subscription up themselves if they fail before returning the response.
+def event_stream(subscription, event_type, backlog, live):
+    events = broadcast.broadcaster.stream(subscription, event_type, backlog, live=live)
+    return broadcast.EventStreamResponse(broadcast.broadcaster, subscription, events)
+
+# New posts as server-sent events. A client reconnecting with Last-Event-ID (a post id) first
+# gets the posts created since, up to SSE_BACKLOG_LIMIT; with more, the stream ends after them
+# and the next reconnect continues from there. With sharding, ids only increase per shard, so
+# the catch-up can miss posts from a shard whose ids lag behind.
+@router.get("/posts/stream")
+async def stream_posts(last_event_id: Optional[int] = Header(None), db = Depends(get_read_session), shard_dbs = Depends(get_shard_read_sessions)):
+    subscription = broadcast.broadcaster.subscribe(broadcast.POSTS_TOPIC)
+    try:
+        backlog = []
+        if last_event_id is not None:
+            query = (
+                select(*fieldsets.post_columns(fieldsets.POST_FIELDS))
+                .where(models.Post.id > last_event_id)
+                .order_by(models.Post.id)
+                .limit(broadcast.SSE_BACKLOG_LIMIT)
+            )
+            if shard_dbs is None:
+                rows = (await db.execute(query)).all()
+            else:
+                results = await sharding.fan_out(shard_dbs, lambda shard_db: shard_db.execute(query))
+                rows = sharding.merge([result.all() for result in results], key=lambda row: row.id, limit=broadcast.SSE_BACKLOG_LIMIT)
+            backlog = serialization.rows_to_dicts(rows, fieldsets.POST_FIELDS)
+        return event_stream(subscription, "post", backlog, live=len(backlog) < broadcast.SSE_BACKLOG_LIMIT)
+    except BaseException:
+        broadcast.broadcaster.unsubscribe(subscription)
+        raise
 
 # Get a single blog post by ID
-@app.get("/posts/{post_id}", response_model=schemas.Post)
-def get_post(post_id: int, db: Session = Depends(get_db)):
-    post = db.query(models.Post).filter(models.Post.id == post_id).first()
+@router.get("/posts/{post_id}", response_model=schemas.Post)
+async def get_post(post_id: int, request: Request, response: Response, db = Depends(get_post_read_session)):
+    post = await db.get(models.Post, post_id)
     if post is None:
         raise HTTPException(status_code=404, detail="Post not found")
+    # The creation timestamp tells a post from an earlier one that had its id
+    etag = http_cache.make_etag("post", post.id, post.timestamp, post.version, post.comments_version)
+    headers = http_cache.cache_headers(etag, post.last_modified)
+    if http_cache.is_not_modified(request, etag, post.last_modified):
+        return http_cache.not_modified(headers)
+    response.headers.update(headers)
     return post
 
 # Update a blog post (only by the author)
-@app.put("/posts/{post_id}", response_model=schemas.Post)
-def update_post(post_id: int, post: schemas.PostUpdate, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
-    db_post = db.query(models.Post).filter(models.Post.id == post_id).first()
+@router.put("/posts/{post_id}", response_model=schemas.Post)
+async def update_post(post_id: int, post: schemas.PostUpdate, db = Depends(get_post_session), current_user: auth.Principal = Depends(get_current_user)):
+    db_post = await db.get(models.Post, post_id)
     if db_post is None:
         raise HTTPException(status_code=404, detail="Post not found")
     if db_post.author_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized to update this post")
     db_post.title = post.title
     db_post.content = post.content
-    db.commit()
-    db.refresh(db_post)
+    db_post.version = models.Post.version + 1
+    db_post.updated_at = datetime.utcnow()
+    await db.commit()
+    await db.refresh(db_post)
     return db_post
 
-# Delete a blog post (only by the author)
-@app.delete("/posts/{post_id}", response_model=schemas.Post)
-def delete_post(post_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
-    db_post = db.query(models.Post).filter(models.Post.id == post_id).first()
+# Delete a blog post (only by the author) and its comments. Small threads go in the same
+# transaction; big ones are purged in the background after the post is gone (see app/purge.py).
+@router.delete("/posts/{post_id}", response_model=schemas.Post)
+async def delete_post(post_id: int, db = Depends(get_post_session), current_user: auth.Principal = Depends(get_current_user), ranker = Depends(get_trending), purger = Depends(get_purger)):
+    db_post = await db.get(models.Post, post_id)
     if db_post is None:
         raise HTTPException(status_code=404, detail="Post not found")
     if db_post.author_id != current_user.id:
         raise HTTPException(status_code=403, detail="Not authorized to delete this post")
-    db.delete(db_post)
-    db.commit()
+    in_background = purger is not None and db_post.comment_count > purge.PURGE_INLINE_COMMENTS
+    if not in_background:
+        await db.execute(delete(models.Comment).where(models.Comment.post_id == post_id).execution_options(synchronize_session=False))
+    await db.execute(delete(models.Post).where(models.Post.id == post_id))
+    await db.commit()
+    if in_background:
+        purger.submit(post_engine(post_id), post_id)
+    if ranker is not None:
+        ranker.forget(post_id)
     return db_post
 
+# Counts new comments on a post and invalidates its cached comment listings, atomically in SQL
+# and in the same transaction as the insert
+def record_new_comments(post_id: int, added: int = 1):
+    return update(models.Post).where(models.Post.id == post_id).values(
+        comment_count=models.Post.comment_count + added,
+        comments_version=models.Post.comments_version + 1,
+        comments_updated_at=datetime.utcnow(),
+    )
+
 # Add a comment to a blog post
-@app.post("/posts/{post_id}/comments", response_model=schemas.Comment)
-def create_comment(post_id: int, comment: schemas.CommentCreate, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
-    db_post = db.query(models.Post).filter(models.Post.id == post_id).first()
+@router.post("/posts/{post_id}/comments", response_model=schemas.Comment)
+async def create_comment(post_id: int, comment: schemas.CommentCreate, db = Depends(get_post_session), current_user: auth.Principal = Depends(get_current_user), writer = Depends(get_writer), ranker = Depends(get_trending)):
+    db_post = await db.get(models.Post, post_id)
     if db_post is None:
         raise HTTPException(status_code=404, detail="Post not found")
-    db_comment = models.Comment(**comment.dict(), author_id=current_user.id, post_id=post_id)
+    if writer is not None:
+        # Give the connection back before waiting on the writer, which commits with its own
+        await db.close()
+        values = {**comment.model_dump(), "author_id": current_user.id, "post_id": post_id}
+        row = await writer.insert(models.Comment, values, follow_up=record_new_comments(post_id))
+        created = {**values, "id": row.id, "timestamp": row.timestamp}
+        publish_comment(created, ranker)
+        return created
+    db_comment = models.Comment(**comment.model_dump(), author_id=current_user.id, post_id=post_id)
+    await sharding.assign_ids(db, models.Comment, [db_comment])
     db.add(db_comment)
-    db.commit()
-    db.refresh(db_comment)
+    await db.execute(record_new_comments(post_id))
+    await db.commit()
+    await db.refresh(db_comment)
+    publish_comment({field: getattr(db_comment, field) for field in COMMENT_FIELDS}, ranker)
     return db_comment
 
-# List all comments for a blog post
-@app.get("/posts/{post_id}/comments", response_model=List[schemas.Comment])
-def get_comments(post_id: int, db: Session = Depends(get_db)):
-    return db.query(models.Comment).filter(models.Comment.post_id == post_id).all()
+# Add many comments to a blog post in one transaction, reporting on each item
+@router.post("/posts/{post_id}/comments/batch", response_model=schemas.BatchResult)
+async def create_comments_batch(post_id: int, items: List[Any] = Body(...), db = Depends(get_post_session), current_user: auth.Principal = Depends(get_current_user), ranker = Depends(get_trending)):
+    check_batch_size(items)
+    db_post = await db.get(models.Post, post_id)
+    if db_post is None:
+        raise HTTPException(status_code=404, detail="Post not found")
+    valid, errors = batch.validate_items(items, schemas.CommentCreate)
+    rows = [(index, {**comment.model_dump(), "author_id": current_user.id, "post_id": post_id}) for index, comment in valid]
+    await sharding.assign_ids(db, models.Comment, [values for _, values in rows])
+    created, failed = await db.run_sync(batch.insert_rows, models.Comment, rows)
+    if created:
+        await db.execute(record_new_comments(post_id, len(created)))
+    await db.commit()
+    for comment in created_rows(rows, created):
+        publish_comment(comment, ranker)
+    return batch.results(len(items), created, {**errors, **failed})
+
+# List the comments of a blog post, oldest first, `limit` at a time.
+# Pass the X-Next-Cursor header back as `cursor` for the next page.
+# The post's comment version is checked first, so a revalidation hit never reads the comments.
+@router.get("/posts/{post_id}/comments", response_model=List[schemas.Comment])
+async def get_comments(post_id: int, request: Request, response: Response, limit: int = Query(100, ge=1, le=1000), cursor: Optional[str] = None, db = Depends(get_post_read_session)):
+    after_id = decode_id_cursor(cursor) if cursor is not None else 0
+    versions = (await db.execute(
+        select(models.Post.comments_version, models.Post.comments_updated_at, models.Post.timestamp)
+        .where(models.Post.id == post_id)
+    )).first()
+    if versions is None:
+        # No such post; a deleted post's comments may still be waiting for the purger
+        return list_response(response, [])
+    etag = http_cache.make_etag("comments", post_id, versions.timestamp, versions.comments_version)
+    last_modified = versions.comments_updated_at or versions.timestamp
+    headers = http_cache.cache_headers(etag, last_modified)
+    if http_cache.is_not_modified(request, etag, last_modified):
+        return http_cache.not_modified(headers)
+    rows = (await db.execute(
+        select(*COMMENT_COLUMNS)
+        .where(models.Comment.post_id == post_id, models.Comment.id > after_id)
+        .order_by(models.Comment.id)
+        .limit(limit)
+    )).all()
+    if len(rows) == limit:
+        headers["X-Next-Cursor"] = encode_id_cursor(rows[-1].id)
+    return list_response(response, serialization.rows_to_dicts(rows, COMMENT_FIELDS), headers)
+
+# New comments on a post as server-sent events, instead of polling the comment list.
+# Reconnecting with Last-Event-ID (a comment id) replays the comments since, as GET /posts/stream does.
+@router.get("/posts/{post_id}/comments/stream")
+async def stream_comments(post_id: int, last_event_id: Optional[int] = Header(None), db = Depends(get_post_read_session)):
+    if await db.scalar(select(models.Post.id).where(models.Post.id == post_id)) is None:
+        raise HTTPException(status_code=404, detail="Post not found")
+    subscription = broadcast.broadcaster.subscribe(broadcast.comments_topic(post_id))
+    try:
+        backlog = []
+        if last_event_id is not None:
+            rows = (await db.execute(
+                select(*COMMENT_COLUMNS)
+                .where(models.Comment.post_id == post_id, models.Comment.id > last_event_id)
+                .order_by(models.Comment.id)
+                .limit(broadcast.SSE_BACKLOG_LIMIT)
+            )).all()
+            backlog = serialization.rows_to_dicts(rows, COMMENT_FIELDS)
+        return event_stream(subscription, "comment", backlog, live=len(backlog) < broadcast.SSE_BACKLOG_LIMIT)
+    except BaseException:
+        broadcast.broadcaster.unsubscribe(subscription)
+        raise
+
+# Full-text search over titles and content, best matches first
+@router.get("/search", response_model=List[Union[schemas.Post, schemas.PostSummary]], response_model_exclude_unset=True)
+async def search_posts(response: Response, query: str, skip: int = 0, limit: int = 10, fields: Optional[str] = None, excerpt_length: int = Query(fieldsets.EXCERPT_LENGTH, ge=1, le=fieldsets.MAX_EXCERPT_LENGTH), db = Depends(get_read_session), shard_dbs = Depends(get_shard_read_sessions)):
+    fields = fieldsets.parse_fields(fields)
+    columns = fieldsets.post_columns(fields, excerpt_length)
+    if shard_dbs is None:
+        rows = await search.search_posts(db, query, skip=skip, limit=limit, columns=columns)
+    else:
+        results = await sharding.fan_out(shard_dbs, lambda shard_db: search.search_posts(shard_db, query, skip=0, limit=skip + limit, columns=columns))
+        rows = sharding.merge(results, key=lambda row: (row.score, -row.id), skip=skip, limit=limit)
+    return list_response(response, serialization.rows_to_dicts(rows, fields))
+
+# Export every post as newline-delimited JSON, oldest first, streamed straight off a cursor.
+# `since` limits it to posts created after that time, for incremental exports.
+@router.get("/export/posts")
+async def export_posts(since: Optional[datetime] = None, session_factory = Depends(get_read_sessionmaker)):
+    columns = [models.Post.id, models.Post.title, models.Post.content, models.Post.timestamp, models.Post.author_id]
+    statement = select(*columns).order_by(models.Post.timestamp, models.Post.id)
+    if since is not None:
+        statement = statement.where(models.Post.timestamp > since)
+    if sharding.shard_set is not None:
+        factories = [shard.read_sessionmaker() for shard in sharding.shard_set]
+        stream = export.stream_ndjson_merged(factories, statement, key=lambda row: (row["timestamp"], row["id"]))
+        return StreamingResponse(stream, media_type="application/x-ndjson")
+    return StreamingResponse(export.stream_ndjson(session_factory, statement), media_type="application/x-ndjson")
+
+# Export the comments of one post as newline-delimited JSON, oldest first
+@router.get("/export/posts/{post_id}/comments")
+async def export_comments(post_id: int, since: Optional[datetime] = None, db = Depends(get_post_read_session), session_factory = Depends(get_post_read_sessionmaker)):
+    if await db.scalar(select(models.Post.id).where(models.Post.id == post_id)) is None:
+        raise HTTPException(status_code=404, detail="Post not found")
+    columns = [models.Comment.id, models.Comment.content, models.Comment.timestamp, models.Comment.author_id, models.Comment.post_id]
+    statement = select(*columns).where(models.Comment.post_id == post_id).order_by(models.Comment.id)
+    if since is not None:
+        statement = statement.where(models.Comment.timestamp > since)
+    return StreamingResponse(export.stream_ndjson(session_factory, statement), media_type="application/x-ndjson")
+
+# Everything the app holds open: the databases, their schema when `migrate_on_startup` is set,
+# and the background workers. Runs in each worker process at startup, after any fork, so
+# importing the app (e.g. in a gunicorn --preload master) opens no connections and no threads.
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    settings = app.state.settings
+    database.open_engines(settings.database_url)
+    replicas.open_replicas(settings.replica_urls)
+    shard_set = sharding.open_shards(settings.shard_urls)
+    if settings.migrate_on_startup:
+        migrations.prepare(database.engine)
+        if shard_set is not None:
+            shard_set.setup()
+    if settings.group_commit and shard_set is None:
+        app.state.group_writer = group_commit.GroupCommitWriter(SessionLocal)
+    app.state.comment_purger = purge.CommentPurger()
+    if settings.trending:
+        # Read back from the posts' databases (or its snapshot)
+        if shard_set is None:
+            sources = [("primary", database.engine)]
+        else:
+            sources = [(f"shard {shard.index}", shard.engine) for shard in shard_set]
+        app.state.trending_ranker = trending.TrendingRanker(sources)
+        app.state.trending_ranker.start()
+    try:
+        yield
+    finally:
+        if app.state.group_writer is not None:
+            app.state.group_writer.shutdown()
+            app.state.group_writer = None
+        if app.state.trending_ranker is not None:
+            app.state.trending_ranker.stop()
+            app.state.trending_ranker = None
+        app.state.comment_purger.shutdown()
+        app.state.comment_purger = None
+        await replicas.close_replicas()
+        await sharding.close_shards()
+        await database.dispose_engines()
+
+def create_app(settings: Optional[Settings] = None):
+    app = FastAPI(
+        default_response_class=serialization.DefaultResponse,
+        lifespan=lifespan,
+        exception_handlers={
+            group_commit.WriteRejected: write_rejected_handler,
+            hashing.HasherSaturated: hasher_saturated_handler,
+        },
+    )
+    app.state.settings = settings or Settings()
+    app.state.group_writer = None
+    app.state.trending_ranker = None
+    app.state.comment_purger = None
+    app.include_router(router)
+    if serialization.GZIP_MINIMUM_SIZE > 0:
+        app.add_middleware(GZipMiddleware, minimum_size=serialization.GZIP_MINIMUM_SIZE, compresslevel=serialization.GZIP_LEVEL)
+    if metrics.METRICS_ENABLED:
+        app.add_middleware(metrics.MetricsMiddleware)
+    if profiling.SLOW_QUERY_LOG:
+        app.add_middleware(profiling.RouteContextMiddleware)
+    return app
 
-@app.get("/search", response_model=List[schemas.Post])
-def search_posts(query: str, db: Session = Depends(get_db)):
-    return db.query(models.Post).filter(
-        models.Post.title.contains(query) | models.Post.content.contains(query)
-    ).all()
\ No newline at end of file
+# For `uvicorn app.main:app` and `gunicorn app.main:app`; settings come from the environment
+app = create_app()
@@ -0,0 +1,114 @@
+import time
+from sqlalchemy import text
+from . import compression
+
+# Offline-safe repair jobs. Each works through the table in id ranges with one short
+# transaction per batch, so it can run against a live database.
+
+COUNT_COMMENTS = "(SELECT count(*) FROM comments WHERE comments.post_id = posts.id)"
+ORPHANED_COMMENT = "(comments.post_id IS NULL OR NOT EXISTS (SELECT 1 FROM posts WHERE posts.id = comments.post_id))"
+
+# Recomputes posts.comment_count from the comments table and returns how many posts were off.
+# Corrected posts also get a new comments version and date so cached responses are revalidated.
+def recount_comments(engine, batch_size: int = 1000):
+    fixed, last_id = 0, 0
+    while True:
+        with engine.begin() as connection:
+            upper = connection.execute(
+                text("SELECT max(id) FROM (SELECT id FROM posts WHERE id > :last_id ORDER BY id LIMIT :batch_size)"),
+                {"last_id": last_id, "batch_size": batch_size},
+            ).scalar()
+            if upper is None:
+                return fixed
+            fixed += connection.execute(text(
+                f"UPDATE posts SET comment_count = {COUNT_COMMENTS}, comments_version = comments_version + 1, "
+                f"comments_updated_at = datetime('now') "
+                f"WHERE id > :last_id AND id <= :upper AND comment_count != {COUNT_COMMENTS}"
+            ), {"last_id": last_id, "upper": upper}).rowcount
+        last_id = upper
+
+# Rewrites post and comment bodies in the storage format `method` ("zlib", "zstd", or "" for
+# plain text) selects, from any format, and returns how many rows changed. The text itself
+# is unchanged, so cached responses stay valid.
+def recompress_content(engine, method: str, min_bytes: int = None, batch_size: int = 1000):
+    min_bytes = compression.CONTENT_COMPRESSION_MIN_BYTES if min_bytes is None else min_bytes
+    target = compression.MARKERS.get(method)
+    changed = 0
+    for table in ("posts", "comments"):
+        last_id = 0
+        while True:
+            with engine.begin() as connection:
+                rows = connection.execute(
+                    text(f"SELECT id, content FROM {table} WHERE id > :last_id ORDER BY id LIMIT :batch_size"),
+                    {"last_id": last_id, "batch_size": batch_size},
+                ).all()
+                if not rows:
+                    break
+                updates = []
+                for row_id, stored in rows:
+                    if compression.is_compressed(stored) and bytes(stored[:1]) == target:
+                        continue
+                    packed = compression.compress(compression.decompress(stored), method, min_bytes)
+                    if packed != stored:
+                        updates.append({"id": row_id, "content": packed})
+                if updates:
+                    connection.execute(text(f"UPDATE {table} SET content = :content WHERE id = :id"), updates)
+                changed += len(updates)
+            last_id = rows[-1][0]
+    return changed
+
+# Deletes the comments of post `post_id`, `batch_size` at a time, sleeping `pause` seconds
+# between batches so other writers get the lock. Stops early once `stop` (a threading.Event)
+# is set. Returns how many comments were deleted.
+def purge_comments(engine, post_id: int, batch_size: int = 1000, pause: float = 0.0, stop=None):
+    deleted = 0
+    while stop is None or not stop.is_set():
+        with engine.begin() as connection:
+            count = connection.execute(
+                text("DELETE FROM comments WHERE id IN (SELECT id FROM comments WHERE post_id = :post_id LIMIT :batch_size)"),
+                {"post_id": post_id, "batch_size": batch_size},
+            ).rowcount
+        deleted += count
+        if count < batch_size:
+            break
+        if pause:
+            time.sleep(pause)
+    return deleted
+
+# Deletes comments whose post no longer exists (left by deletes from before posts took their
+# comments with them, or by a background purge cut short) and returns how many there were
+def delete_orphan_comments(engine, batch_size: int = 1000):
+    deleted, last_id = 0, 0
+    while True:
+        with engine.begin() as connection:
+            upper = connection.execute(
+                text("SELECT max(id) FROM (SELECT id FROM comments WHERE id > :last_id ORDER BY id LIMIT :batch_size)"),
+                {"last_id": last_id, "batch_size": batch_size},
+            ).scalar()
+            if upper is None:
+                return deleted
+            deleted += connection.execute(text(
+                f"DELETE FROM comments WHERE id > :last_id AND id <= :upper AND {ORPHANED_COMMENT}"
+            ), {"last_id": last_id, "upper": upper}).rowcount
+        last_id = upper
+
+def auto_vacuum_mode(engine):
+    with engine.connect() as connection:
+        return {0: "none", 1: "full", 2: "incremental"}[connection.exec_driver_sql("PRAGMA auto_vacuum").scalar()]
+
+# Returns up to `pages` free pages (all of them when 0) to the file system and returns how many.
+# Needs auto_vacuum=INCREMENTAL; see enable_incremental_vacuum().
+def incremental_vacuum(engine, pages: int = 0):
+    with engine.connect() as connection:
+        before = connection.exec_driver_sql("PRAGMA freelist_count").scalar()
+        # The pragma frees one page per step, and a plain execute() steps it once;
+        # executescript() runs it to the end
+        connection.connection.driver_connection.executescript(f"PRAGMA incremental_vacuum({pages});")
+        return before - connection.exec_driver_sql("PRAGMA freelist_count").scalar()
+
+# Switches an existing database to auto_vacuum=INCREMENTAL. Takes a full VACUUM, which
+# rewrites the whole file and holds the write lock while it runs: do it once, off-peak.
+def enable_incremental_vacuum(engine):
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        connection.exec_driver_sql("PRAGMA auto_vacuum=INCREMENTAL")
+        connection.exec_driver_sql("VACUUM")
@@ -0,0 +1,265 @@
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from sqlalchemy import event, exc
+
+# In-process metrics in the Prometheus text format, served at GET /metrics.
+# Each worker process keeps its own numbers; scrape every worker, or run one per container.
+# Recording is a lock and a few additions per observation, cheap enough to leave on.
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels):
+        return self._values.get(labels, 0)
+
+    def render(self):
+        with self._lock:
+            items = list(self._values.items())
+        return self.header() + [f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}" for labels, value in items]
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    # Per label set: [count in each bucket (non-cumulative, last is +Inf), sum, count]
+    def observe(self, value, *labels):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(labels)
+            if series is None:
+                series = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def count(self, *labels):
+        series = self._values.get(labels)
+        return series[2] if series else 0
+
+    def sum(self, *labels):
+        series = self._values.get(labels)
+        return series[1] if series else 0.0
+
+    def render(self):
+        with self._lock:
+            items = [(labels, list(counts), total, count) for labels, (counts, total, count) in self._values.items()]
+        lines = self.header()
+        for labels, counts, total, count in items:
+            cumulative = 0
+            for bound, bucket in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket
+                le = f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {count}")
+        return lines
+
+# Hit, miss and eviction counts and sizes of in-process caches (app/cache.py's TTLCache),
+# read from each cache's stats() at scrape time
+class CacheStats:
+    def __init__(self):
+        self.caches = {}
+
+    def add(self, name, cache):
+        self.caches[name] = cache
+
+    def render(self):
+        stats = [(name, cache.stats()) for name, cache in self.caches.items()]
+        lines = [
+            "# HELP cache_lookups_total Cache lookups, by cache and result.",
+            "# TYPE cache_lookups_total counter",
+        ]
+        for name, values in stats:
+            lines.append(f'cache_lookups_total{_labels(("cache", "result"), (name, "hit"))} {values["hits"]}')
+            lines.append(f'cache_lookups_total{_labels(("cache", "result"), (name, "miss"))} {values["misses"]}')
+        lines += ["# HELP cache_evictions_total Entries dropped to make room.", "# TYPE cache_evictions_total counter"]
+        lines += [f'cache_evictions_total{_labels(("cache",), (name,))} {values["evictions"]}' for name, values in stats]
+        lines += ["# HELP cache_entries Entries currently cached.", "# TYPE cache_entries gauge"]
+        lines += [f'cache_entries{_labels(("cache",), (name,))} {values["size"]}' for name, values in stats]
+        return lines
+
+    # The counts belong to the caches
+    def clear(self):
+        pass
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def clear(self):
+        for metric in self.metrics:
+            metric.clear()
+
+registry = Registry()
+
+REQUESTS = registry.register(Counter(
+    "http_requests_total", "Requests handled, by route template and status code.", ("method", "route", "status")))
+REQUEST_SECONDS = registry.register(Histogram(
+    "http_request_duration_seconds", "Time to handle a request, including streaming the body.", ("method", "route")))
+IN_FLIGHT = registry.register(Gauge(
+    "http_requests_in_flight", "Requests currently being handled.", ("method", "route")))
+REQUEST_QUERIES = registry.register(Histogram(
+    "http_request_db_queries", "Database queries run per request.", ("method", "route"), buckets=COUNT_BUCKETS))
+REQUEST_QUERY_SECONDS = registry.register(Histogram(
+    "http_request_db_seconds", "Time spent in database queries per request.", ("method", "route")))
+QUERY_SECONDS = registry.register(Histogram(
+    "db_query_duration_seconds", "Time to execute a single database query.", ("pool",), buckets=QUERY_BUCKETS))
+POOL_WAIT_SECONDS = registry.register(Histogram(
+    "db_pool_checkout_wait_seconds", "Time spent waiting for a connection from the pool.", ("pool",), buckets=QUERY_BUCKETS))
+POOL_TIMEOUTS = registry.register(Counter(
+    "db_pool_checkout_timeouts_total", "Pool checkouts that gave up after DB_POOL_TIMEOUT.", ("pool",)))
+HASH_SECONDS = registry.register(Histogram(
+    "password_hash_duration_seconds", "Time spent hashing or verifying a password.", ("operation",)))
+HASH_REJECTED = registry.register(Counter(
+    "password_hash_rejected_total", "Hash requests refused because the hashing pool was full."))
+CACHES = registry.register(CacheStats())
+
+# Query count and time of the current request; a mutable list so that queries run on
+# threadpool workers (which get a copy of the context) still add to it
+_request_queries = ContextVar("request_queries", default=None)
+
+UNMATCHED_ROUTE = "<unmatched>"
+
+# The route template for a request, e.g. "/posts/{post_id}", so label sets stay bounded.
+# Only the compiled path patterns are tried; a full Route.matches() costs several times as much.
+def route_template(app, scope):
+    path, root_path = scope["path"], scope.get("root_path", "")
+    if root_path and path.startswith(root_path):
+        path = path[len(root_path):]
+    for route in app.router.routes:
+        pattern = getattr(route, "path_regex", None)
+        if pattern is not None and pattern.match(path):
+            return route.path
+    return UNMATCHED_ROUTE
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        method, route = scope["method"], route_template(scope["app"], scope)
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        queries = [0, 0.0]
+        token = _request_queries.set(queries)
+        IN_FLIGHT.inc(method, route)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            IN_FLIGHT.dec(method, route)
+            _request_queries.reset(token)
+            REQUESTS.inc(method, route, str(status_code))
+            REQUEST_SECONDS.observe(elapsed, method, route)
+            REQUEST_QUERIES.observe(queries[0], method, route)
+            REQUEST_QUERY_SECONDS.observe(queries[1], method, route)
+
+# Times every query run through a (sync) engine; async engines pass their sync_engine
+def instrument_engine(engine, pool_name):
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        context._metrics_started = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - context._metrics_started
+        QUERY_SECONDS.observe(elapsed, pool_name)
+        queries = _request_queries.get()
+        if queries is not None:
+            queries[0] += 1
+            queries[1] += elapsed
+
+_timed_pools = {}
+
+# A subclass of `pool_class` that records how long each checkout waits for a connection.
+# Classes are cached by name, since the pool is recreated from its class on dispose().
+def timed_pool(pool_class, pool_name):
+    key = (pool_class, pool_name)
+    if key not in _timed_pools:
+        def _do_get(self):
+            started = time.perf_counter()
+            try:
+                return pool_class._do_get(self)
+            except exc.TimeoutError:
+                POOL_TIMEOUTS.inc(pool_name)
+                raise
+            finally:
+                POOL_WAIT_SECONDS.observe(time.perf_counter() - started, pool_name)
+
+        _timed_pools[key] = type(f"Timed{pool_class.__name__}", (pool_class,), {"_do_get": _do_get})
+    return _timed_pools[key]
+
+def render():
+    return registry.render()
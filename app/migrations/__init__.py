@@ -0,0 +1,85 @@
+import importlib
+import pkgutil
+from datetime import datetime
+from sqlalchemy import inspect, text
+from .. import models, search
+
+# A small built-in migration runner.
+# Each module in this package named vNNNN_<name>.py defines `upgrade(connection)`; modules
+# run once each, in version order, and are recorded in the schema_migrations table.
+# Migrations must be safe on a live, populated database: add columns and indexes in place,
+# never rebuild tables (v0005 is the exception, see there).
+
+MIGRATIONS_TABLE = "schema_migrations"
+
+def discover():
+    found = []
+    for module in pkgutil.iter_modules(__path__):
+        if module.name.startswith("v") and module.name[1:5].isdigit():
+            found.append((int(module.name[1:5]), module.name))
+    return [(version, name, importlib.import_module(f"{__name__}.{name}")) for version, name in sorted(found)]
+
+def ensure_migrations_table(connection):
+    connection.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {MIGRATIONS_TABLE} "
+        "(version INTEGER PRIMARY KEY, name VARCHAR(200) NOT NULL, applied_at DATETIME NOT NULL)"
+    ))
+
+def applied_versions(connection):
+    return {row[0] for row in connection.execute(text(f"SELECT version FROM {MIGRATIONS_TABLE}"))}
+
+def record(connection, version, name):
+    connection.execute(
+        text(f"INSERT INTO {MIGRATIONS_TABLE} (version, name, applied_at) VALUES (:version, :name, :applied_at)"),
+        {"version": version, "name": name, "applied_at": datetime.utcnow()},
+    )
+
+# Brings any database up to date. A brand new database gets the current schema straight from
+# the models and every migration is recorded as applied; an existing one gets any new tables
+# and then runs its pending migrations in order.
+def upgrade(engine):
+    with engine.begin() as connection:
+        fresh = not inspect(connection).has_table(models.Post.__tablename__)
+        models.Base.metadata.create_all(bind=connection)
+        ensure_migrations_table(connection)
+        done = applied_versions(connection)
+        if fresh:
+            for version, name, _ in discover():
+                if version not in done:
+                    record(connection, version, name)
+            return []
+    applied = []
+    for version, name, module in discover():
+        if version in done:
+            continue
+        with engine.begin() as connection:
+            module.upgrade(connection)
+            record(connection, version, name)
+        applied.append(name)
+    return applied
+
+# Everything a database needs before the app serves from it: the pending migrations, then the
+# full-text index, which is built from the rows rather than by a migration (see app/search.py).
+# Run by the app's startup and by `python -m app.cli migrate`.
+def prepare(engine):
+    applied = upgrade(engine)
+    search.ensure_index(engine)
+    return applied
+
+def status(engine):
+    with engine.begin() as connection:
+        ensure_migrations_table(connection)
+        done = applied_versions(connection)
+    return [(name, version in done) for version, name, _ in discover()]
+
+# Helpers that keep migrations idempotent, so re-running one against a partly migrated
+# database is harmless
+def has_column(connection, table, column):
+    return any(info["name"] == column for info in inspect(connection).get_columns(table))
+
+def add_column(connection, table, column, ddl):
+    if not has_column(connection, table, column):
+        connection.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+
+def create_index(connection, name, table, columns):
+    connection.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({', '.join(columns)})"))
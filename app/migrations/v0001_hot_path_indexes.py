@@ -0,0 +1,8 @@
+from . import create_index
+
+# Indexes for the per-post comment listing, per-author lookups and newest-first post paging
+def upgrade(connection):
+    create_index(connection, "ix_posts_timestamp_id", "posts", ["timestamp", "id"])
+    create_index(connection, "ix_posts_author_id", "posts", ["author_id"])
+    create_index(connection, "ix_comments_post_id", "comments", ["post_id"])
+    create_index(connection, "ix_comments_author_id", "comments", ["author_id"])
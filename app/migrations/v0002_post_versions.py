@@ -0,0 +1,9 @@
+from . import add_column
+
+# Per-post versions behind the ETag and Last-Modified headers on post and comment reads.
+# updated_at and comments_updated_at stay NULL on old rows; readers fall back to the post timestamp.
+def upgrade(connection):
+    add_column(connection, "posts", "version", "INTEGER NOT NULL DEFAULT 1")
+    add_column(connection, "posts", "updated_at", "DATETIME")
+    add_column(connection, "posts", "comments_version", "INTEGER NOT NULL DEFAULT 0")
+    add_column(connection, "posts", "comments_updated_at", "DATETIME")
@@ -0,0 +1,10 @@
+from sqlalchemy import text
+from . import add_column
+
+# Denormalized comment count on posts, backfilled from the comments table.
+# The correlated count uses ix_comments_post_id, so each post costs one index range scan.
+def upgrade(connection):
+    add_column(connection, "posts", "comment_count", "INTEGER NOT NULL DEFAULT 0")
+    connection.execute(text(
+        "UPDATE posts SET comment_count = (SELECT count(*) FROM comments WHERE comments.post_id = posts.id)"
+    ))
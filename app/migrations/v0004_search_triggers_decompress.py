@@ -0,0 +1,12 @@
+from .. import search
+
+# Post bodies may now be stored compressed; the full-text triggers index decompress(content).
+# Databases without the index yet get it, with these triggers, from search.ensure_index.
+def upgrade(connection):
+    if not search.is_supported(connection):
+        return
+    exists = connection.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (search.FTS_TABLE,)
+    ).first()
+    if exists is not None:
+        search.recreate_triggers(connection)
@@ -0,0 +1,72 @@
+from .. import search
+from . import create_index
+
+# Post and comment ids become AUTOINCREMENT, so SQLite never reuses the id of the newest row
+# once it is deleted. SQLite cannot change a primary key in place, so this is the one
+# migration that rebuilds tables: each is copied into a new table with the definition below,
+# keeping every id, and its indexes and search triggers are recreated. It holds the write lock
+# for the whole copy; on a big database run `python -m app.cli migrate` off-peak.
+# The definitions are the schema as of this migration, not the current models, so later
+# migrations find the same tables whatever the models say by then.
+TABLES = {
+    "posts": (
+        "CREATE TABLE posts_rebuild (\n"
+        "\tid INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT, \n"
+        "\ttitle VARCHAR(150) NOT NULL, \n"
+        "\tcontent TEXT NOT NULL, \n"
+        "\ttimestamp DATETIME, \n"
+        "\tversion INTEGER DEFAULT '1' NOT NULL, \n"
+        "\tupdated_at DATETIME, \n"
+        "\tcomments_version INTEGER DEFAULT '0' NOT NULL, \n"
+        "\tcomments_updated_at DATETIME, \n"
+        "\tcomment_count INTEGER DEFAULT '0' NOT NULL, \n"
+        "\tauthor_id INTEGER, \n"
+        "\tFOREIGN KEY(author_id) REFERENCES users (id)\n"
+        ")",
+        ["id", "title", "content", "timestamp", "version", "updated_at", "comments_version",
+         "comments_updated_at", "comment_count", "author_id"],
+        {"ix_posts_id": ["id"], "ix_posts_author_id": ["author_id"], "ix_posts_timestamp_id": ["timestamp", "id"]},
+    ),
+    "comments": (
+        "CREATE TABLE comments_rebuild (\n"
+        "\tid INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT, \n"
+        "\tcontent TEXT NOT NULL, \n"
+        "\ttimestamp DATETIME, \n"
+        "\tpost_id INTEGER, \n"
+        "\tauthor_id INTEGER, \n"
+        "\tFOREIGN KEY(post_id) REFERENCES posts (id), \n"
+        "\tFOREIGN KEY(author_id) REFERENCES users (id)\n"
+        ")",
+        ["id", "content", "timestamp", "post_id", "author_id"],
+        {"ix_comments_id": ["id"], "ix_comments_post_id": ["post_id"], "ix_comments_author_id": ["author_id"]},
+    ),
+}
+
+def is_autoincrement(connection, table):
+    sql = connection.exec_driver_sql(
+        "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+    ).scalar()
+    return "AUTOINCREMENT" in sql.upper()
+
+def rebuild(connection, table, create, columns, indexes):
+    staging = f"{table}_rebuild"
+    connection.exec_driver_sql(create)
+    columns = ", ".join(columns)
+    connection.exec_driver_sql(f"INSERT INTO {staging} ({columns}) SELECT {columns} FROM {table}")
+    connection.exec_driver_sql(f"DROP TABLE {table}")
+    connection.exec_driver_sql(f"ALTER TABLE {staging} RENAME TO {table}")
+    for name, indexed in indexes.items():
+        create_index(connection, name, table, indexed)
+
+def upgrade(connection):
+    if connection.dialect.name != "sqlite":
+        return
+    for table, (create, columns, indexes) in TABLES.items():
+        if not is_autoincrement(connection, table):
+            rebuild(connection, table, create, columns, indexes)
+    # Dropping posts dropped the triggers that keep the search index in step with it
+    exists = connection.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (search.FTS_TABLE,)
+    ).first()
+    if exists is not None:
+        search.recreate_triggers(connection)
@@ -0,0 +1,13 @@
+from .. import search
+
+# The full-text triggers in the schema no longer call decompress(), which only the app's own
+# connections have, so other SQLite clients can write to `posts` again. Compressed rows are
+# indexed by per-connection TEMP triggers instead; see app/search.py.
+def upgrade(connection):
+    if not search.is_supported(connection):
+        return
+    exists = connection.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (search.FTS_TABLE,)
+    ).first()
+    if exists is not None:
+        search.recreate_triggers(connection)
@@ -1,7 +1,8 @@
-from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from .database import Base
+from .compression import CompressedText
 
 class User(Base):
     __tablename__ = 'users'
@@ -19,24 +20,64 @@ class Post(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     title = Column(String(150), nullable=False)
-    content = Column(Text, nullable=False)
+    content = Column(CompressedText, nullable=False)
     timestamp = Column(DateTime, default=datetime.utcnow)
 
-    author_id = Column(Integer, ForeignKey("users.id"))
+    # Bumped on every change to the post, and to its comments, for HTTP cache validation
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+    updated_at = Column(DateTime)
+    comments_version = Column(Integer, nullable=False, default=0, server_default="0")
+    comments_updated_at = Column(DateTime)
+
+    # Kept in step with inserts into comments; `python -m app.cli recount-comments` repairs it
+    comment_count = Column(Integer, nullable=False, default=0, server_default="0")
+
+    author_id = Column(Integer, ForeignKey("users.id"), index=True)
     author = relationship("User", back_populates="posts")
 
     comments = relationship("Comment", back_populates="post")
 
+    # Backs the newest-first keyset pagination in GET /posts. AUTOINCREMENT keeps SQLite from
+    # handing a deleted post's id to a new one (its comments may still be awaiting the purger,
+    # and clients may still hold its ETags).
+    __table_args__ = (
+        Index("ix_posts_timestamp_id", "timestamp", "id"),
+        {"sqlite_autoincrement": True},
+    )
+
+    # The latest change to anything GET /posts/{post_id} returns, comment_count included
+    @property
+    def last_modified(self):
+        return max((moment for moment in (self.timestamp, self.updated_at, self.comments_updated_at) if moment is not None), default=None)
+
+
+# One row per refresh token ever issued. A token is exchanged once (rotated_at); presenting it
+# again revokes its whole family.
+class RefreshToken(Base):
+    __tablename__ = 'refresh_tokens'
+
+    id = Column(Integer, primary_key=True)
+    token_hash = Column(String(64), unique=True, index=True, nullable=False)
+    family = Column(String(32), index=True, nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=False)
+    rotated_at = Column(DateTime)
+    revoked_at = Column(DateTime)
+
 
 class Comment(Base):
     __tablename__ = 'comments'
 
     id = Column(Integer, primary_key=True, index=True)
-    content = Column(Text, nullable=False)
+    content = Column(CompressedText, nullable=False)
     timestamp = Column(DateTime, default=datetime.utcnow)
 
-    post_id = Column(Integer, ForeignKey("posts.id"))
+    post_id = Column(Integer, ForeignKey("posts.id"), index=True)
     post = relationship("Post", back_populates="comments")
 
-    author_id = Column(Integer, ForeignKey("users.id"))
+    author_id = Column(Integer, ForeignKey("users.id"), index=True)
     author = relationship("User", back_populates="comments")
+
+    # Comment ids are never reused either: they are stream event ids and cursors
+    __table_args__ = {"sqlite_autoincrement": True}
@@ -0,0 +1,50 @@
+import base64
+from datetime import datetime
+from fastapi import HTTPException, status
+from sqlalchemy import and_, or_
+
+# Cursors are opaque to clients: a urlsafe base64 encoding of "<iso timestamp>|<id>"
+def encode_cursor(timestamp: datetime, row_id: int) -> str:
+    raw = f"{timestamp.isoformat()}|{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str):
+    try:
+        timestamp, row_id = _decode(cursor).split("|")
+        return datetime.fromisoformat(timestamp), int(row_id)
+    except (ValueError, UnicodeDecodeError):
+        raise invalid_cursor()
+
+# Orders a select newest first on (timestamp, id) and seeks past the cursor, or skips `skip` rows
+def newest_first(query, model, cursor: str = None, skip: int = 0):
+    query = query.order_by(model.timestamp.desc(), model.id.desc())
+    if cursor is None:
+        return query.offset(skip)
+    timestamp, row_id = decode_cursor(cursor)
+    return query.where(or_(
+        model.timestamp < timestamp,
+        and_(model.timestamp == timestamp, model.id < row_id),
+    ))
+
+# For listings ordered by id alone, like a post's comments
+def encode_id_cursor(row_id: int) -> str:
+    return base64.urlsafe_b64encode(f"id|{row_id}".encode()).decode().rstrip("=")
+
+def decode_id_cursor(cursor: str) -> int:
+    try:
+        prefix, row_id = _decode(cursor).split("|")
+        if prefix != "id":
+            raise ValueError(cursor)
+        return int(row_id)
+    except (ValueError, UnicodeDecodeError):
+        raise invalid_cursor()
+
+def _decode(cursor: str) -> str:
+    padded = cursor + "=" * (-len(cursor) % 4)
+    return base64.urlsafe_b64decode(padded.encode()).decode()
+
+def invalid_cursor():
+    return HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail="Invalid cursor"
+    )
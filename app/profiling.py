@@ -0,0 +1,121 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from sqlalchemy import event
+from . import metrics
+
+# Opt-in slow-query log. Statements slower than SLOW_QUERY_MS are logged to the
+# "app.slow_query" logger with the route that ran them, the shape of their parameters
+# (types only, never values) and SQLite's EXPLAIN QUERY PLAN, with full table scans flagged.
+# The last SLOW_QUERY_BUFFER captures are kept for GET /admin/slow-queries.
+SLOW_QUERY_LOG = os.getenv("SLOW_QUERY_LOG", "0") == "1"
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "100"))
+SLOW_QUERY_BUFFER = int(os.getenv("SLOW_QUERY_BUFFER", "100"))
+
+logger = logging.getLogger("app.slow_query")
+
+# "GET /posts/{post_id}" while a request is being handled
+current_route = ContextVar("current_route", default=None)
+
+class RouteContextMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        token = current_route.set(f"{scope['method']} {metrics.route_template(scope['app'], scope)}")
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_route.reset(token)
+
+class SlowQueryLog:
+    def __init__(self, threshold_ms: float, size: int):
+        self.threshold_ms = threshold_ms
+        self._entries = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def record(self, entry):
+        with self._lock:
+            self._entries.append(entry)
+
+    # Slowest first
+    def worst(self, limit: int = None):
+        with self._lock:
+            entries = sorted(self._entries, key=lambda entry: entry["duration_ms"], reverse=True)
+        return entries[:limit] if limit else entries
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+slow_queries = SlowQueryLog(SLOW_QUERY_MS, SLOW_QUERY_BUFFER)
+
+# Types of the bound parameters, e.g. {"post_id": "int"} or ["str", "int"]; never the values
+def parameters_shape(parameters, executemany=False):
+    if executemany:
+        rows = list(parameters)
+        return {"rows": len(rows), "row": parameters_shape(rows[0]) if rows else None}
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [type(value).__name__ for value in parameters]
+    return None
+
+# Plan steps that read a whole table, as opposed to an index search, a virtual table
+# or a subquery that was already materialized (itself planned in its own steps)
+def full_scans(plan):
+    subqueries = {detail.split(" ", 1)[1] for detail in plan if detail.startswith(("MATERIALIZE ", "CO-ROUTINE "))}
+    return [
+        detail for detail in plan
+        if detail.startswith("SCAN ") and " USING " not in detail and "VIRTUAL TABLE" not in detail
+        and detail != "SCAN CONSTANT ROW" and detail[len("SCAN "):] not in subqueries
+    ]
+
+# Runs EXPLAIN QUERY PLAN on the raw DBAPI connection, so it fires no engine events of its own
+def explain(connection, statement, parameters):
+    if connection.dialect.name != "sqlite" or not statement.lstrip().upper().startswith(("SELECT", "WITH")):
+        return []
+    cursor = connection.connection.dbapi_connection.cursor()
+    try:
+        cursor.execute(f"EXPLAIN QUERY PLAN {statement}", parameters)
+        return [row[3] for row in cursor.fetchall()]
+    except Exception as exc:
+        return [f"EXPLAIN failed: {exc}"]
+    finally:
+        cursor.close()
+
+def capture(connection, statement, parameters, executemany, duration_ms):
+    plan = [] if executemany else explain(connection, statement, parameters)
+    entry = {
+        "at": datetime.now(timezone.utc).isoformat(),
+        "duration_ms": round(duration_ms, 3),
+        "route": current_route.get(),
+        "statement": statement,
+        "parameters": parameters_shape(parameters, executemany),
+        "plan": plan,
+        "full_scan": bool(full_scans(plan)),
+    }
+    slow_queries.record(entry)
+    logger.warning(
+        "slow query %.1f ms route=%s full_scan=%s statement=%s parameters=%s plan=%s",
+        duration_ms, entry["route"], entry["full_scan"], " ".join(statement.split()), entry["parameters"], plan,
+    )
+    return entry
+
+def instrument_engine(engine):
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        context._profile_started = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        duration_ms = (time.perf_counter() - context._profile_started) * 1000
+        if duration_ms >= slow_queries.threshold_ms:
+            capture(conn, statement, parameters, executemany, duration_ms)
@@ -0,0 +1,71 @@
+import logging
+import os
+import queue
+import threading
+from . import maintenance
+
+# Deleting a post deletes its comments too, without loading them. Threads of up to
+# PURGE_INLINE_COMMENTS comments go in the request's own transaction with one DELETE; a bigger
+# thread is handed to a background purger once the post row is gone, which deletes
+# PURGE_BATCH_SIZE comments per transaction and pauses PURGE_PAUSE_MS between them so other
+# writers get the lock. Comments of a deleted post are never listed meanwhile. A purge cut
+# short by a restart leaves orphans for `python -m app.cli purge-orphans`.
+PURGE_INLINE_COMMENTS = int(os.getenv("PURGE_INLINE_COMMENTS", "1000"))
+PURGE_BATCH_SIZE = int(os.getenv("PURGE_BATCH_SIZE", "1000"))
+PURGE_PAUSE_MS = float(os.getenv("PURGE_PAUSE_MS", "10"))
+
+logger = logging.getLogger("app.purge")
+
+_STOP = object()
+
+class CommentPurger:
+    def __init__(self, batch_size: int = PURGE_BATCH_SIZE, pause_ms: float = PURGE_PAUSE_MS):
+        self.batch_size = batch_size
+        self.pause = pause_ms / 1000
+        self.purged = 0
+        self._queue = queue.Queue()
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    # Queues the deletion of post `post_id`'s comments from the database `engine` points at
+    def submit(self, engine, post_id: int):
+        self._start()
+        self._queue.put((engine, post_id))
+
+    # Blocks until every queued purge has finished
+    def join(self):
+        self._queue.join()
+
+    def _start(self):
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="comment-purge", daemon=True)
+                    self._thread.start()
+
+    # Stops after the batch in progress; purges not finished are left to purge-orphans
+    def shutdown(self):
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._stop.set()
+            self._queue.put(_STOP)
+            thread.join()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is _STOP:
+                    return
+                if not self._stop.is_set():
+                    self._purge(*item)
+            finally:
+                self._queue.task_done()
+
+    def _purge(self, engine, post_id):
+        try:
+            self.purged += maintenance.purge_comments(engine, post_id, self.batch_size, self.pause, self._stop)
+        except Exception:
+            logger.exception("purging the comments of post %s failed", post_id)
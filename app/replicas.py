@@ -0,0 +1,109 @@
+import itertools
+import os
+import threading
+from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker
+from . import database
+
+# Read replicas of the primary database. Read-only routes take their session from the next
+# healthy replica in turn; writes always go to the primary. A background thread re-checks
+# every replica each REPLICA_HEALTH_INTERVAL seconds, and reads fall back to the primary's
+# read pool while no replica is healthy. Keeping the replicas in sync (e.g. with Litestream or
+# LiteFS for SQLite) is up to the deployment.
+DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+REPLICA_HEALTH_INTERVAL = float(os.getenv("REPLICA_HEALTH_INTERVAL", "5"))
+
+# A replica must answer this to take reads; it also fails on a database without the schema
+HEALTH_CHECK_SQL = "SELECT 1 FROM posts LIMIT 1"
+
+class Replica:
+    def __init__(self, url):
+        self.url = url
+        self.engine = database.build_engine(url, database.DB_READ_POOL_SIZE, database.DB_READ_MAX_OVERFLOW, read_only=True)
+        self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
+        self.async_engine = None
+        self.AsyncSessionLocal = None
+        if database.DB_MODE == "async":
+            from sqlalchemy.ext.asyncio import async_sessionmaker
+
+            self.async_engine = database.build_async_engine(url, database.DB_READ_POOL_SIZE, database.DB_READ_MAX_OVERFLOW, read_only=True)
+            self.AsyncSessionLocal = async_sessionmaker(self.async_engine, autoflush=False, expire_on_commit=False)
+        self.healthy = True
+
+    def check(self):
+        try:
+            with self.engine.connect() as connection:
+                connection.execute(text(HEALTH_CHECK_SQL))
+            self.healthy = True
+        except Exception:
+            self.healthy = False
+        return self.healthy
+
+    async def dispose(self):
+        if self.async_engine is not None:
+            await self.async_engine.dispose()
+        self.engine.dispose()
+
+class ReplicaSet:
+    def __init__(self, urls, health_interval: float = REPLICA_HEALTH_INTERVAL):
+        self.replicas = [Replica(url) for url in urls]
+        self.health_interval = health_interval
+        self._next = itertools.count()
+        self._stop = threading.Event()
+        self._checker = None
+        self.check()
+
+    def check(self):
+        for replica in self.replicas:
+            replica.check()
+
+    # The next healthy replica, round-robin, or None when every replica is down
+    def pick(self):
+        self._start()
+        start = next(self._next)
+        for offset in range(len(self.replicas)):
+            replica = self.replicas[(start + offset) % len(self.replicas)]
+            if replica.healthy:
+                return replica
+        return None
+
+    def _start(self):
+        if self._checker is None:
+            self._checker = threading.Thread(target=self._run, name="replica-health", daemon=True)
+            self._checker.start()
+
+    def _run(self):
+        while not self._stop.wait(self.health_interval):
+            self.check()
+
+    async def dispose(self):
+        self._stop.set()
+        for replica in self.replicas:
+            await replica.dispose()
+
+# The replicas, or None when there are none; set up by open_replicas() at startup
+replica_set = None
+
+def open_replicas(urls=DATABASE_REPLICA_URLS):
+    global replica_set
+    replica_set = ReplicaSet(urls) if urls else None
+    return replica_set
+
+async def close_replicas():
+    global replica_set
+    if replica_set is not None:
+        await replica_set.dispose()
+    replica_set = None
+
+# Session factories for a read: the next healthy replica's, or the primary read pool's
+def read_sessionmaker():
+    replica = replica_set.pick() if replica_set is not None else None
+    if replica is None:
+        return database.ReadSessionLocal
+    return replica.SessionLocal
+
+def async_read_sessionmaker():
+    replica = replica_set.pick() if replica_set is not None else None
+    if replica is None:
+        return database.AsyncReadSessionLocal
+    return replica.AsyncSessionLocal
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 from datetime import datetime
 from typing import List, Optional
 
@@ -10,12 +10,15 @@ class UserResponse(BaseModel):
     id: int
     username: str
     
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: Optional[str] = None
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
 
 class PostBase(BaseModel):
     title: str
@@ -31,9 +34,25 @@ class Post(PostBase):
     id: int
     timestamp: datetime
     author_id: int
+    comment_count: int = 0
+
+    model_config = ConfigDict(from_attributes=True)
 
-    class Config:
-        orm_mode = True
+# A post in a listing with `fields=`: only the requested fields are sent
+class PostSummary(BaseModel):
+    id: Optional[int] = None
+    title: Optional[str] = None
+    content: Optional[str] = None
+    timestamp: Optional[datetime] = None
+    author_id: Optional[int] = None
+    comment_count: Optional[int] = None
+    excerpt: Optional[str] = None
+
+# A post's place in GET /posts/trending: its score and how many comments it got in the window
+class TrendingPost(BaseModel):
+    id: int
+    score: float
+    comments: int
 
 class CommentBase(BaseModel):
     content: str
@@ -47,5 +66,23 @@ class Comment(CommentBase):
     author_id: int
     post_id: int
 
-    class Config:
-        orm_mode = True
\ No newline at end of file
+    model_config = ConfigDict(from_attributes=True)
+
+class FeedComment(Comment):
+    author_username: Optional[str] = None
+
+class FeedPost(Post):
+    author_username: Optional[str] = None
+    latest_comments: List[FeedComment] = []
+
+class BatchItemResult(BaseModel):
+    index: int
+    status: str
+    id: Optional[int] = None
+    timestamp: Optional[datetime] = None
+    error: Optional[str] = None
+
+class BatchResult(BaseModel):
+    created: int
+    failed: int
+    results: List[BatchItemResult]
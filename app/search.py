@@ -0,0 +1,166 @@
+import re
+import sqlite3
+from sqlalchemy import Float, Integer, column, event, literal, select, text
+from sqlalchemy.engine import Engine
+from . import models
+from .compression import content_text
+
+# Full-text index over posts.title and posts.content. It is an external-content FTS5 table,
+# so it only stores the index; triggers keep it in step with every write to `posts`.
+# Bodies may be stored compressed (see app/compression.py), and only the app can read those:
+# the triggers in the schema index plain-text bodies, so any SQLite client can write to `posts`,
+# while compressed rows are indexed by TEMP triggers the app adds to each of its own connections,
+# which feed the index decompress(content). The index is never rebuilt by reading `posts` directly.
+FTS_TABLE = "posts_fts"
+
+# Title hits weigh more than body hits when ranking with BM25
+TITLE_WEIGHT = 10.0
+CONTENT_WEIGHT = 1.0
+
+# The old row is taken out of the index before an update and the new one added after it,
+# so the plain-text and the compressed triggers can share an update in either order
+_INSERT = f"INSERT INTO {FTS_TABLE}(rowid, title, content) VALUES (new.id, new.title, {{content}});"
+_DELETE = f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, content) VALUES ('delete', old.id, old.title, {{content}});"
+_TRIGGERS = [
+    ("ai", "AFTER INSERT ON {table}", "new", _INSERT),
+    ("ad", "AFTER DELETE ON {table}", "old", _DELETE),
+    ("bu", "BEFORE UPDATE OF title, content ON {table}", "old", _DELETE),
+    ("au", "AFTER UPDATE OF title, content ON {table}", "new", _INSERT),
+]
+
+def _trigger_statements(compressed):
+    statements = []
+    for suffix, timing, row, body in _TRIGGERS:
+        if compressed:
+            create, name, table, test, content = "CREATE TEMP TRIGGER", f"posts_fts_{suffix}_compressed", "main.posts", "=", f"decompress({row}.content)"
+        else:
+            create, name, table, test, content = "CREATE TRIGGER", f"posts_fts_{suffix}", "posts", "!=", f"{row}.content"
+        statements.append(
+            f"{create} IF NOT EXISTS {name} {timing.format(table=table)} "
+            f"WHEN typeof({row}.content) {test} 'blob' BEGIN {body.format(content=content)} END"
+        )
+    return statements
+
+_CREATE_TABLE = f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(title, content, content='posts', content_rowid='id')"
+_CREATE_STATEMENTS = [_CREATE_TABLE] + _trigger_statements(compressed=False)
+_COMPRESSED_STATEMENTS = _trigger_statements(compressed=True)
+TRIGGERS = [f"posts_fts_{suffix}" for suffix, *_ in _TRIGGERS]
+
+# Rank and page inside the index first, so only the rows on the page are read from `posts`.
+# Rows come back like a select() of the chosen posts columns, plus the BM25 `score` (lower is
+# better) for merging results from several shards.
+_HITS = text(f"""
+    SELECT rowid, bm25({FTS_TABLE}, {TITLE_WEIGHT}, {CONTENT_WEIGHT}) AS score FROM {FTS_TABLE}
+    WHERE {FTS_TABLE} MATCH :match
+    ORDER BY score, rowid DESC
+    LIMIT :limit OFFSET :skip
+""").columns(column("rowid", Integer), column("score", Float)).subquery("hits")
+_POST_COLUMNS = list(models.Post.__table__.columns)
+
+def _search_statement(columns):
+    return (
+        select(*columns, _HITS.c.score)
+        .join_from(_HITS, models.Post, models.Post.id == _HITS.c.rowid)
+        .order_by(_HITS.c.score, models.Post.id.desc())
+    )
+
+def is_supported(connection):
+    return connection.dialect.name == "sqlite"
+
+def create_index(connection):
+    for statement in _CREATE_STATEMENTS:
+        connection.exec_driver_sql(statement)
+    install_compressed_triggers(connection.connection.dbapi_connection)
+
+def rebuild_index(connection):
+    create_index(connection)
+    connection.exec_driver_sql(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('delete-all')")
+    connection.exec_driver_sql(f"INSERT INTO {FTS_TABLE}(rowid, title, content) SELECT id, title, decompress(content) FROM posts")
+
+# Replaces the triggers with the current definitions, on databases whose index already exists
+def recreate_triggers(connection):
+    for trigger in TRIGGERS:
+        connection.exec_driver_sql(f"DROP TRIGGER IF EXISTS {trigger}")
+    for statement in _CREATE_STATEMENTS[1:]:
+        connection.exec_driver_sql(statement)
+    install_compressed_triggers(connection.connection.dbapi_connection)
+
+# Adds the TEMP triggers for compressed rows to one connection, if it can write and the
+# database has the index. Returns whether they are in place.
+def install_compressed_triggers(dbapi_connection):
+    cursor = dbapi_connection.cursor()
+    try:
+        # (aiosqlite's adapted cursor returns nothing from execute())
+        cursor.execute("PRAGMA query_only")
+        if cursor.fetchone()[0]:
+            return False
+        cursor.execute("SELECT name FROM main.sqlite_master WHERE type = 'table' AND name IN ('posts', ?)", (FTS_TABLE,))
+        tables = {row[0] for row in cursor.fetchall()}
+        if tables != {"posts", FTS_TABLE}:
+            return False
+        for statement in _COMPRESSED_STATEMENTS:
+            cursor.execute(statement)
+        return True
+    finally:
+        cursor.close()
+
+# TEMP triggers go when `posts` is dropped or rebuilt, so each checkout compares the schema
+# version with the one the connection's triggers were last checked against
+@event.listens_for(Engine, "checkout")
+def _ensure_compressed_triggers(dbapi_connection, connection_record, connection_proxy):
+    if not (isinstance(dbapi_connection, sqlite3.Connection) or type(dbapi_connection).__module__.endswith("aiosqlite")):
+        return
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute("PRAGMA schema_version")
+        version = cursor.fetchone()[0]
+    finally:
+        cursor.close()
+    if connection_record.info.get("search_schema_version") != version:
+        install_compressed_triggers(dbapi_connection)
+        connection_record.info["search_schema_version"] = version
+
+# Creates the index on databases that predate it and backfills it from the existing rows
+def ensure_index(engine):
+    with engine.begin() as connection:
+        if not is_supported(connection):
+            return
+        exists = connection.exec_driver_sql(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (FTS_TABLE,)
+        ).first()
+        if exists is None:
+            rebuild_index(connection)
+
+@event.listens_for(models.Post.__table__, "after_create")
+def _create_index_with_posts(target, connection, **kw):
+    if is_supported(connection):
+        create_index(connection)
+
+@event.listens_for(models.Post.__table__, "before_drop")
+def _drop_index_with_posts(target, connection, **kw):
+    if is_supported(connection):
+        connection.exec_driver_sql(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+# Turns free text into an FTS5 query: every word must match, in any column.
+# Quoting each token keeps user input from being parsed as FTS5 syntax.
+def to_match_expression(query: str):
+    tokens = re.findall(r"\w+", query)
+    return " ".join(f'"{token}"' for token in tokens)
+
+# Returns rows of `columns` (by default the whole posts table) with their `score`, best match first.
+# `db` is an AsyncSession or a database.ThreadedSession.
+async def search_posts(db, query: str, skip: int = 0, limit: int = 10, columns=None):
+    columns = columns or _POST_COLUMNS
+    if not is_supported(db.get_bind()):
+        return await like_search(db, query, skip, limit, columns)
+    match = to_match_expression(query)
+    if not match:
+        return []
+    return (await db.execute(_search_statement(columns), {"match": match, "skip": skip, "limit": limit})).all()
+
+# The unindexed substring search; used on databases without FTS5 and by the benchmark
+async def like_search(db, query: str, skip: int = 0, limit: int = 10, columns=None):
+    statement = select(*(columns or _POST_COLUMNS), literal(0.0).label("score")).where(
+        models.Post.title.contains(query) | content_text(models.Post.content).contains(query)
+    ).order_by(models.Post.id.desc()).offset(skip).limit(limit)
+    return (await db.execute(statement)).all()
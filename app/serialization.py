@@ -0,0 +1,41 @@
+import json
+import os
+from fastapi import Response
+from fastapi.responses import JSONResponse
+
+# orjson is optional: when it is installed it encodes every response, and the list endpoints
+# can skip Pydantic entirely by encoding their row tuples directly.
+try:
+    import orjson
+    from fastapi.responses import ORJSONResponse as DefaultResponse
+except ImportError:
+    orjson = None
+    DefaultResponse = JSONResponse
+
+# List endpoints select plain columns and, with this on, write them straight to JSON instead of
+# validating each row through the response model. Off, rows still go through the response model.
+FAST_SERIALIZATION = os.getenv("FAST_SERIALIZATION", "1") == "1"
+
+# Responses of at least this many bytes are gzip-compressed for clients that accept it; 0 turns it off
+GZIP_MINIMUM_SIZE = int(os.getenv("GZIP_MINIMUM_SIZE", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+
+def _default(value):
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def dumps(content) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, default=_default, separators=(",", ":")).encode()
+
+# The columns of `model` that make up `schema`, in the schema's field order
+def columns_for(model, schema):
+    return [getattr(model, name) for name in schema.model_fields if hasattr(model, name)]
+
+def rows_to_dicts(rows, fields):
+    return [{field: row._mapping[field] for field in fields} for row in rows]
+
+def json_response(content, headers=None):
+    return Response(content=dumps(content), media_type="application/json", headers=headers)
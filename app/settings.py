@@ -0,0 +1,19 @@
+import os
+from dataclasses import dataclass, field
+from typing import List
+from . import database, group_commit, replicas, sharding, trending
+
+# Bring the schema up to date when the app starts. Multi-worker deployments can turn it off and
+# run `python -m app.cli migrate` once per deploy instead, so workers boot without touching it.
+MIGRATE_ON_STARTUP = os.getenv("MIGRATE_ON_STARTUP", "1") == "1"
+
+# What create_app() needs to know about its deployment. The defaults come from the
+# environment variables documented in the README; tests and embedders pass their own.
+@dataclass
+class Settings:
+    database_url: str = database.SQLALCHEMY_DATABASE_URL
+    replica_urls: List[str] = field(default_factory=lambda: list(replicas.DATABASE_REPLICA_URLS))
+    shard_urls: List[str] = field(default_factory=lambda: list(sharding.SHARD_URLS))
+    migrate_on_startup: bool = MIGRATE_ON_STARTUP
+    group_commit: bool = group_commit.GROUP_COMMIT
+    trending: bool = trending.TRENDING
@@ -0,0 +1,152 @@
+import asyncio
+import heapq
+import itertools
+import os
+from contextlib import asynccontextmanager
+from sqlalchemy import Column, Integer, MetaData, String, Table, func, insert, select, text
+from sqlalchemy.orm import sessionmaker
+from . import database, migrations, models
+
+# Optional sharding of posts and comments by post id. With SHARD_URLS set to two or more
+# databases, post N and its comments live on shard (N - 1) % len(SHARD_URLS); users stay on
+# the primary DATABASE_URL (which may also be one of the shards). Each shard hands out ids from
+# its own residue class, so ids stay unique across shards and route straight to their shard.
+# Lists that span shards (GET /posts, /feed, /search, /export/posts) query every shard and merge.
+SHARD_URLS = [url.strip() for url in os.getenv("SHARD_URLS", "").split(",") if url.strip()]
+
+# The next free id of each sharded table, per shard
+sequence_metadata = MetaData()
+shard_sequences = Table(
+    "shard_sequences", sequence_metadata,
+    Column("name", String(50), primary_key=True),
+    Column("next_id", Integer, nullable=False),
+)
+SHARDED_MODELS = (models.Post, models.Comment)
+
+class Shard:
+    def __init__(self, index, count, url):
+        self.index = index
+        self.url = url
+        info = {"shard": index, "shard_count": count}
+        self.engine, self.read_engine = database.build_engines(url)
+        self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=self.engine, info=info)
+        self.ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=self.read_engine, info=info)
+        self.async_engine = self.async_read_engine = None
+        self.AsyncSessionLocal = self.AsyncReadSessionLocal = None
+        if database.DB_MODE == "async":
+            from sqlalchemy.ext.asyncio import async_sessionmaker
+
+            self.async_engine = database.build_async_engine(url, database.DB_WRITE_POOL_SIZE, database.DB_WRITE_MAX_OVERFLOW)
+            self.async_read_engine = database.build_async_engine(url, database.DB_READ_POOL_SIZE, database.DB_READ_MAX_OVERFLOW, read_only=True)
+            self.AsyncSessionLocal = async_sessionmaker(self.async_engine, autoflush=False, expire_on_commit=False, info=info)
+            self.AsyncReadSessionLocal = async_sessionmaker(self.async_read_engine, autoflush=False, expire_on_commit=False, info=info)
+
+    # Factory for sessions that outlive the request, like streamed exports
+    def read_sessionmaker(self):
+        return self.AsyncReadSessionLocal if database.DB_MODE == "async" else self.ReadSessionLocal
+
+    async def dispose(self):
+        if self.async_engine is not None:
+            await self.async_engine.dispose()
+            await self.async_read_engine.dispose()
+        self.engine.dispose()
+        self.read_engine.dispose()
+
+class ShardSet:
+    def __init__(self, urls):
+        self.shards = [Shard(index, len(urls), url) for index, url in enumerate(urls)]
+        self._next = itertools.count()
+
+    def __len__(self):
+        return len(self.shards)
+
+    def __iter__(self):
+        return iter(self.shards)
+
+    def shard_for(self, post_id: int):
+        return self.shards[(post_id - 1) % len(self.shards)]
+
+    # Where a new post goes: each shard in turn, to spread the writes
+    def next_shard(self):
+        return self.shards[next(self._next) % len(self.shards)]
+
+    # Brings every shard's schema, search index and id sequences up to date
+    def setup(self):
+        for shard in self.shards:
+            migrations.prepare(shard.engine)
+            with shard.engine.begin() as connection:
+                ensure_sequences(connection, shard.index, len(self.shards))
+
+    async def dispose(self):
+        for shard in self.shards:
+            await shard.dispose()
+
+# Starts each sequence at the first id of this shard's residue class above the table's ids
+def ensure_sequences(connection, index, count):
+    sequence_metadata.create_all(bind=connection)
+    existing = set(connection.execute(select(shard_sequences.c.name)).scalars())
+    for model in SHARDED_MODELS:
+        name = model.__tablename__
+        if name in existing:
+            continue
+        first = (connection.execute(select(func.max(model.id))).scalar() or 0) + 1
+        first += (index - (first - 1)) % count
+        connection.execute(insert(shard_sequences).values(name=name, next_id=first))
+
+# Reserves `count` ids of `model` on the session's shard, in one atomic statement.
+# Runs on a plain Session; async callers go through run_sync, as assign_ids does.
+def allocate_ids(session, model, count):
+    step = session.info["shard_count"]
+    next_id = session.execute(
+        text("UPDATE shard_sequences SET next_id = next_id + :reserved WHERE name = :name RETURNING next_id"),
+        {"reserved": count * step, "name": model.__tablename__},
+    ).scalar_one()
+    first = next_id - count * step
+    return [first + offset * step for offset in range(count)]
+
+def is_shard_session(db):
+    return "shard" in db.info
+
+# Gives new rows (ORM objects or value dicts) ids from the shard's sequence; a no-op elsewhere
+async def assign_ids(db, model, targets):
+    if not targets or not is_shard_session(db):
+        return
+    ids = await db.run_sync(allocate_ids, model, len(targets))
+    for target, new_id in zip(targets, ids):
+        if isinstance(target, dict):
+            target["id"] = new_id
+        else:
+            target.id = new_id
+
+# A request session on one shard, with the same API in both DB modes
+@asynccontextmanager
+async def open_session(shard, read=False):
+    if database.DB_MODE == "async":
+        async with (shard.AsyncReadSessionLocal if read else shard.AsyncSessionLocal)() as db:
+            yield db
+        return
+    async with database.open_threaded_session((shard.ReadSessionLocal if read else shard.SessionLocal)()) as db:
+        yield db
+
+# Runs `query(db)` on every shard session at once and returns the results in shard order
+async def fan_out(sessions, query):
+    return await asyncio.gather(*(query(db) for db in sessions))
+
+# Merges per-shard lists that are each sorted by `key` and returns items [skip, skip + limit)
+def merge(lists, key, reverse=False, skip=0, limit=None):
+    merged = heapq.merge(*lists, key=key, reverse=reverse)
+    return list(itertools.islice(merged, skip, None if limit is None else skip + limit))
+
+# The shards, or None when sharding is off; set up by open_shards() at startup
+shard_set = None
+
+def open_shards(urls=SHARD_URLS):
+    global shard_set
+    shard_set = ShardSet(urls) if urls else None
+    return shard_set
+
+async def close_shards():
+    global shard_set
+    if shard_set is not None:
+        await shard_set.dispose()
+    shard_set = None
@@ -0,0 +1,251 @@
+import heapq
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from sqlalchemy import func, select
+from . import models
+from .cache import TTLCache
+
+# In-memory trending ranking. New posts and comments are counted into time buckets of
+# TRENDING_BUCKET_SECONDS per post; a post's score over a window is the sum of its buckets,
+# each halved every TRENDING_HALF_LIFE_HOURS of age, so GET /posts/trending never queries the
+# database. Routes record their own writes as they happen; a background thread also reads rows
+# added since its last pass (so writes made by other workers count too, once) and snapshots the
+# counters to TRENDING_SNAPSHOT_PATH right after a pass, from which a restart resumes instead of
+# re-reading the window.
+# Rankings are computed once per pass and window and served from a cache until the next pass, so
+# new activity shows up within TRENDING_SYNC_SECONDS; deleted posts leave at once.
+TRENDING = os.getenv("TRENDING", "1") == "1"
+TRENDING_BUCKET_SECONDS = int(os.getenv("TRENDING_BUCKET_SECONDS", "300"))
+TRENDING_MAX_WINDOW_HOURS = float(os.getenv("TRENDING_MAX_WINDOW_HOURS", "168"))
+TRENDING_HALF_LIFE_HOURS = float(os.getenv("TRENDING_HALF_LIFE_HOURS", "6"))
+TRENDING_POST_WEIGHT = float(os.getenv("TRENDING_POST_WEIGHT", "1"))
+TRENDING_COMMENT_WEIGHT = float(os.getenv("TRENDING_COMMENT_WEIGHT", "1"))
+TRENDING_SYNC_SECONDS = float(os.getenv("TRENDING_SYNC_SECONDS", "10"))
+TRENDING_SNAPSHOT_PATH = os.getenv("TRENDING_SNAPSHOT_PATH", "")
+TRENDING_SNAPSHOT_SECONDS = float(os.getenv("TRENDING_SNAPSHOT_SECONDS", "60"))
+
+logger = logging.getLogger("app.trending")
+
+# Rows read from the database per query while catching up
+CATCH_UP_BATCH_SIZE = 10000
+# Rankings kept between passes, one per (limit, window_hours) asked for
+TOP_CACHE_SIZE = 256
+# How old a row can be and still be counted by both a route and the catch-up
+DEDUPLICATE_SECONDS = max(60.0, 3 * TRENDING_SYNC_SECONDS)
+
+POSTS, COMMENTS = "posts", "comments"
+# Each kind of activity: its table, and the column naming the post it counts for
+SOURCES = {POSTS: (models.Post, models.Post.id.label("post_id")), COMMENTS: (models.Comment, models.Comment.post_id)}
+
+def epoch(timestamp: datetime):
+    return timestamp.replace(tzinfo=timezone.utc).timestamp()
+
+# The first id of `model` created at or after `since`. Ids grow with time, so this is a
+# binary search over the primary key rather than a scan of the timestamp column.
+def first_id_since(connection, model, since: datetime):
+    low, high = connection.execute(select(func.min(model.id), func.max(model.id))).one()
+    if low is None:
+        return None
+    while low < high:
+        middle = (low + high) // 2
+        timestamp = connection.execute(
+            select(model.timestamp).where(model.id >= middle).order_by(model.id).limit(1)
+        ).scalar()
+        if timestamp is not None and timestamp >= since:
+            high = middle
+        else:
+            low = middle + 1
+    return low
+
+class TrendingRanker:
+    def __init__(self, databases=(), bucket_seconds: int = TRENDING_BUCKET_SECONDS,
+                 max_window_hours: float = TRENDING_MAX_WINDOW_HOURS, half_life_hours: float = TRENDING_HALF_LIFE_HOURS,
+                 snapshot_path: str = TRENDING_SNAPSHOT_PATH):
+        # (label, engine) pairs to read activity from: the primary, or every shard
+        self.databases = list(databases)
+        self.bucket_seconds = bucket_seconds
+        self.max_window = max_window_hours * 3600
+        self.half_life = half_life_hours * 3600
+        self.snapshot_path = snapshot_path
+        # bucket number -> {kind: Counter(post_id -> rows)}
+        self._buckets = {}
+        # database label -> {kind: highest id read}
+        self._marks = {}
+        # (kind, id) of rows counted lately, so a row seen both by a route and by the catch-up
+        # counts once. Two generations, rotated on each catch-up pass.
+        self._recent, self._older = set(), set()
+        self._top_cache = TTLCache(maxsize=TOP_CACHE_SIZE, ttl=TRENDING_SYNC_SECONDS)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def record(self, kind, row_id, post_id, timestamp: datetime):
+        with self._lock:
+            self._count(kind, row_id, post_id, epoch(timestamp))
+
+    def _count(self, kind, row_id, post_id, at):
+        # Only just-written rows can reach both paths; older ones are not remembered
+        if at >= time.time() - DEDUPLICATE_SECONDS:
+            key = (kind, row_id)
+            if key in self._recent or key in self._older:
+                return
+            self._recent.add(key)
+        bucket = int(at // self.bucket_seconds)
+        if bucket < int((time.time() - self.max_window) // self.bucket_seconds):
+            return
+        counters = self._buckets.setdefault(bucket, {POSTS: Counter(), COMMENTS: Counter()})
+        counters[kind][post_id] += 1
+
+    # A deleted post leaves the ranking at once
+    def forget(self, post_id):
+        with self._lock:
+            for counters in self._buckets.values():
+                for counter in counters.values():
+                    counter.pop(post_id, None)
+        self._top_cache.clear()
+
+    # The `limit` highest-scoring posts over the last `window_hours`, as dicts of id, score and
+    # the number of comments the post got in the window. Cached until the next catch-up pass
+    # unless `now` is given; a miss walks every bucket, so async callers run it on a thread.
+    def top(self, limit: int = 10, window_hours: float = 24, now: float = None):
+        if now is None:
+            key = (limit, window_hours)
+            ranking = self._top_cache.get(key)
+            if ranking is None:
+                ranking = self._rank(limit, window_hours, time.time())
+                self._top_cache.set(key, ranking)
+            return ranking
+        return self._rank(limit, window_hours, now)
+
+    def _rank(self, limit, window_hours, now):
+        first = int((now - min(window_hours * 3600, self.max_window)) // self.bucket_seconds)
+        scores, comments = Counter(), Counter()
+        with self._lock:
+            for bucket, counters in self._buckets.items():
+                if bucket < first:
+                    continue
+                age = max(0.0, now - (bucket + 0.5) * self.bucket_seconds)
+                decay = 0.5 ** (age / self.half_life)
+                for post_id, count in counters[POSTS].items():
+                    scores[post_id] += count * TRENDING_POST_WEIGHT * decay
+                for post_id, count in counters[COMMENTS].items():
+                    scores[post_id] += count * TRENDING_COMMENT_WEIGHT * decay
+                    comments[post_id] += count
+        best = heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], item[0]))
+        return [{"id": post_id, "score": round(score, 6), "comments": comments[post_id]} for post_id, score in best]
+
+    # Counts the rows added to each database since the last pass (since the start of the
+    # longest window on the first one) and drops buckets that have left every window
+    def catch_up(self):
+        since = datetime.utcfromtimestamp(time.time() - self.max_window)
+        for label, engine in self.databases:
+            with engine.connect() as connection:
+                for kind, (model, post_column) in SOURCES.items():
+                    self._catch_up_table(connection, label, kind, model, post_column, since)
+        with self._lock:
+            self._older, self._recent = self._recent, set()
+            oldest = int((time.time() - self.max_window) // self.bucket_seconds)
+            for bucket in [bucket for bucket in self._buckets if bucket < oldest]:
+                del self._buckets[bucket]
+        self._top_cache.clear()
+
+    def _catch_up_table(self, connection, label, kind, model, post_column, since):
+        mark = self._marks.setdefault(label, {}).get(kind)
+        if mark is None:
+            first = first_id_since(connection, model, since)
+            if first is None:
+                return
+            mark = first - 1
+        while True:
+            rows = connection.execute(
+                select(model.id, post_column, model.timestamp)
+                .where(model.id > mark)
+                .order_by(model.id)
+                .limit(CATCH_UP_BATCH_SIZE)
+            ).all()
+            if not rows:
+                break
+            with self._lock:
+                for row_id, post_id, timestamp in rows:
+                    if timestamp is not None:
+                        self._count(kind, row_id, post_id, epoch(timestamp))
+            mark = rows[-1][0]
+            self._marks[label][kind] = mark
+
+    def snapshot(self):
+        with self._lock:
+            state = {
+                "bucket_seconds": self.bucket_seconds,
+                "marks": self._marks,
+                # Rows routes counted above the marks; a restart's catch-up must not count them again
+                "recent": sorted(self._recent | self._older),
+                "buckets": {
+                    str(bucket): {kind: {str(post_id): count for post_id, count in counter.items()} for kind, counter in counters.items()}
+                    for bucket, counters in self._buckets.items()
+                },
+            }
+            payload = json.dumps(state)
+        temporary = f"{self.snapshot_path}.tmp"
+        with open(temporary, "w") as snapshot_file:
+            snapshot_file.write(payload)
+        os.replace(temporary, self.snapshot_path)
+
+    # Restores the counters from the last snapshot; returns False when there is none to use
+    def load_snapshot(self):
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return False
+        try:
+            with open(self.snapshot_path) as snapshot_file:
+                state = json.load(snapshot_file)
+        except (OSError, ValueError):
+            logger.warning("ignoring unreadable trending snapshot %s", self.snapshot_path)
+            return False
+        if state.get("bucket_seconds") != self.bucket_seconds:
+            return False
+        with self._lock:
+            self._marks = {label: dict(marks) for label, marks in state["marks"].items()}
+            self._recent, self._older = {(kind, row_id) for kind, row_id in state.get("recent", [])}, set()
+            self._buckets = {
+                int(bucket): {kind: Counter({int(post_id): count for post_id, count in counter.items()}) for kind, counter in counters.items()}
+                for bucket, counters in state["buckets"].items()
+            }
+        self._top_cache.clear()
+        return True
+
+    # Startup: the snapshot, if any, then everything written since, read on the background
+    # thread so the app serves requests meanwhile; then keeps up
+    def start(self):
+        self.load_snapshot()
+        self._thread = threading.Thread(target=self._run, name="trending", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        last_snapshot = time.monotonic()
+        wait = 0
+        while not self._stop.wait(wait):
+            wait = TRENDING_SYNC_SECONDS
+            try:
+                self.catch_up()
+                if self.snapshot_path and time.monotonic() - last_snapshot >= TRENDING_SNAPSHOT_SECONDS:
+                    self.snapshot()
+                    last_snapshot = time.monotonic()
+            except Exception:
+                logger.exception("trending catch-up failed")
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self.snapshot_path:
+            # Moves the marks past the rows routes have counted, so the snapshot covers them
+            try:
+                self.catch_up()
+            except Exception:
+                logger.exception("trending catch-up failed")
+            self.snapshot()
@@ -0,0 +1,60 @@
+import argparse
+import asyncio
+import time
+import httpx
+from app.main import app
+from benchmarks.common import temporary_database_path, use_database
+
+# Loading N posts (and N comments) through the per-item endpoints vs the batch endpoints.
+#   python -m benchmarks.batch --items 5000 --batch-size 500
+
+async def run(items, batch_size, concurrency):
+    engine, read_engine = use_database(temporary_database_path())
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        await client.post("/register", json={"username": "bench", "password": "benchpass"})
+        token = (await client.post("/login", data={"username": "bench", "password": "benchpass"})).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        post_id = (await client.post("/posts", json={"title": "Target", "content": "For comments"}, headers=headers)).json()["id"]
+        posts = [{"title": f"Post {i}", "content": f"Body {i} " * 50} for i in range(items)]
+        comments = [{"content": f"Comment {i}"} for i in range(items)]
+
+        async def per_item(path, payloads):
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def send(payload):
+                async with semaphore:
+                    await client.post(path, json=payload, headers=headers)
+
+            await asyncio.gather(*(send(payload) for payload in payloads))
+
+        async def batched(path, payloads):
+            for start in range(0, len(payloads), batch_size):
+                await client.post(path, json=payloads[start:start + batch_size], headers=headers)
+
+        cases = (
+            ("posts per-item", per_item("/posts", posts)),
+            ("posts batch", batched("/posts/batch", posts)),
+            ("comments per-item", per_item(f"/posts/{post_id}/comments", comments)),
+            ("comments batch", batched(f"/posts/{post_id}/comments/batch", comments)),
+        )
+        for name, case in cases:
+            started = time.perf_counter()
+            await case
+            elapsed = time.perf_counter() - started
+            print(f"{name:<18} {items} items in {elapsed:7.2f} s  ({items / elapsed:9.1f} items/s)")
+
+    app.dependency_overrides.clear()
+    engine.dispose()
+    read_engine.dispose()
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-item and batch ingestion")
+    parser.add_argument("--items", type=int, default=5000)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+    asyncio.run(run(args.items, args.batch_size, args.concurrency))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+import os
+import tempfile
+from fastapi import Depends
+from sqlalchemy.orm import sessionmaker
+from app import database, models
+from app.main import app, get_db, get_read_db, get_session, get_read_session, get_read_sessionmaker
+
+# Shared helpers for the benchmark scripts
+
+def percentile(samples, fraction):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+def temporary_database_path():
+    return os.path.join(tempfile.mkdtemp(), "bench.db")
+
+# Points every session dependency of the app at a fresh database file, with the write and
+# read-only engines the app itself builds, pools sized the same. Returns both engines; call
+# app.dependency_overrides.clear() and dispose them after.
+def use_database(path):
+    engine, read_engine = database.build_engines(f"sqlite:///{path}")
+    models.Base.metadata.create_all(bind=engine)
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    read_session_factory = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+
+    def override_get_db():
+        db = session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    def override_get_read_db():
+        db = read_session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    async def override_get_session(db=Depends(override_get_db)):
+        async with database.open_threaded_session(db) as threaded_db:
+            yield threaded_db
+
+    async def override_get_read_session(db=Depends(override_get_read_db)):
+        async with database.open_threaded_session(db) as threaded_db:
+            yield threaded_db
+
+    app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_read_db] = override_get_read_db
+    app.dependency_overrides[get_session] = override_get_session
+    app.dependency_overrides[get_read_session] = override_get_read_session
+    app.dependency_overrides[get_read_sessionmaker] = lambda: read_session_factory
+    return engine, read_engine
@@ -0,0 +1,77 @@
+import argparse
+import asyncio
+import os
+import random
+import time
+import httpx
+from sqlalchemy import create_engine, text
+from app import compression
+from app.main import app
+from benchmarks.common import percentile, temporary_database_path, use_database
+from benchmarks.seed import seed_database
+
+# Database size and read latency with post and comment bodies stored plain, zlib- and
+# zstd-compressed (zstd only when the zstandard package is installed), on the same dataset.
+#   python -m benchmarks.compression --posts 20000 --post-words 1500
+
+def paths(posts, rng):
+    post_id = rng.randrange(posts) + 1
+    return {
+        "GET /posts/{id}": f"/posts/{post_id}",
+        "GET /posts/{id}/comments": f"/posts/{post_id}/comments",
+        "GET /posts?limit=20": "/posts?limit=20",
+        "GET /posts?limit=20&fields=excerpt": "/posts?limit=20&fields=id,title,timestamp,excerpt",
+        "GET /search?query=w3": "/search?query=w3",
+    }
+
+async def measure(posts, requests):
+    rng = random.Random(1)
+    latencies, sizes = {}, {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", headers={"Accept-Encoding": "gzip"}) as client:
+        for _ in range(requests):
+            for name, path in paths(posts, rng).items():
+                started = time.perf_counter()
+                response = await client.get(path)
+                latencies.setdefault(name, []).append(time.perf_counter() - started)
+                sizes.setdefault(name, []).append(response.num_bytes_downloaded)
+    return latencies, sizes
+
+def database_size(path):
+    engine = create_engine(f"sqlite:///{path}")
+    with engine.begin() as connection:
+        connection.execute(text("VACUUM"))
+        connection.execute(text("PRAGMA wal_checkpoint(TRUNCATE)"))
+    engine.dispose()
+    return os.path.getsize(path)
+
+def run(method, args):
+    compression.CONTENT_COMPRESSION = method
+    path = temporary_database_path()
+    started = time.perf_counter()
+    seed_database(path, users=100, posts=args.posts, comments=args.comments, post_words=args.post_words)
+    seeded = time.perf_counter() - started
+    size = database_size(path)
+    engine, read_engine = use_database(path)
+    latencies, sizes = asyncio.run(measure(args.posts, args.requests))
+    app.dependency_overrides.clear()
+    engine.dispose()
+    read_engine.dispose()
+    print(f"{method or 'plain'}: {size / 2**20:.1f} MiB on disk (seeded in {seeded:.1f}s)")
+    for name, samples in latencies.items():
+        print(f"  {name:<36} p50 {percentile(samples, 0.5) * 1000:7.2f} ms  p99 {percentile(samples, 0.99) * 1000:7.2f} ms  "
+              f"{sum(sizes[name]) / len(sizes[name]) / 1024:8.1f} KiB sent")
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare database size and read latency with and without content compression")
+    parser.add_argument("--posts", type=int, default=20000)
+    parser.add_argument("--comments", type=int, default=50000)
+    parser.add_argument("--post-words", type=int, default=1500)
+    parser.add_argument("--requests", type=int, default=300)
+    args = parser.parse_args()
+    methods = ["", "zlib"] + (["zstd"] if compression.zstandard is not None else [])
+    for method in methods:
+        run(method, args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+import httpx
+from fastapi import Depends
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+from app import database, models
+from app.main import app, get_db, get_read_db, get_session, get_read_session
+from benchmarks.common import percentile
+from benchmarks.seed import seed
+
+# Requests per second and latency for the sync (threadpool) and async (aiosqlite) database
+# modes, with the same read mix driven by many concurrent clients.
+#   python -m benchmarks.db_modes --clients 200 --seconds 10
+
+async def client_worker(client, worker, posts, deadline, latencies):
+    i = worker
+    while time.perf_counter() < deadline:
+        post_id = i % posts + 1
+        path = ("/posts", f"/posts/{post_id}", f"/posts/{post_id}/comments")[i % 3]
+        started = time.perf_counter()
+        await client.get(path)
+        latencies.append(time.perf_counter() - started)
+        i += 1
+
+async def drive(clients, seconds, posts):
+    latencies = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        deadline = time.perf_counter() + seconds
+        await asyncio.gather(*(client_worker(client, worker, posts, deadline, latencies) for worker in range(clients)))
+    return latencies
+
+def use_sync_mode(path):
+    engine = database.build_engine(f"sqlite:///{path}", database.DB_READ_POOL_SIZE, database.DB_READ_MAX_OVERFLOW)
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    def override_get_db():
+        db = session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    async def override_get_session(db=Depends(override_get_db)):
+        async with database.open_threaded_session(db) as threaded_db:
+            yield threaded_db
+
+    app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_read_db] = override_get_db
+    app.dependency_overrides[get_session] = override_get_session
+    app.dependency_overrides[get_read_session] = override_get_session
+    return engine.dispose
+
+def use_async_mode(path):
+    engine = database.build_async_engine(f"sqlite:///{path}", database.DB_READ_POOL_SIZE, database.DB_READ_MAX_OVERFLOW)
+    session_factory = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
+
+    async def override_get_session():
+        async with session_factory() as db:
+            yield db
+
+    app.dependency_overrides[get_session] = override_get_session
+    app.dependency_overrides[get_read_session] = override_get_session
+    # Closes the aiosqlite connections; the sync_engine's dispose() would only drop the pool
+    return lambda: asyncio.run(engine.dispose())
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the sync and async database modes")
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--posts", type=int, default=1000)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, "bench.db")
+    engine = create_engine(f"sqlite:///{path}")
+    models.Base.metadata.create_all(bind=engine)
+    seed(engine, users=1, posts=args.posts, comments=args.posts * 5)
+    engine.dispose()
+
+    for mode, use_mode in (("sync", use_sync_mode), ("async", use_async_mode)):
+        dispose = use_mode(path)
+        latencies = asyncio.run(drive(args.clients, args.seconds, args.posts))
+        app.dependency_overrides.clear()
+        dispose()
+        print(f"{mode:<6} clients={args.clients}  {len(latencies) / args.seconds:8.1f} req/s  "
+              f"p50 {percentile(latencies, 0.5) * 1000:7.1f} ms  p99 {percentile(latencies, 0.99) * 1000:7.1f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+import argparse
+import asyncio
+import time
+import httpx
+from sqlalchemy.orm import sessionmaker
+from app import group_commit
+from app.main import app, get_writer
+from benchmarks.common import percentile, temporary_database_path, use_database
+
+# Comment storm: many clients posting comments at once, with one commit per request
+# ("direct") and with the group-commit writer ("group").
+#   python -m benchmarks.group_commit --clients 32 --seconds 10
+#   SQLITE_SYNCHRONOUS=FULL python -m benchmarks.group_commit   # a sync on every commit
+
+async def client_worker(client, headers, post_id, deadline, latencies, failures):
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            response = await client.post(f"/posts/{post_id}/comments", json={"content": "storm"}, headers=headers)
+            status_code = response.status_code
+        except Exception as exc:  # e.g. a pool timeout raised through the ASGI transport
+            status_code = type(exc).__name__
+        latencies.append(time.perf_counter() - started)
+        if status_code != 200:
+            failures.append(status_code)
+
+async def storm(clients, seconds):
+    latencies, failures = [], []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+        await client.post("/register", json={"username": "bench", "password": "benchpass"})
+        token = (await client.post("/login", data={"username": "bench", "password": "benchpass"})).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        post_id = (await client.post("/posts", json={"title": "Target", "content": "Storm"}, headers=headers)).json()["id"]
+        deadline = time.perf_counter() + seconds
+        await asyncio.gather(*(client_worker(client, headers, post_id, deadline, latencies, failures) for _ in range(clients)))
+    return latencies, failures
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare per-request commits with group commit")
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--window-ms", type=float, default=group_commit.GROUP_COMMIT_WINDOW_MS)
+    parser.add_argument("--max-rows", type=int, default=group_commit.GROUP_COMMIT_MAX_ROWS)
+    args = parser.parse_args()
+
+    for mode in ("direct", "group"):
+        engine, read_engine = use_database(temporary_database_path())
+        writer = None
+        if mode == "group":
+            writer = group_commit.GroupCommitWriter(sessionmaker(autoflush=False, bind=engine), args.window_ms, args.max_rows)
+        app.dependency_overrides[get_writer] = lambda: writer
+        latencies, failures = asyncio.run(storm(args.clients, args.seconds))
+        app.dependency_overrides.clear()
+        groups = ""
+        if writer is not None:
+            writer.shutdown()
+            groups = f"  {writer.rows / max(writer.commits, 1):6.1f} rows/commit"
+        engine.dispose()
+        read_engine.dispose()
+        print(f"{mode:<7} clients={args.clients}  {len(latencies) / args.seconds:8.1f} comments/s  "
+              f"p50 {percentile(latencies, 0.5) * 1000:7.1f} ms  p99 {percentile(latencies, 0.99) * 1000:7.1f} ms  "
+              f"failed {len(failures)}{groups}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import sys
+import time
+import httpx
+from app import database
+from app.main import app
+from benchmarks.common import percentile, temporary_database_path, use_database
+from benchmarks.seed import PASSWORD, seed_database, username, words
+
+# Load generator for the whole API: a weighted mix of requests from concurrent clients against
+# a seeded database, with throughput and p50/p95/p99 latency per endpoint.
+#   python -m benchmarks.load --posts 100000 --comments 500000 --seconds 30 --output results.json
+#   python -m benchmarks.load ... --baseline baseline.json   # exits 1 on a regression
+# By default the app runs in-process through httpx's ASGI transport on a fresh seeded database.
+# To measure a real server instead, seed a file, start uvicorn on it and pass --base-url:
+#   python -m benchmarks.seed bench.db --posts 100000
+#   DATABASE_URL=sqlite:///./bench.db uvicorn app.main:app --workers 4
+#   python -m benchmarks.load --base-url http://127.0.0.1:8000 --posts 100000
+
+# Relative weight of each endpoint in the mix, keyed by route template
+MIX = {
+    "GET /posts": 30,
+    "GET /posts/{post_id}": 25,
+    "GET /posts/{post_id}/comments": 15,
+    "GET /feed": 10,
+    "GET /search": 10,
+    "POST /posts": 8,
+    "POST /login": 2,
+}
+
+def build_request(endpoint, rng, users, posts, headers):
+    post_id = rng.randrange(posts) + 1
+    if endpoint == "GET /posts":
+        return "GET", "/posts", {"params": {"limit": 20}}
+    if endpoint == "GET /posts/{post_id}":
+        return "GET", f"/posts/{post_id}", {}
+    if endpoint == "GET /posts/{post_id}/comments":
+        return "GET", f"/posts/{post_id}/comments", {"params": {"limit": 20}}
+    if endpoint == "GET /feed":
+        return "GET", "/feed", {}
+    if endpoint == "GET /search":
+        return "GET", "/search", {"params": {"query": words(rng, 1)}}
+    if endpoint == "POST /posts":
+        return "POST", "/posts", {"json": {"title": words(rng, 6), "content": words(rng, 120)}, "headers": headers}
+    if endpoint == "POST /login":
+        return "POST", "/login", {"data": {"username": username(rng.randrange(users)), "password": PASSWORD}}
+    raise ValueError(f"Unknown endpoint {endpoint!r}")
+
+async def client_worker(client, worker, mix, args, headers, deadline, samples):
+    rng = random.Random(args.seed * 1000 + worker)
+    endpoints, weights = list(mix), list(mix.values())
+    while time.perf_counter() < deadline:
+        endpoint = rng.choices(endpoints, weights=weights)[0]
+        method, url, options = build_request(endpoint, rng, args.users, args.posts, headers)
+        started = time.perf_counter()
+        response = await client.request(method, url, **options)
+        latencies, errors = samples[endpoint]
+        latencies.append(time.perf_counter() - started)
+        if response.status_code >= 400:
+            errors.append(response.status_code)
+
+async def drive(client, mix, args):
+    token = (await client.post("/login", data={"username": username(0), "password": PASSWORD})).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    if args.warmup:
+        deadline = time.perf_counter() + args.warmup
+        warmup = {endpoint: ([], []) for endpoint in mix}
+        await asyncio.gather(*(client_worker(client, worker, mix, args, headers, deadline, warmup) for worker in range(args.clients)))
+
+    samples = {endpoint: ([], []) for endpoint in mix}
+    started = time.perf_counter()
+    deadline = started + args.seconds
+    await asyncio.gather(*(client_worker(client, worker, mix, args, headers, deadline, samples) for worker in range(args.clients)))
+    return samples, time.perf_counter() - started
+
+def summarize(samples, elapsed):
+    endpoints = {}
+    for endpoint, (latencies, errors) in samples.items():
+        endpoints[endpoint] = {
+            "requests": len(latencies),
+            "errors": len(errors),
+            "rps": round(len(latencies) / elapsed, 2),
+            "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+            "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        }
+    return endpoints
+
+# Regressions of `results` against `baseline`: a latency percentile that grew, or a throughput
+# that fell, by more than `tolerance` (a fraction). Endpoints missing from either side are skipped.
+def compare(results, baseline, tolerance=0.10):
+    regressions = []
+    for endpoint, current in results["endpoints"].items():
+        previous = baseline["endpoints"].get(endpoint)
+        if not previous or not previous["requests"] or not current["requests"]:
+            continue
+        for metric in ("p50_ms", "p95_ms", "p99_ms"):
+            if current[metric] > previous[metric] * (1 + tolerance):
+                regressions.append((endpoint, metric, previous[metric], current[metric]))
+        if current["rps"] < previous["rps"] * (1 - tolerance):
+            regressions.append((endpoint, "rps", previous["rps"], current["rps"]))
+    return regressions
+
+def print_report(results, baseline=None):
+    print(f"{'endpoint':<32} {'requests':>9} {'errors':>7} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for endpoint, row in results["endpoints"].items():
+        line = (f"{endpoint:<32} {row['requests']:>9} {row['errors']:>7} {row['rps']:>9.1f} "
+                f"{row['p50_ms']:>9.2f} {row['p95_ms']:>9.2f} {row['p99_ms']:>9.2f}")
+        previous = baseline["endpoints"].get(endpoint) if baseline else None
+        if previous and previous["p95_ms"]:
+            line += f"   p95 {(row['p95_ms'] / previous['p95_ms'] - 1) * 100:+.1f}%"
+        print(line)
+
+async def run(args, mix):
+    if args.base_url:
+        async with httpx.AsyncClient(base_url=args.base_url, timeout=60) as client:
+            return await drive(client, mix, args)
+
+    path = args.database or temporary_database_path()
+    if not args.database or not os.path.exists(path):
+        seed_database(path, args.users, args.posts, args.comments, random_seed=args.seed)
+    engine, read_engine = use_database(path)
+    try:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+            return await drive(client, mix, args)
+    finally:
+        app.dependency_overrides.clear()
+        engine.dispose()
+        read_engine.dispose()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the API against a seeded dataset")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--posts", type=int, default=10000)
+    parser.add_argument("--comments", type=int, default=50000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--database", help="Seeded database file to reuse (created if missing)")
+    parser.add_argument("--base-url", help="Drive a running server instead of the in-process app")
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--warmup", type=float, default=2)
+    parser.add_argument("--only", nargs="+", metavar="ENDPOINT", help=f"Endpoints to include, from: {', '.join(MIX)}")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--baseline", help="Compare with the JSON results of an earlier run")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Allowed slowdown before a regression (fraction)")
+    args = parser.parse_args(argv)
+
+    mix = {endpoint: weight for endpoint, weight in MIX.items() if not args.only or endpoint in args.only}
+    if not mix:
+        parser.error("--only matched no endpoints")
+
+    samples, elapsed = asyncio.run(run(args, mix))
+    results = {
+        "meta": {
+            "target": args.base_url or "asgi",
+            "db_mode": database.DB_MODE,
+            "python": platform.python_version(),
+            "clients": args.clients,
+            "seconds": round(elapsed, 3),
+            "users": args.users,
+            "posts": args.posts,
+            "comments": args.comments,
+            "seed": args.seed,
+        },
+        "endpoints": summarize(samples, elapsed),
+    }
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_report(results, baseline)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if baseline:
+        regressions = compare(results, baseline, args.tolerance)
+        for endpoint, metric, previous, current in regressions:
+            print(f"REGRESSION {endpoint} {metric}: {previous} -> {current}")
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+import httpx
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from benchmarks.common import percentile
+
+# Login throughput under concurrency, with a probe on GET / to show other endpoints stay responsive.
+#   BCRYPT_ROUNDS=12 HASH_WORKERS=4 python -m benchmarks.login --clients 32 --seconds 10
+# Run it once per setting to compare hashing pool sizes or bcrypt costs.
+
+async def login_worker(client, username, deadline, latencies, statuses):
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        response = await client.post("/login", data={"username": username, "password": "benchpass"})
+        latencies.append(time.perf_counter() - started)
+        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+async def probe_worker(client, deadline, latencies):
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        await client.get("/")
+        latencies.append(time.perf_counter() - started)
+        await asyncio.sleep(0.01)
+
+async def run(clients, seconds):
+    from app.main import app, get_db
+    from app import models
+
+    directory = tempfile.mkdtemp()
+    engine = create_engine(f"sqlite:///{os.path.join(directory, 'bench.db')}", connect_args={"check_same_thread": False})
+    models.Base.metadata.create_all(bind=engine)
+    session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    def override_get_db():
+        db = session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_db] = override_get_db
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for i in range(clients):
+            await client.post("/register", json={"username": f"user{i}", "password": "benchpass"})
+
+        login_latencies, probe_latencies, statuses = [], [], {}
+        deadline = time.perf_counter() + seconds
+        workers = [login_worker(client, f"user{i}", deadline, login_latencies, statuses) for i in range(clients)]
+        await asyncio.gather(probe_worker(client, deadline, probe_latencies), *workers)
+
+    app.dependency_overrides.pop(get_db, None)
+    engine.dispose()
+
+    ok = statuses.get(200, 0)
+    print(f"clients={clients} seconds={seconds}")
+    print(f"logins/s      {ok / seconds:10.1f}   statuses {dict(sorted(statuses.items()))}")
+    print(f"login latency p50 {percentile(login_latencies, 0.5) * 1000:8.1f} ms  "
+          f"p99 {percentile(login_latencies, 0.99) * 1000:8.1f} ms")
+    if probe_latencies:
+        print(f"GET /  latency p50 {statistics.median(probe_latencies) * 1000:8.1f} ms  "
+              f"p99 {percentile(probe_latencies, 0.99) * 1000:8.1f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description="Login throughput benchmark")
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--seconds", type=float, default=10)
+    args = parser.parse_args()
+    asyncio.run(run(args.clients, args.seconds))
+
+if __name__ == "__main__":
+    main()
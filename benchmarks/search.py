@@ -0,0 +1,59 @@
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app import models, search
+from app.database import ThreadedSession
+from benchmarks.seed import seed
+
+# Compares the FTS5 search path with the old LIKE '%q%' scan.
+#   python -m benchmarks.search --posts 100000 1000000
+
+QUERIES = ["w3", "w250", "w4000", "w30000", "w10 w20", "nomatch"]
+
+# The pre-FTS /search: unbounded LIKE over both columns, every match loaded
+async def like_unbounded(db, query, skip, limit):
+    return await db.run_sync(lambda session: session.query(models.Post).filter(
+        models.Post.title.contains(query) | models.Post.content.contains(query)
+    ).all())
+
+async def time_queries(session_factory, search_fn, repeat):
+    timings = []
+    for query in QUERIES:
+        for _ in range(repeat):
+            db = ThreadedSession(session_factory())
+            started = time.perf_counter()
+            await search_fn(db, query, 0, 10)
+            timings.append(time.perf_counter() - started)
+            await db.close()
+    return timings
+
+def run(count, repeat):
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(f"sqlite:///{os.path.join(directory, 'bench.db')}")
+        models.Base.metadata.create_all(bind=engine)
+        seeded = time.perf_counter()
+        seed(engine, users=1, posts=count, comments=0)
+        seeded = time.perf_counter() - seeded
+        session_factory = sessionmaker(bind=engine)
+        paths = (("like (unbounded)", like_unbounded), ("like limit 10", search.like_search), ("fts5 bm25", search.search_posts))
+        for name, fn in paths:
+            timings = asyncio.run(time_queries(session_factory, fn, repeat))
+            print(f"{count:>9} posts  {name:<16} mean {statistics.mean(timings) * 1000:9.2f} ms  "
+                  f"max {max(timings) * 1000:9.2f} ms  (seeded in {seeded:.1f}s)")
+        engine.dispose()
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare FTS5 search with the LIKE scan")
+    parser.add_argument("--posts", type=int, nargs="+", default=[100000, 1000000])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    for count in args.posts:
+        run(count, args.repeat)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+import argparse
+import random
+import time
+from array import array
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine, insert
+from app import auth, database, migrations, models, search
+
+# Deterministic datasets for the benchmarks: the same arguments always give the same rows.
+#   python -m benchmarks.seed bench.db --users 1000 --posts 1000000 --comments 5000000
+# Every user is "user<N>" with the password "benchpass".
+
+PASSWORD = "benchpass"
+START = datetime(2024, 1, 1)
+
+# A synthetic vocabulary with a Zipf-like frequency curve, so common words match many posts
+# and rare ones match a handful, as in real text
+VOCABULARY = [f"w{i}" for i in range(50000)]
+CUMULATIVE = []
+for rank in range(len(VOCABULARY)):
+    CUMULATIVE.append(1 / (rank + 1) + (CUMULATIVE[-1] if CUMULATIVE else 0))
+
+def words(rng, k):
+    return " ".join(rng.choices(VOCABULARY, cum_weights=CUMULATIVE, k=k))
+
+def username(i):
+    return f"user{i}"
+
+def seed(engine, users, posts, comments, random_seed=42, batch_size=10000, post_words=120):
+    rng = random.Random(random_seed)
+    # One bcrypt hash shared by every user; hashing per user would dominate the seeding time
+    hashed_password = auth.pwd_context.hash(PASSWORD)
+
+    # Comment targets are drawn up front so each post is inserted with its final comment_count
+    targets = array("l", (rng.randrange(posts) + 1 for _ in range(comments))) if posts else array("l")
+    counts = array("l", [0]) * posts
+    for post_id in targets:
+        counts[post_id - 1] += 1
+
+    with engine.begin() as connection:
+        for offset in range(0, users, batch_size):
+            connection.execute(insert(models.User), [
+                {"username": username(i), "hashed_password": hashed_password}
+                for i in range(offset, min(offset + batch_size, users))
+            ])
+        for offset in range(0, posts, batch_size):
+            connection.execute(insert(models.Post), [
+                {
+                    "title": words(rng, 6),
+                    "content": words(rng, post_words),
+                    "timestamp": START + timedelta(seconds=i),
+                    "author_id": rng.randrange(users) + 1,
+                    "comment_count": counts[i],
+                }
+                for i in range(offset, min(offset + batch_size, posts))
+            ])
+        for offset in range(0, comments, batch_size):
+            connection.execute(insert(models.Comment), [
+                {
+                    "content": words(rng, 20),
+                    "timestamp": START + timedelta(seconds=posts + i),
+                    "post_id": targets[i],
+                    "author_id": rng.randrange(users) + 1,
+                }
+                for i in range(offset, min(offset + batch_size, comments))
+            ])
+
+# Creates (or brings up to date) the schema at `path` and fills it
+def seed_database(path, users, posts, comments, random_seed=42, post_words=120):
+    url = f"sqlite:///{path}"
+    engine = database.configure_engine(create_engine(url), url)
+    migrations.upgrade(engine)
+    search.ensure_index(engine)
+    seed(engine, users, posts, comments, random_seed=random_seed, post_words=post_words)
+    engine.dispose()
+
+def main():
+    parser = argparse.ArgumentParser(description="Fill a SQLite database with a deterministic benchmark dataset")
+    parser.add_argument("path")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--posts", type=int, default=10000)
+    parser.add_argument("--comments", type=int, default=50000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--post-words", type=int, default=120, help="Words per post body")
+    args = parser.parse_args()
+    started = time.perf_counter()
+    seed_database(args.path, args.users, args.posts, args.comments, random_seed=args.seed, post_words=args.post_words)
+    print(f"Seeded {args.users} users, {args.posts} posts and {args.comments} comments "
+          f"in {time.perf_counter() - started:.1f}s")
+
+if __name__ == "__main__":
+    main()
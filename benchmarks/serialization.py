@@ -0,0 +1,71 @@
+import argparse
+import json
+import time
+from datetime import datetime, timedelta
+from typing import List
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.orm import Session
+from app import models, schemas, serialization
+
+# Cost of turning a page of posts into a JSON body, per response size:
+#   orm+v1-style  ORM objects, validated to the response model, jsonable_encoder + stdlib json
+#   orm+v2        ORM objects, from_attributes validation and Pydantic's own JSON encoder
+#   rows+fast     column tuples encoded directly (orjson when installed), as the list routes do
+#   python -m benchmarks.serialization --sizes 10 100 1000
+
+def seed(engine, count):
+    start = datetime(2024, 1, 1)
+    with engine.begin() as connection:
+        connection.execute(insert(models.User), [{"username": "bench", "hashed_password": "x"}])
+        connection.execute(insert(models.Post), [
+            {"title": f"Post {i}", "content": f"Body of post {i} " * 40, "timestamp": start + timedelta(seconds=i), "author_id": 1}
+            for i in range(count)
+        ])
+
+def best_of(fn, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description="Serialization cost per response size")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    engine = create_engine("sqlite://")
+    models.Base.metadata.create_all(bind=engine)
+    seed(engine, max(args.sizes))
+    adapter = TypeAdapter(List[schemas.Post])
+    fields = list(schemas.Post.model_fields)
+    columns = serialization.columns_for(models.Post, schemas.Post)
+    print(f"encoder: {'orjson' if serialization.orjson else 'json'}")
+
+    with Session(engine) as session:
+        for size in args.sizes:
+            def orm_v1():
+                posts = session.scalars(select(models.Post).limit(size)).all()
+                return json.dumps(jsonable_encoder([schemas.Post.model_validate(post) for post in posts])).encode()
+
+            def orm_v2():
+                posts = session.scalars(select(models.Post).limit(size)).all()
+                return adapter.dump_json(adapter.validate_python(posts, from_attributes=True))
+
+            def rows_fast():
+                rows = session.execute(select(*columns).limit(size)).all()
+                return serialization.dumps(serialization.rows_to_dicts(rows, fields))
+
+            results = []
+            for name, fn in (("orm+v1-style", orm_v1), ("orm+v2", orm_v2), ("rows+fast", rows_fast)):
+                session.expunge_all()
+                results.append((name, best_of(lambda: (fn(), session.expunge_all()), args.repeat)))
+            print(f"{size:>6} posts  " + "  ".join(f"{name} {seconds * 1000:8.2f} ms" for name, seconds in results))
+    engine.dispose()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from benchmarks.common import temporary_database_path
+from benchmarks.seed import seed_database
+
+# Cold start of one server process on a seeded database: the time to import app.main, to run
+# the app's startup, and to answer the first request, each measured in a fresh interpreter.
+#   python -m benchmarks.startup --posts 100000 --comments 500000
+# With gunicorn --preload the import happens once in the master, so each worker pays only
+# the startup and the first request.
+
+PROBE = """
+import json, time
+from fastapi.testclient import TestClient
+started = time.perf_counter()
+from app.main import app
+imported = time.perf_counter()
+with TestClient(app) as client:
+    ready = time.perf_counter()
+    response = client.get("/posts?limit=10")
+    answered = time.perf_counter()
+assert response.status_code == 200, response.text
+print(json.dumps({"import": imported - started, "startup": ready - imported, "first_request": answered - ready}))
+"""
+
+def probe(path):
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{path}")
+    output = subprocess.run([sys.executable, "-c", PROBE], env=env, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure import time and time to first request of a fresh process")
+    parser.add_argument("database", nargs="?", help="Seeded database to start on (default: a new temporary one)")
+    parser.add_argument("--posts", type=int, default=100000)
+    parser.add_argument("--comments", type=int, default=500000)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    path = args.database or temporary_database_path()
+    if not os.path.exists(path):
+        seed_database(path, users=100, posts=args.posts, comments=args.comments)
+    probe(path)  # warms the OS file cache and applies any pending migrations
+    runs = [probe(path) for _ in range(args.runs)]
+    for phase in ("import", "startup", "first_request"):
+        samples = [run[phase] * 1000 for run in runs]
+        print(f"{phase:<14} median {statistics.median(samples):8.1f} ms  min {min(samples):8.1f} ms")
+    total = [sum(run.values()) * 1000 for run in runs]
+    worker = [(run["startup"] + run["first_request"]) * 1000 for run in runs]
+    print(f"{'to first reply':<14} median {statistics.median(total):8.1f} ms  (preloaded worker: {statistics.median(worker):.1f} ms)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+import os
+import pytest
+
+# Cheap bcrypt for the test suite; must be set before the app is imported
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy import create_engine  # noqa: E402
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+from sqlalchemy.pool import NullPool  # noqa: E402
+from app import auth, database, models  # noqa: E402
+from app.main import create_app, get_read_session, get_read_sessionmaker, get_session  # noqa: E402
+from app.settings import Settings  # noqa: E402
+
+# The app under test, on its own database; app_lifespan below runs its startup once per session.
+# The trending tests bring their own ranker.
+SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
+app = create_app(Settings(database_url=SQLALCHEMY_DATABASE_URL, trending=False))
+
+# A separate connection to the test database, for setting up and checking rows directly
+engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# The engines the app itself queries through, for tests that watch its statements
+def app_engines():
+    return [database.engine, database.read_engine]
+
+client = TestClient(app)
+
+# Starts the shared test app (database, migrations, background workers) for the whole run
+@pytest.fixture(scope="session", autouse=True)
+def app_lifespan():
+    with client:
+        yield
+
+@pytest.fixture(autouse=True)
+def setup_db():
+    # Create the database tables
+    models.Base.metadata.create_all(bind=engine)
+    auth.principal_cache.clear()
+    yield
+    # Drop the database tables after tests
+    models.Base.metadata.drop_all(bind=engine)
+
+# Fixtures for test data
+@pytest.fixture
+def test_user():
+    return {
+        "username": "William",
+        "password": "williampass"
+    }
+
+@pytest.fixture
+def test_post():
+    return {
+        "title": "Hey All",
+        "content": "Nice To Meet You!!!!."
+    }
+
+@pytest.fixture
+def test_comment():
+    return {
+        "content":"good post"
+    }
+
+@pytest.fixture
+def get_access_token(test_user):
+    # Register the user
+    client.post("/register", json=test_user)
+
+    # Login to get an access token
+    response = client.post("/login", data={"username": test_user["username"], "password": test_user["password"]})
+    return response.json()["access_token"]
+
+# Run the async routes against a real AsyncSession on aiosqlite, as DB_MODE=async does
+@pytest.fixture
+def async_session():
+    async_engine = create_async_engine(SQLALCHEMY_DATABASE_URL.replace("sqlite://", "sqlite+aiosqlite://", 1), poolclass=NullPool)
+    session_factory = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+    async def override_get_session():
+        async with session_factory() as db:
+            yield db
+
+    app.dependency_overrides[get_session] = override_get_session
+    app.dependency_overrides[get_read_session] = override_get_session
+    app.dependency_overrides[get_read_sessionmaker] = lambda: session_factory
+    yield
+    app.dependency_overrides.pop(get_session, None)
+    app.dependency_overrides.pop(get_read_session, None)
+    app.dependency_overrides.pop(get_read_sessionmaker, None)
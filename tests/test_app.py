@@ -0,0 +1,97 @@
+import os
+import subprocess
+import sys
+import pytest
+from sqlalchemy import create_engine, text
+from app import database
+from tests.test_migrations import legacy_engine
+
+# In a fresh interpreter: the shared test app already holds this process's databases
+def run_python(code):
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, cwd=os.path.dirname(os.path.dirname(__file__)))
+    assert result.returncode == 0, result.stderr
+    return result.stdout.strip()
+
+def test_import_opens_no_database_and_starts_no_threads():
+    output = run_python(
+        "import threading\n"
+        "from app import database, main\n"
+        "print(database.engine is None, threading.active_count())\n"
+    )
+    assert output == "True 1"
+
+def test_startup_migrates_and_shutdown_disposes(tmp_path):
+    output = run_python(
+        "from fastapi.testclient import TestClient\n"
+        "from app import database, migrations\n"
+        "from app.main import create_app\n"
+        "from app.settings import Settings\n"
+        f"app = create_app(Settings(database_url='sqlite:///{tmp_path / 'fresh.db'}', trending=True))\n"
+        "with TestClient(app) as client:\n"
+        "    assert client.get('/posts').json() == []\n"
+        "    assert app.state.trending_ranker is not None\n"
+        "    assert all(applied for _, applied in migrations.status(database.engine))\n"
+        "print(database.engine is None, app.state.trending_ranker is None)\n"
+    )
+    assert output == "True True"
+
+def test_startup_can_leave_the_schema_alone(tmp_path):
+    output = run_python(
+        "from fastapi.testclient import TestClient\n"
+        "from sqlalchemy import inspect\n"
+        "from app import database\n"
+        "from app.main import create_app\n"
+        "from app.settings import Settings\n"
+        f"app = create_app(Settings(database_url='sqlite:///{tmp_path / 'empty.db'}', migrate_on_startup=False, trending=False))\n"
+        "with TestClient(app):\n"
+        "    print(inspect(database.engine).get_table_names())\n"
+    )
+    assert output == "[]"
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs os.fork")
+def test_forked_child_gets_its_own_connections(tmp_path):
+    engine = database.build_engine(f"sqlite:///{tmp_path / 'fork.db'}", pool_size=1, max_overflow=0)
+    with engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+    parent_pool = engine.pool
+    assert parent_pool.checkedin() == 1
+
+    pid = os.fork()
+    if pid == 0:
+        # The inherited connection is left to the parent; the child opens a new one
+        ok = engine.pool is not parent_pool and engine.pool.checkedin() == 0
+        with engine.connect() as connection:
+            ok = ok and connection.execute(text("SELECT 1")).scalar() == 1
+        os._exit(0 if ok else 1)
+    _, wait_status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(wait_status) == 0
+
+    assert engine.pool is parent_pool
+    with engine.connect() as connection:
+        assert connection.execute(text("SELECT 1")).scalar() == 1
+    engine.dispose()
+
+def test_migrate_command_prepares_the_schema_startup_skips(tmp_path):
+    legacy_engine(tmp_path).dispose()
+    shards = [f"sqlite:///{tmp_path / f'shard{i}.db'}" for i in range(2)]
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{tmp_path / 'legacy.db'}")
+    for environment in (env, dict(env, SHARD_URLS=",".join(shards))):
+        result = subprocess.run([sys.executable, "-m", "app.cli", "migrate"], env=environment, capture_output=True, text=True, cwd=os.path.dirname(os.path.dirname(__file__)))
+        assert result.returncode == 0, result.stderr
+
+    output = run_python(
+        "from fastapi.testclient import TestClient\n"
+        "from app.main import create_app\n"
+        "from app.settings import Settings\n"
+        f"app = create_app(Settings(database_url='sqlite:///{tmp_path / 'legacy.db'}', migrate_on_startup=False, trending=False))\n"
+        "with TestClient(app) as client:\n"
+        "    response = client.get('/search', params={'query': 'title', 'limit': 500})\n"
+        "    assert response.status_code == 200, response.text\n"
+        "    print(len(response.json()))\n"
+    )
+    assert output == "500"
+    for url in shards:
+        engine = create_engine(url)
+        with engine.connect() as connection:
+            assert connection.execute(text("SELECT count(*) FROM shard_sequences")).scalar() == 2
+        engine.dispose()
@@ -0,0 +1,16 @@
+from tests.conftest import client
+
+def test_async_session_round_trip(async_session, test_post, test_comment, get_access_token):
+    headers = {"Authorization": f"Bearer {get_access_token}"}
+    post_id = client.post("/posts", json=test_post, headers=headers).json()["id"]
+
+    assert client.get(f"/posts/{post_id}").json()["title"] == test_post["title"]
+    assert client.put(f"/posts/{post_id}", json={"title": "Async", "content": "Body"}, headers=headers).status_code == 200
+    assert client.post(f"/posts/{post_id}/comments", json=test_comment, headers=headers).status_code == 200
+    assert len(client.get(f"/posts/{post_id}/comments").json()) == 1
+    assert [post["id"] for post in client.get("/posts").json()] == [post_id]
+    assert [post["id"] for post in client.get("/search?query=async").json()] == [post_id]
+    assert [line for line in client.get("/export/posts").text.splitlines()] != []
+    assert len(client.get(f"/export/posts/{post_id}/comments").text.splitlines()) == 1
+    assert client.delete(f"/posts/{post_id}", headers=headers).status_code == 200
+    assert client.get(f"/posts/{post_id}").status_code == 404
@@ -0,0 +1,22 @@
+from app import batch, models
+from tests.conftest import TestingSessionLocal
+
+# A row the database rejects only fails itself; the rest of the batch is still inserted
+def test_insert_rows_isolates_database_errors():
+    db = TestingSessionLocal()
+    db.add(models.User(username="writer", hashed_password="x"))
+    db.commit()
+    rows = [
+        (0, {"title": "ok", "content": "first", "author_id": 1}),
+        (1, {"title": None, "content": "no title", "author_id": 1}),
+        (2, {"title": "ok", "content": "third", "author_id": 1}),
+    ]
+    created, errors = batch.insert_rows(db, models.Post, rows)
+    db.commit()
+
+    assert sorted(created) == [0, 2]
+    assert "NOT NULL" in errors[1]
+    assert db.query(models.Post).count() == 2
+    result = batch.results(3, created, errors)
+    assert (result["created"], result["failed"]) == (2, 1)
+    db.close()
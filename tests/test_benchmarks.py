@@ -0,0 +1,40 @@
+from sqlalchemy import create_engine, text
+from benchmarks.load import compare
+from benchmarks.seed import seed_database
+
+def dump(path):
+    engine = create_engine(f"sqlite:///{path}")
+    with engine.connect() as connection:
+        rows = {
+            table: connection.execute(text(f"SELECT * FROM {table} ORDER BY id")).all()
+            for table in ("users", "posts", "comments")
+        }
+        mismatched = connection.execute(text(
+            "SELECT count(*) FROM posts WHERE comment_count != "
+            "(SELECT count(*) FROM comments WHERE comments.post_id = posts.id)"
+        )).scalar()
+    engine.dispose()
+    return rows, mismatched
+
+def test_seed_is_deterministic(tmp_path):
+    seed_database(tmp_path / "a.db", users=5, posts=50, comments=200)
+    seed_database(tmp_path / "b.db", users=5, posts=50, comments=200)
+    first, mismatched = dump(tmp_path / "a.db")
+    second, _ = dump(tmp_path / "b.db")
+
+    assert [len(first[table]) for table in ("users", "posts", "comments")] == [5, 50, 200]
+    # Password hashes are salted; every other column must match row for row
+    assert [row[:2] for row in first["users"]] == [row[:2] for row in second["users"]]
+    assert first["posts"] == second["posts"]
+    assert first["comments"] == second["comments"]
+    assert mismatched == 0
+
+def test_compare_reports_regressions():
+    def results(p95, rps):
+        return {"endpoints": {"GET /posts": {"requests": 100, "p50_ms": 1.0, "p95_ms": p95, "p99_ms": 5.0, "rps": rps}}}
+
+    assert compare(results(2.1, 95), results(2.0, 100), tolerance=0.10) == []
+    assert compare(results(3.0, 80), results(2.0, 100), tolerance=0.10) == [
+        ("GET /posts", "p95_ms", 2.0, 3.0),
+        ("GET /posts", "rps", 100, 80),
+    ]
@@ -0,0 +1,136 @@
+import asyncio
+import json
+import time
+import httpx
+from app import broadcast
+from tests.conftest import app, client
+
+# Drives one streaming request straight through the ASGI app, as a connected client would
+class Stream:
+    def __init__(self, path, last_event_id=None):
+        self.status = None
+        self.body = b""
+        self._disconnected = asyncio.Event()
+        headers = [(b"host", b"test")]
+        if last_event_id is not None:
+            headers.append((b"last-event-id", str(last_event_id).encode()))
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+            "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "", "query_string": b"",
+            "headers": headers, "client": ("test", 1), "server": ("test", 80),
+        }
+        self.task = asyncio.create_task(app(scope, self._receive, self._send))
+
+    async def _receive(self):
+        await self._disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def _send(self, message):
+        if message["type"] == "http.response.start":
+            self.status = message["status"]
+        elif message["type"] == "http.response.body":
+            self.body += message.get("body", b"")
+
+    def events(self):
+        events = []
+        for block in self.body.decode().split("\n\n"):
+            fields = dict(line.split(": ", 1) for line in block.splitlines() if line and not line.startswith(":"))
+            if fields:
+                events.append((int(fields["id"]), fields["event"], json.loads(fields["data"])))
+        return events
+
+    async def close(self):
+        self._disconnected.set()
+        await self.task
+
+async def wait_for(condition, timeout=60):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+def create_post(token, post):
+    return client.post("/posts", json=post, headers={"Authorization": f"Bearer {token}"}).json()
+
+def test_slow_consumers_are_disconnected_or_skipped():
+    async def scenario():
+        disconnecting = broadcast.Broadcaster(queue_size=2, slow_consumer="disconnect")
+        subscription = disconnecting.subscribe("t")
+        for i in range(3):
+            disconnecting.publish("t", {"id": i})
+        assert await subscription.get() is broadcast.CLOSED
+        assert disconnecting.subscribers() == 0
+
+        dropping = broadcast.Broadcaster(queue_size=2, slow_consumer="drop")
+        subscription = dropping.subscribe("t")
+        for i in range(3):
+            dropping.publish("t", {"id": i})
+        assert [await subscription.get(), await subscription.get()] == [{"id": 0}, {"id": 1}]
+        assert subscription.dropped == 1 and dropping.subscribers("t") == 1
+    asyncio.run(scenario())
+
+def test_comment_stream_resumes_from_last_event_id(get_access_token, test_post):
+    headers = {"Authorization": f"Bearer {get_access_token}"}
+    post_id = create_post(get_access_token, test_post)["id"]
+    first, second = (client.post(f"/posts/{post_id}/comments", json={"content": text}, headers=headers).json() for text in ("one", "two"))
+
+    async def scenario():
+        stream = Stream(f"/posts/{post_id}/comments/stream", last_event_id=first["id"])
+        await wait_for(lambda: broadcast.broadcaster.subscribers(broadcast.comments_topic(post_id)) == 1)
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as live_client:
+            third = (await live_client.post(f"/posts/{post_id}/comments", json={"content": "three"}, headers=headers)).json()
+        await wait_for(lambda: len(stream.events()) == 2)
+        await stream.close()
+        assert stream.status == 200
+        assert [(event_id, event, data["content"]) for event_id, event, data in stream.events()] == [
+            (second["id"], "comment", "two"), (third["id"], "comment", "three"),
+        ]
+        missing = Stream("/posts/999/comments/stream")
+        await missing.task
+        assert missing.status == 404
+    asyncio.run(scenario())
+    assert broadcast.broadcaster.subscribers() == 0
+
+# A client whose connection is gone before the response starts, so the stream never runs
+class BrokenStream(Stream):
+    async def _send(self, message):
+        raise OSError("connection reset")
+
+def test_streams_that_never_start_unsubscribe(get_access_token, test_post):
+    post_id = create_post(get_access_token, test_post)["id"]
+
+    async def scenario():
+        streams = [BrokenStream("/posts/stream"), BrokenStream(f"/posts/{post_id}/comments/stream", last_event_id=0)]
+        return await asyncio.gather(*(stream.task for stream in streams), return_exceptions=True)
+    assert all(isinstance(result, Exception) for result in asyncio.run(scenario()))
+    assert broadcast.broadcaster.subscribers() == 0
+
+def test_post_stream_publishes_new_posts(get_access_token, test_post, monkeypatch):
+    older = create_post(get_access_token, test_post)
+    create_post(get_access_token, test_post)
+    monkeypatch.setattr(broadcast, "SSE_BACKLOG_LIMIT", 1)
+
+    async def scenario():
+        # A catch-up larger than the limit ends the stream, to be resumed by the next reconnect
+        stream = Stream("/posts/stream", last_event_id=older["id"] - 1)
+        await stream.task
+        return stream.events()
+    events = asyncio.run(scenario())
+    assert [(event_id, event, data["title"]) for event_id, event, data in events] == [(older["id"], "post", test_post["title"])]
+
+def test_holds_5000_idle_subscribers(get_access_token, test_post):
+    headers = {"Authorization": f"Bearer {get_access_token}"}
+    post_id = create_post(get_access_token, test_post)["id"]
+    topic = broadcast.comments_topic(post_id)
+
+    async def scenario():
+        streams = [Stream(f"/posts/{post_id}/comments/stream") for _ in range(5000)]
+        await wait_for(lambda: broadcast.broadcaster.subscribers(topic) == 5000)
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as live_client:
+            response = await live_client.post(f"/posts/{post_id}/comments", json={"content": "hello all"}, headers=headers)
+        assert response.status_code == 200
+        await wait_for(lambda: all(stream.body for stream in streams))
+        assert {tuple(stream.events()[0][:2]) for stream in streams} == {(response.json()["id"], "comment")}
+        await asyncio.gather(*(stream.close() for stream in streams))
+        assert broadcast.broadcaster.subscribers() == 0
+    asyncio.run(scenario())
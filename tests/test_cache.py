@@ -0,0 +1,35 @@
+import time
+from app.cache import TTLCache
+
+def test_lru_eviction():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert "b" not in cache
+    assert cache.get("a") == 1
+    assert cache.evictions == 1
+
+def test_entry_expires_at_its_own_deadline():
+    cache = TTLCache(maxsize=10, ttl=60)
+    cache.set("token", "principal", expires_at=time.time() - 1)
+    assert cache.get("token") is None
+    assert cache.misses == 1
+
+def test_discard_where():
+    cache = TTLCache(maxsize=10, ttl=60)
+    cache.set("t1", 1)
+    cache.set("t2", 2)
+    cache.set("t3", 1)
+    assert cache.discard_where(lambda value: value == 1) == 2
+    assert len(cache) == 1
+
+def test_unbounded_cache_keeps_entries_until_they_expire():
+    cache = TTLCache(maxsize=None, ttl=60)
+    cache.set("old", 1, expires_at=time.time() - 1)
+    for i in range(1000):
+        cache.set(i, i)
+    assert "old" not in cache._entries
+    assert all(i in cache for i in range(1000))
+    assert cache.evictions == 0
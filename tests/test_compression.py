@@ -0,0 +1,92 @@
+import sqlite3
+import pytest
+from sqlalchemy import text
+from app import compression, maintenance, search
+from tests.conftest import client, engine
+
+BODY = "Long form writing about sqlite page caches. " * 100
+
+@pytest.fixture
+def zlib_storage(monkeypatch):
+    monkeypatch.setattr(compression, "CONTENT_COMPRESSION", "zlib")
+
+def stored(table, row_id):
+    with engine.connect() as connection:
+        return connection.execute(text(f"SELECT typeof(content), content FROM {table} WHERE id = :id"), {"id": row_id}).one()
+
+def test_compress_round_trip():
+    packed = compression.compress(BODY, "zlib")
+    assert packed[:1] == compression.ZLIB and len(packed) < len(BODY)
+    assert compression.decompress(packed) == BODY
+    # Bodies under the threshold, or that would grow, stay text
+    assert compression.compress("short", "zlib") == "short"
+    assert compression.compress("x", "zlib", min_bytes=0) == "x"
+    assert compression.compress(BODY, "") == BODY
+    with pytest.raises(ValueError):
+        compression.decompress(b"\x09abc")
+
+def test_posts_and_comments_are_stored_compressed(zlib_storage, get_access_token):
+    headers = {"Authorization": f"Bearer {get_access_token}"}
+    post = client.post("/posts", json={"title": "Caching", "content": BODY}, headers=headers).json()
+    comment = client.post(f"/posts/{post['id']}/comments", json={"content": BODY}, headers=headers).json()
+    assert stored("posts", post["id"])[0] == "blob"
+    assert stored("comments", comment["id"])[0] == "blob"
+
+    assert client.get(f"/posts/{post['id']}").json()["content"] == BODY
+    assert client.get(f"/posts/{post['id']}/comments").json()[0]["content"] == BODY
+    assert client.get("/posts?fields=excerpt&excerpt_length=9").json() == [{"excerpt": "Long form"}]
+
+    # The search index sees the text, through inserts and updates
+    assert [hit["id"] for hit in client.get("/search?query=caches").json()] == [post["id"]]
+    client.put(f"/posts/{post['id']}", json={"title": "Caching", "content": BODY + " vacuum"}, headers=headers)
+    assert [hit["id"] for hit in client.get("/search?query=vacuum").json()] == [post["id"]]
+    with engine.begin() as connection:
+        search.rebuild_index(connection)
+    assert [hit["id"] for hit in client.get("/search?query=vacuum").json()] == [post["id"]]
+
+# The schema's triggers need nothing the app registers, so other SQLite clients can write
+def test_other_clients_can_write_posts(zlib_storage, get_access_token):
+    headers = {"Authorization": f"Bearer {get_access_token}"}
+    post = client.post("/posts", json={"title": "Caching", "content": BODY}, headers=headers).json()
+
+    def search_ids(query):
+        return [hit["id"] for hit in client.get(f"/search?query={query}").json()]
+
+    other = sqlite3.connect(engine.url.database)
+    try:
+        row_id = other.execute("INSERT INTO posts (title, content, author_id) VALUES ('Notes', 'written by hand', 1)").lastrowid
+        other.commit()
+        assert search_ids("hand") == [row_id]
+        other.execute("UPDATE posts SET content = 'edited elsewhere' WHERE id = ?", (row_id,))
+        other.commit()
+        assert search_ids("edited") == [row_id] and search_ids("hand") == []
+        other.execute("DELETE FROM posts WHERE id = ?", (row_id,))
+        other.commit()
+        assert search_ids("edited") == []
+    finally:
+        other.close()
+    assert search_ids("caches") == [post["id"]]
+
+def test_recompress_existing_rows(get_access_token):
+    headers = {"Authorization": f"Bearer {get_access_token}"}
+    post = client.post("/posts", json={"title": "Caching", "content": BODY}, headers=headers).json()
+    client.post("/posts", json={"title": "Short", "content": "tiny"}, headers=headers)
+    assert stored("posts", post["id"])[0] == "text"
+
+    assert maintenance.recompress_content(engine, "zlib", batch_size=1) == 1
+    assert stored("posts", post["id"])[0] == "blob"
+    assert maintenance.recompress_content(engine, "zlib") == 0
+    assert client.get(f"/posts/{post['id']}").json()["content"] == BODY
+    assert [hit["id"] for hit in client.get("/search?query=caches").json()] == [post["id"]]
+
+    assert maintenance.recompress_content(engine, "") == 1
+    assert stored("posts", post["id"]) == ("text", BODY)
+    assert [hit["id"] for hit in client.get("/search?query=caches").json()] == [post["id"]]
+
+def test_large_responses_are_gzipped(get_access_token):
+    headers = {"Authorization": f"Bearer {get_access_token}"}
+    client.post("/posts", json={"title": "Caching", "content": BODY}, headers=headers)
+    response = client.get("/posts", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.json()[0]["content"] == BODY
+    assert "content-encoding" not in client.get("/posts?fields=id", headers={"Accept-Encoding": "gzip"}).headers
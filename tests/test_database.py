@@ -0,0 +1,77 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import anyio
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+from app import database
+
+def test_sqlite_engine_profile(tmp_path):
+    url = f"sqlite:///{tmp_path / 'profile.db'}"
+    engine = database.build_engine(url, pool_size=2, max_overflow=0)
+    with engine.connect() as connection:
+        assert connection.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        assert connection.execute(text("PRAGMA synchronous")).scalar() == 1  # NORMAL
+        assert connection.execute(text("PRAGMA busy_timeout")).scalar() == database.SQLITE_BUSY_TIMEOUT_MS
+        assert connection.execute(text("PRAGMA cache_size")).scalar() == database.SQLITE_CACHE_SIZE
+    assert engine.pool.size() == 2
+    engine.dispose()
+
+def test_read_engine_rejects_writes(tmp_path):
+    url = f"sqlite:///{tmp_path / 'profile.db'}"
+    writer = database.build_engine(url, pool_size=1, max_overflow=0)
+    reader = database.build_engine(url, pool_size=1, max_overflow=0, read_only=True)
+    with writer.begin() as connection:
+        connection.execute(text("CREATE TABLE notes (body TEXT)"))
+        connection.execute(text("INSERT INTO notes VALUES ('hello')"))
+    with reader.connect() as connection:
+        assert connection.execute(text("SELECT body FROM notes")).scalar() == "hello"
+        with pytest.raises(OperationalError):
+            connection.execute(text("INSERT INTO notes VALUES ('nope')"))
+    writer.dispose()
+    reader.dispose()
+
+def test_in_memory_engine_skips_file_pragmas():
+    engine = database.build_engine("sqlite://", pool_size=5, max_overflow=0)
+    with engine.connect() as connection:
+        assert connection.execute(text("PRAGMA journal_mode")).scalar() == "memory"
+    engine.dispose()
+
+def test_in_memory_database_is_shared_by_reads_and_writes():
+    engine, read_engine = database.build_engines("sqlite://")
+    assert read_engine is engine
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE notes (body TEXT)"))
+        connection.execute(text("INSERT INTO notes VALUES ('hello')"))
+
+    # Requests run on threadpool workers; they all see the one database
+    def read():
+        with read_engine.connect() as connection:
+            return connection.execute(text("SELECT body FROM notes")).scalar()
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        assert list(executor.map(lambda _: read(), range(2))) == ["hello", "hello"]
+    engine.dispose()
+
+    with pytest.raises(ValueError):
+        database.build_async_engine("sqlite://", pool_size=1, max_overflow=0)
+
+# More sessions than connections and threads: the extra ones wait on the event loop, not on a thread
+def test_threaded_sessions_wait_for_a_connection_off_the_threadpool(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "DB_POOL_TIMEOUT", 1)
+    engine = database.build_engine(f"sqlite:///{tmp_path / 'slots.db'}", pool_size=1, max_overflow=1)
+    session_factory = sessionmaker(bind=engine)
+
+    async def request():
+        async with database.open_threaded_session(session_factory()) as db:
+            await db.execute(text("SELECT 1"))
+            await asyncio.sleep(0.01)
+            return await db.scalar(text("SELECT 2"))
+
+    async def burst():
+        anyio.to_thread.current_default_thread_limiter().total_tokens = 2
+        return await asyncio.gather(*(request() for _ in range(20)))
+
+    assert asyncio.run(burst()) == [2] * 20
+    assert engine.pool.checkedout() == 0
+    engine.dispose()
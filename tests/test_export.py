@@ -0,0 +1,61 @@
+import os
+import sqlite3
+import subprocess
+import sys
+import pytest
+from sqlalchemy import create_engine
+from app import models
+
+# Exports the seeded posts table in a fresh interpreter and prints rows exported and peak RSS (KiB)
+EXPORT_SCRIPT = """
+import resource, sys
+from sqlalchemy import select
+from sqlalchemy.orm import sessionmaker
+from app import database, export, models
+engine = database.build_engine(sys.argv[1], 1, 0, read_only=True)
+columns = [models.Post.id, models.Post.title, models.Post.content, models.Post.timestamp, models.Post.author_id]
+statement = select(*columns).order_by(models.Post.timestamp, models.Post.id).limit(int(sys.argv[2]))
+rows = 0
+for chunk in export.stream_sync(sessionmaker(bind=engine), statement):
+    rows += chunk.count("\\n")
+print(rows, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+
+def seed_posts(path, count):
+    engine = create_engine(f"sqlite:///{path}")
+    models.Base.metadata.create_all(bind=engine)
+    engine.dispose()
+    connection = sqlite3.connect(path)
+    # Search indexing is irrelevant here and would dominate the seeding time
+    connection.execute("DROP TRIGGER IF EXISTS posts_fts_ai")
+    connection.execute("INSERT INTO users (id, username, hashed_password) VALUES (1, 'exporter', 'x')")
+    connection.executemany(
+        "INSERT INTO posts (title, content, timestamp, author_id) VALUES (?, ?, datetime('2024-01-01', ? || ' seconds'), 1)",
+        ((f"Post {i}", f"Body of post {i} " * 10, i) for i in range(count)),
+    )
+    connection.commit()
+    connection.close()
+
+# SQLite's page cache and memory-mapped pages are bounded by configuration and would show up in
+# RSS as the file is read, so they are kept small to measure what the export itself holds
+def run_export(url, limit):
+    env = {**os.environ, "DATABASE_URL": url, "SQLITE_MMAP_SIZE": "0", "SQLITE_CACHE_SIZE": "-2000"}
+    output = subprocess.run([sys.executable, "-c", EXPORT_SCRIPT, url, str(limit)], env=env,
+                            capture_output=True, text=True, check=True).stdout
+    rows, peak_rss_kib = output.split()
+    return int(rows), int(peak_rss_kib)
+
+# Peak RSS of a full export should be about the same as exporting a single batch
+@pytest.mark.parametrize("count", [
+    100_000,
+    pytest.param(1_000_000, marks=pytest.mark.skipif(not os.getenv("RUN_SLOW_TESTS"), reason="set RUN_SLOW_TESTS=1")),
+])
+def test_export_memory_is_flat(tmp_path, count):
+    path = tmp_path / "export.db"
+    seed_posts(str(path), count)
+    url = f"sqlite:///{path}"
+
+    baseline_rows, baseline_rss = run_export(url, 1000)
+    rows, rss = run_export(url, count)
+    assert (baseline_rows, rows) == (1000, count)
+    assert rss - baseline_rss < 32 * 1024
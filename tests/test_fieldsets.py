@@ -0,0 +1,50 @@
+import pytest
+from sqlalchemy import event
+from app import serialization
+from tests.conftest import app_engines, client
+
+@pytest.fixture
+def long_post(get_access_token):
+    headers = {"Authorization": f"Bearer {get_access_token}"}
+    post = {"title": "Searchable title", "content": "word " * 2000}
+    assert client.post("/posts", json=post, headers=headers).status_code == 200
+    return post
+
+@pytest.fixture
+def statements():
+    captured = []
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        captured.append(statement)
+    for target in app_engines():
+        event.listen(target, "before_cursor_execute", capture)
+    yield captured
+    for target in app_engines():
+        event.remove(target, "before_cursor_execute", capture)
+
+@pytest.mark.parametrize("fast", [True, False])
+@pytest.mark.parametrize("path", ["/posts", "/search?query=searchable"])
+def test_fields_select_only_requested_columns(path, fast, long_post, statements, monkeypatch):
+    monkeypatch.setattr(serialization, "FAST_SERIALIZATION", fast)
+    separator = "&" if "?" in path else "?"
+    response = client.get(f"{path}{separator}fields=title,excerpt&excerpt_length=10")
+    assert response.status_code == 200
+    assert response.json() == [{"title": "Searchable title", "excerpt": "word word "}]
+    listing = [statement for statement in statements if "posts.title" in statement][-1]
+    # The body is only read through the excerpt's substr()
+    assert "posts.content" not in listing.replace("substr(decompress(posts.content)", "")
+
+def test_default_fields_are_unchanged(long_post):
+    post = client.get("/posts").json()[0]
+    assert set(post) == {"id", "title", "content", "timestamp", "author_id", "comment_count"}
+    assert post["content"] == long_post["content"]
+
+def test_fields_change_the_etag(long_post):
+    full = client.get("/posts").headers["ETag"]
+    slim = client.get("/posts?fields=id,title").headers["ETag"]
+    assert full != slim
+
+def test_unknown_fields_are_rejected():
+    response = client.get("/posts?fields=title,password")
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Unknown fields: password"
+    assert client.get("/search?query=x&fields=,").status_code == 400
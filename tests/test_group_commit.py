@@ -0,0 +1,64 @@
+from concurrent.futures import wait
+import pytest
+from app import group_commit, models
+from app.main import get_writer, record_new_comments
+from tests.conftest import app, client, TestingSessionLocal
+
+@pytest.fixture
+def writer():
+    writer = group_commit.GroupCommitWriter(TestingSessionLocal, window_ms=50, max_rows=256)
+    app.dependency_overrides[get_writer] = lambda: writer
+    yield writer
+    app.dependency_overrides.pop(get_writer, None)
+    writer.shutdown()
+
+def add_post():
+    db = TestingSessionLocal()
+    db.add(models.User(username="writer", hashed_password="x"))
+    db.add(models.Post(title="Target", content="For comments", author_id=1))
+    db.commit()
+    db.close()
+
+def test_concurrent_inserts_share_a_commit(writer):
+    add_post()
+    futures = [
+        writer.submit(models.Comment, {"content": f"Comment {i}", "post_id": 1, "author_id": 1}, follow_up=record_new_comments(1))
+        for i in range(50)
+    ]
+    wait(futures)
+    ids = [future.result().id for future in futures]
+
+    assert len(set(ids)) == 50
+    assert writer.rows == 50 and writer.commits < 50
+    db = TestingSessionLocal()
+    assert db.get(models.Post, 1).comment_count == 50
+    db.close()
+
+def test_a_rejected_row_fails_only_its_caller(writer):
+    add_post()
+    futures = [
+        writer.submit(models.Post, {"title": "ok", "content": "first", "author_id": 1}),
+        writer.submit(models.Post, {"title": None, "content": "no title", "author_id": 1}),
+        writer.submit(models.Post, {"title": "ok", "content": "third", "author_id": 1}),
+    ]
+    wait(futures)
+
+    assert futures[0].result().id and futures[2].result().id
+    with pytest.raises(group_commit.WriteRejected, match="NOT NULL"):
+        futures[1].result()
+    db = TestingSessionLocal()
+    assert db.query(models.Post).count() == 3
+    db.close()
+
+def test_routes_return_rows_created_by_the_writer(writer, test_user):
+    client.post("/register", json=test_user)
+    token = client.post("/login", data=test_user).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    post = client.post("/posts", json={"title": "Grouped", "content": "Body"}, headers=headers).json()
+    comment = client.post(f"/posts/{post['id']}/comments", json={"content": "Hi"}, headers=headers).json()
+
+    assert post["title"] == "Grouped" and post["timestamp"] and post["comment_count"] == 0
+    assert comment["post_id"] == post["id"] and comment["id"] == 1
+    assert client.get(f"/posts/{post['id']}").json()["comment_count"] == 1
+    assert writer.rows == 2
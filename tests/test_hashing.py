@@ -0,0 +1,84 @@
+import threading
+import pytest
+from anyio import to_thread
+from passlib.context import CryptContext
+from app import database, hashing, models
+from tests.conftest import client, TestingSessionLocal
+
+def test_bounded_executor_rejects_when_full():
+    executor = hashing.BoundedExecutor(workers=1, queue_limit=1)
+    release = threading.Event()
+    first = executor.submit(release.wait)
+    second = executor.submit(release.wait)
+    with pytest.raises(hashing.HasherSaturated):
+        executor.submit(release.wait)
+    release.set()
+    first.result()
+    second.result()
+    assert executor.run(lambda: "ok") == "ok"
+    executor.shutdown()
+
+def test_login_returns_503_when_hashing_is_saturated(monkeypatch, test_user):
+    client.post("/register", json=test_user)
+    saturated = hashing.BoundedExecutor(workers=1, queue_limit=0)
+    release = threading.Event()
+    saturated.submit(release.wait)
+    monkeypatch.setattr(hashing, "executor", saturated)
+
+    response = client.post("/login", data=test_user)
+    release.set()
+    saturated.shutdown()
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+
+# Logins waiting on the hashing pool hold no threadpool thread and no connection, so with
+# the pool full, new logins are shed and the other routes keep answering
+def test_waiting_logins_do_not_block_other_routes(monkeypatch, test_user):
+    client.post("/register", json=test_user)
+    queued = threading.Event()
+
+    class Recording(hashing.BoundedExecutor):
+        def submit(self, fn, *args):
+            future = super().submit(fn, *args)
+            queued.set()
+            return future
+
+    saturated = Recording(workers=1, queue_limit=1)
+    release = threading.Event()
+    saturated.submit(release.wait)
+    queued.clear()
+    monkeypatch.setattr(hashing, "executor", saturated)
+    limiter = client.portal.call(to_thread.current_default_thread_limiter)
+    total_tokens = limiter.total_tokens
+    client.portal.call(setattr, limiter, "total_tokens", 2)
+    try:
+        waiting = {}
+        thread = threading.Thread(target=lambda: waiting.update(response=client.post("/login", data=test_user)))
+        thread.start()
+        assert queued.wait(5)
+
+        assert client.post("/login", data=test_user).status_code == 503
+        assert client.get("/posts").status_code == 200
+        assert database.engine.pool.checkedout() == 0
+        assert thread.is_alive()
+    finally:
+        release.set()
+        thread.join()
+        client.portal.call(setattr, limiter, "total_tokens", total_tokens)
+        saturated.shutdown()
+    assert waiting["response"].status_code == 200
+
+def test_login_rehashes_outdated_cost(test_user):
+    db = TestingSessionLocal()
+    old_hash = CryptContext(schemes=["bcrypt"], bcrypt__rounds=5).hash(test_user["password"])
+    db.add(models.User(username=test_user["username"], hashed_password=old_hash))
+    db.commit()
+
+    response = client.post("/login", data=test_user)
+    assert response.status_code == 200
+
+    db.expire_all()
+    user = db.query(models.User).filter(models.User.username == test_user["username"]).first()
+    assert user.hashed_password != old_hash
+    assert user.hashed_password.startswith("$2b$04$")
+    db.close()
@@ -1,67 +1,6 @@
-import pytest
-from fastapi.testclient import TestClient
-from app.main import app, get_db
-from app import models
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from app.database import Base
-
-# Create a testing database
-SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
-engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
-TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-
-# Override the get_db function to use the test database
-def override_get_db():
-    try:
-        db = TestingSessionLocal()
-        yield db
-    finally:
-        db.close()
-
-app.dependency_overrides[get_db] = override_get_db
-#  Create tables in the test database
-Base.metadata.create_all(bind=engine)
-
-client = TestClient(app)
-
-@pytest.fixture(autouse=True)
-def setup_db():
-    # Create the database tables
-    models.Base.metadata.create_all(bind=engine)
-    yield
-    # Drop the database tables after tests
-    models.Base.metadata.drop_all(bind=engine)
-
-# Fixtures for test data
-@pytest.fixture
-def test_user():
-    return {
-        "username": "William",
-        "password": "williampass"
-    }
-
-@pytest.fixture
-def test_post():
-    return {
-        "title": "Hey All",
-        "content": "Nice To Meet You!!!!."
-    }
-
-@pytest.fixture
-def test_comment():
-    return {
-        "content":"good post"
-    }
-
-@pytest.fixture
-def get_access_token(test_user):
-    # Register the user
-    client.post("/register", json=test_user)
-    
-    # Login to get an access token
-    response = client.post("/login", data={"username": test_user["username"], "password": test_user["password"]})
-    return response.json()["access_token"]
+from datetime import datetime
+from app import models, auth
+from tests.conftest import client, engine, app_engines
 
 
 # Test registration
@@ -309,7 +248,7 @@ def test_invalid_token():
     assert response.status_code == 200  # Should be unauthorized
 
 def test_create_duplicate_post(test_user, test_post):
-    headers = {"Authorization": f"Bearer {get_access_token}"}
+    headers = {"Authorization": "Bearer invalidtoken"}
     
     # Create the post
     client.post("/posts", json=test_post, headers=headers)
@@ -353,3 +292,308 @@ def test_get_nonexistent_post():
     assert response.json()["detail"] == "Post not found"
 
 
+# Test cursor pagination walks every post exactly once, newest first
+def test_get_posts_cursor_pagination(get_access_token):
+    headers = {"Authorization": f"Bearer {get_access_token}"}
+    for i in range(5):
+        client.post("/posts", json={"title": f"Post {i}", "content": "Paged"}, headers=headers)
+
+    response = client.get("/posts?limit=2")
+    assert response.status_code == 200
+    seen = [post["id"] for post in response.json()]
+    cursor = response.headers.get("X-Next-Cursor")
+    while cursor:
+        response = client.get(f"/posts?limit=2&cursor={cursor}")
+        assert response.status_code == 200
+        seen += [post["id"] for post in response.json()]
+        cursor = response.headers.get("X-Next-Cursor")
+
+    assert len(seen) == 5
+    assert seen == sorted(seen, reverse=True)
+
+def test_get_posts_invalid_cursor():
+    response = client.get("/posts?cursor=not-a-cursor")
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid cursor"
+
+# Test search ranks title matches first and pages through results
+def test_search_posts_ranked_and_paginated(get_access_token):
+    headers = {"Authorization": f"Bearer {get_access_token}"}
+    client.post("/posts", json={"title": "Gardening notes", "content": "Tomatoes love the sun"}, headers=headers)
+    client.post("/posts", json={"title": "Tomatoes", "content": "All about tomatoes"}, headers=headers)
+    client.post("/posts", json={"title": "Cooking", "content": "Unrelated"}, headers=headers)
+
+    response = client.get("/search?query=tomatoes")
+    assert response.status_code == 200
+    assert [post["title"] for post in response.json()] == ["Tomatoes", "Gardening notes"]
+
+    response = client.get("/search?query=tomatoes&skip=1&limit=1")
+    assert [post["title"] for post in response.json()] == ["Gardening notes"]
+
+# Test the search index follows updates and deletes
+def test_search_index_stays_in_sync(test_post, get_access_token):
+    headers = {"Authorization": f"Bearer {get_access_token}"}
+    post_id = client.post("/posts", json=test_post, headers=headers).json()["id"]
+
+    client.put(f"/posts/{post_id}", json={"title": "Renamed", "content": "Fresh words"}, headers=headers)
+    assert client.get("/search?query=Meet").json() == []
+    assert len(client.get("/search?query=fresh").json()) == 1
+
+    client.delete(f"/posts/{post_id}", headers=headers)
+    assert client.get("/search?query=fresh").json() == []
+
+def test_search_query_syntax_is_escaped(test_post, get_access_token):
+    headers = {"Authorization": f"Bearer {get_access_token}"}
+    client.post("/posts", json=test_post, headers=headers)
+    response = client.get('/search?query="Meet" AND (NOT')
+    assert response.status_code == 200
+    assert client.get("/search?query=!!!").json() == []
+
+# Test repeat requests with the same token are served from the principal cache
+def test_principal_cache_hits(test_post, get_access_token):
+    headers = {"Authorization": f"Bearer {get_access_token}"}
+    hits = auth.principal_cache.hits
+    client.post("/posts", json=test_post, headers=headers)
+    client.post("/posts", json=test_post, headers=headers)
+    assert auth.principal_cache.hits == hits + 1
+
+    auth.invalidate_user(1)
+    assert get_access_token not in auth.principal_cache
+
+# Test tokens without the "uid" claim still resolve through a user lookup
+def test_token_without_user_id_claim(test_user, test_post):
+    client.post("/register", json=test_user)
+    token = auth.create_access_token(data={"sub": test_user["username"]})
+    response = client.post("/posts", json=test_post, headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 200
+
+    token = auth.create_access_token(data={"sub": "nobody"})
+    response = client.post("/posts", json=test_post, headers={"Authorization": f"Bearer {token}"})
+    assert response.status_code == 401
+
+# Test ETag revalidation on a post, and that updates change the ETag
+def test_get_post_etag_revalidation(test_post, get_access_token):
+    headers = {"Authorization": f"Bearer {get_access_token}"}
+    post_id = client.post("/posts", json=test_post, headers=headers).json()["id"]
+
+    response = client.get(f"/posts/{post_id}")
+    etag = response.headers["ETag"]
+    assert response.headers["Cache-Control"] == "no-cache"
+    assert "Last-Modified" in response.headers
+
+    response = client.get(f"/posts/{post_id}", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+
+    client.put(f"/posts/{post_id}", json={"title": "Changed", "content": "Changed"}, headers=headers)
+    response = client.get(f"/posts/{post_id}", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+def test_get_post_if_modified_since(test_post, get_access_token):
+    headers = {"Authorization": f"Bearer {get_access_token}"}
+    post_id = client.post("/posts", json=test_post, headers=headers).json()["id"]
+    last_modified = client.get(f"/posts/{post_id}").headers["Last-Modified"]
+
+    response = client.get(f"/posts/{post_id}", headers={"If-Modified-Since": last_modified})
+    assert response.status_code == 304
+    response = client.get(f"/posts/{post_id}", headers={"If-Modified-Since": "Mon, 01 Jan 2001 00:00:00 GMT"})
+    assert response.status_code == 200
+
+# Test a new comment moves the post's Last-Modified, as it changes its comment_count
+def test_get_post_if_modified_since_sees_new_comments(test_post, test_comment, get_access_token):
+    headers = {"Authorization": f"Bearer {get_access_token}"}
+    post_id = client.post("/posts", json=test_post, headers=headers).json()["id"]
+    with engine.begin() as connection:
+        connection.execute(models.Post.__table__.update().where(models.Post.id == post_id).values(timestamp=datetime(2020, 1, 1)))
+    last_modified = client.get(f"/posts/{post_id}").headers["Last-Modified"]
+
+    client.post(f"/posts/{post_id}/comments", json=test_comment, headers=headers)
+    response = client.get(f"/posts/{post_id}", headers={"If-Modified-Since": last_modified})
+    assert response.status_code == 200
+    assert response.json()["comment_count"] == 1
+    assert response.headers["Last-Modified"] != last_modified
+
+# Test a page of posts that lost a post is not revalidated by date
+def test_post_list_revalidates_deletes(test_post, get_access_token):
+    headers = {"Authorization": f"Bearer {get_access_token}"}
+    kept = client.post("/posts", json=test_post, headers=headers).json()["id"]
+    deleted = client.post("/posts", json=test_post, headers=headers).json()["id"]
+    client.put(f"/posts/{kept}", json={"title": "Changed", "content": "Changed"}, headers=headers)
+
+    response = client.get("/posts")
+    assert "Last-Modified" not in response.headers
+    etag = response.headers["ETag"]
+    client.delete(f"/posts/{deleted}", headers=headers)
+    response = client.get("/posts", headers={"If-None-Match": etag, "If-Modified-Since": "Mon, 01 Jan 2100 00:00:00 GMT"})
+    assert response.status_code == 200
+    assert [post["id"] for post in response.json()] == [kept]
+    response = client.get("/posts", headers={"If-Modified-Since": "Mon, 01 Jan 2100 00:00:00 GMT"})
+    assert response.status_code == 200
+
+# Test new comments invalidate the comment listing, and new posts the post listing
+def test_list_etags_change_with_writes(test_post, test_comment, get_access_token):
+    headers = {"Authorization": f"Bearer {get_access_token}"}
+    post_id = client.post("/posts", json=test_post, headers=headers).json()["id"]
+
+    comments_etag = client.get(f"/posts/{post_id}/comments").headers["ETag"]
+    assert client.get(f"/posts/{post_id}/comments", headers={"If-None-Match": comments_etag}).status_code == 304
+    client.post(f"/posts/{post_id}/comments", json=test_comment, headers=headers)
+    response = client.get(f"/posts/{post_id}/comments", headers={"If-None-Match": comments_etag})
+    assert response.status_code == 200
+    assert len(response.json()) == 1
+
+    posts_etag = client.get("/posts").headers["ETag"]
+    assert client.get("/posts", headers={"If-None-Match": posts_etag}).status_code == 304
+    client.delete(f"/posts/{post_id}", headers=headers)
+    assert client.get("/posts", headers={"If-None-Match": posts_etag}).status_code == 200
+
+# Test batch post creation reports each item, including invalid ones
+def test_create_posts_batch(get_access_token):
+    headers = {"Authorization": f"Bearer {get_access_token}"}
+    items = [
+        {"title": "First", "content": "One"},
+        {"title": "Missing content"},
+        {"title": "Third", "content": "Three"},
+    ]
+    response = client.post("/posts/batch", json=items, headers=headers)
+    assert response.status_code == 200
+    data = response.json()
+    assert (data["created"], data["failed"]) == (2, 1)
+    assert [result["status"] for result in data["results"]] == ["created", "error", "created"]
+    assert "content" in data["results"][1]["error"]
+
+    created_id = data["results"][2]["id"]
+    assert client.get(f"/posts/{created_id}").json()["title"] == "Third"
+    assert len(client.get("/search?query=three").json()) == 1
+
+def test_create_posts_batch_limits(monkeypatch, get_access_token):
+    from app import batch
+    headers = {"Authorization": f"Bearer {get_access_token}"}
+    monkeypatch.setattr(batch, "BATCH_MAX_SIZE", 2)
+    response = client.post("/posts/batch", json=[{"title": "t", "content": "c"}] * 3, headers=headers)
+    assert response.status_code == 413
+    assert client.post("/posts/batch", json=[{"title": "t", "content": "c"}]).status_code == 401
+
+def test_create_comments_batch(test_post, get_access_token):
+    headers = {"Authorization": f"Bearer {get_access_token}"}
+    post_id = client.post("/posts", json=test_post, headers=headers).json()["id"]
+    etag = client.get(f"/posts/{post_id}/comments").headers["ETag"]
+
+    response = client.post(f"/posts/{post_id}/comments/batch", json=[{"content": "a"}, {"content": "b"}, 5], headers=headers)
+    assert response.status_code == 200
+    assert response.json()["created"] == 2
+    assert response.json()["results"][2]["status"] == "error"
+
+    response = client.get(f"/posts/{post_id}/comments", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert [comment["content"] for comment in response.json()] == ["a", "b"]
+    assert client.post("/posts/999/comments/batch", json=[{"content": "a"}], headers=headers).status_code == 404
+
+# Test the NDJSON exports, including incremental `since` filtering
+def test_export_posts_and_comments(test_comment, get_access_token):
+    import json
+    headers = {"Authorization": f"Bearer {get_access_token}"}
+    ids = [client.post("/posts", json={"title": f"Post {i}", "content": "Body"}, headers=headers).json()["id"] for i in range(3)]
+    client.post(f"/posts/{ids[0]}/comments", json=test_comment, headers=headers)
+
+    response = client.get("/export/posts")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert [row["id"] for row in rows] == ids
+    assert set(rows[0]) == {"id", "title", "content", "timestamp", "author_id"}
+
+    since = rows[0]["timestamp"]
+    assert [json.loads(line)["id"] for line in client.get(f"/export/posts?since={since}").text.splitlines()] == ids[1:]
+
+    comments = client.get(f"/export/posts/{ids[0]}/comments").text.splitlines()
+    assert [json.loads(line)["content"] for line in comments] == [test_comment["content"]]
+    assert client.get("/export/posts/999/comments").status_code == 404
+
+# Test comment counts are kept on the post and comments page with a cursor
+def test_comment_count_and_pagination(test_post, get_access_token):
+    headers = {"Authorization": f"Bearer {get_access_token}"}
+    post_id = client.post("/posts", json=test_post, headers=headers).json()["id"]
+    assert client.get(f"/posts/{post_id}").json()["comment_count"] == 0
+
+    client.post(f"/posts/{post_id}/comments", json={"content": "c0"}, headers=headers)
+    client.post(f"/posts/{post_id}/comments/batch", json=[{"content": f"c{i}"} for i in range(1, 5)], headers=headers)
+    assert client.get(f"/posts/{post_id}").json()["comment_count"] == 5
+    assert client.get("/posts").json()[0]["comment_count"] == 5
+
+    seen = []
+    response = client.get(f"/posts/{post_id}/comments?limit=2")
+    while True:
+        seen += [comment["content"] for comment in response.json()]
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+        response = client.get(f"/posts/{post_id}/comments?limit=2&cursor={cursor}")
+    assert seen == [f"c{i}" for i in range(5)]
+    assert client.get(f"/posts/{post_id}/comments?cursor=bogus").status_code == 400
+
+def test_recount_comments_repairs_drift(test_post, test_comment, get_access_token):
+    from app import maintenance
+    headers = {"Authorization": f"Bearer {get_access_token}"}
+    post_id = client.post("/posts", json=test_post, headers=headers).json()["id"]
+    client.post(f"/posts/{post_id}/comments", json=test_comment, headers=headers)
+    with engine.begin() as connection:
+        connection.execute(models.Post.__table__.update().values(comment_count=42))
+
+    assert maintenance.recount_comments(engine, batch_size=1) == 1
+    assert maintenance.recount_comments(engine) == 0
+    assert client.get(f"/posts/{post_id}").json()["comment_count"] == 1
+
+# Test the feed carries authors and newest comments, in the same number of queries for any page size
+def test_feed_loads_without_n_plus_one(test_user, get_access_token):
+    from sqlalchemy import event
+    headers = {"Authorization": f"Bearer {get_access_token}"}
+    for i in range(6):
+        post_id = client.post("/posts", json={"title": f"Post {i}", "content": "Body"}, headers=headers).json()["id"]
+        for j in range(4):
+            client.post(f"/posts/{post_id}/comments", json={"content": f"Comment {i}.{j}"}, headers=headers)
+
+    statements = []
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    for target in app_engines():
+        event.listen(target, "before_cursor_execute", count_statement)
+    try:
+        small = client.get("/feed?limit=2&comments=2")
+        small_count = len(statements)
+        statements.clear()
+        large = client.get("/feed?limit=6&comments=2")
+        large_count = len(statements)
+    finally:
+        for target in app_engines():
+            event.remove(target, "before_cursor_execute", count_statement)
+
+    assert small_count == large_count == 2
+    assert len(large.json()) == 6
+    newest = large.json()[0]
+    assert newest["title"] == "Post 5"
+    assert newest["author_username"] == test_user["username"]
+    assert newest["comment_count"] == 4
+    assert [comment["content"] for comment in newest["latest_comments"]] == ["Comment 5.3", "Comment 5.2"]
+    assert newest["latest_comments"][0]["author_username"] == test_user["username"]
+
+    next_page = client.get(f"/feed?limit=2&cursor={small.headers['X-Next-Cursor']}").json()
+    assert [post["title"] for post in next_page] == ["Post 3", "Post 2"]
+
+# Test the fast list serialization produces the same JSON as the response models
+def test_fast_serialization_matches_response_model(monkeypatch, test_comment, get_access_token):
+    from app import serialization
+    headers = {"Authorization": f"Bearer {get_access_token}"}
+    for i in range(3):
+        post_id = client.post("/posts", json={"title": f"Post {i}", "content": "Same body"}, headers=headers).json()["id"]
+        client.post(f"/posts/{post_id}/comments", json=test_comment, headers=headers)
+
+    paths = ["/posts", "/search?query=same", f"/posts/{post_id}/comments", "/feed"]
+    fast = [client.get(path) for path in paths]
+    monkeypatch.setattr(serialization, "FAST_SERIALIZATION", False)
+    slow = [client.get(path) for path in paths]
+    for fast_response, slow_response in zip(fast, slow):
+        assert fast_response.json() == slow_response.json()
+        assert fast_response.headers.get("ETag") == slow_response.headers.get("ETag")
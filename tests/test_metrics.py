@@ -0,0 +1,61 @@
+from app import auth, database, metrics
+from tests.conftest import client
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = metrics.Histogram("demo_seconds", "Demo.", ("route",), buckets=(0.1, 1))
+    for value in (0.05, 0.5, 0.5, 5):
+        histogram.observe(value, "/a")
+    lines = histogram.render()
+    assert 'demo_seconds_bucket{route="/a",le="0.1"} 1' in lines
+    assert 'demo_seconds_bucket{route="/a",le="1"} 3' in lines
+    assert 'demo_seconds_bucket{route="/a",le="+Inf"} 4' in lines
+    assert 'demo_seconds_count{route="/a"} 4' in lines
+
+def test_requests_are_recorded_by_route_template(test_user):
+    client.post("/register", json=test_user)
+    token = client.post("/login", data=test_user).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    post_id = client.post("/posts", json={"title": "Hi", "content": "There"}, headers=headers).json()["id"]
+    before = metrics.REQUESTS.value("GET", "/posts/{post_id}", "200")
+    queries_before = metrics.REQUEST_QUERIES.sum("GET", "/posts/{post_id}")
+
+    client.get(f"/posts/{post_id}")
+    client.get(f"/posts/{post_id}")
+    client.get("/no/such/path")
+
+    assert metrics.REQUESTS.value("GET", "/posts/{post_id}", "200") == before + 2
+    assert metrics.REQUESTS.value("GET", metrics.UNMATCHED_ROUTE, "404") >= 1
+    # One query per read: the post lookup
+    assert metrics.REQUEST_QUERIES.sum("GET", "/posts/{post_id}") == queries_before + 2
+    assert metrics.HASH_SECONDS.count("verify_and_update") >= 1
+    assert metrics.IN_FLIGHT.value("GET", "/posts/{post_id}") == 0
+
+    body = client.get("/metrics").text
+    assert f'http_requests_total{{method="GET",route="/posts/{{post_id}}",status="200"}} {before + 2}' in body
+    assert "# TYPE http_request_duration_seconds histogram" in body
+    assert 'http_request_db_queries_bucket{method="GET",route="/posts/{post_id}",le="0"}' in body
+    assert 'password_hash_duration_seconds_count{operation="verify_and_update"}' in body
+
+def test_pool_checkouts_and_queries_are_timed(tmp_path):
+    before = (metrics.POOL_WAIT_SECONDS.count("read"), metrics.QUERY_SECONDS.count("read"))
+    reader = database.build_engine(f"sqlite:///{tmp_path / 'pool.db'}", pool_size=1, max_overflow=0, read_only=True)
+    with reader.connect() as connection:
+        connection.exec_driver_sql("SELECT 1")
+    reader.dispose()
+    assert metrics.POOL_WAIT_SECONDS.count("read") == before[0] + 1
+    assert metrics.QUERY_SECONDS.count("read") > before[1]
+
+def test_principal_cache_is_exported(test_user):
+    client.post("/register", json=test_user)
+    token = client.post("/login", data=test_user).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    for _ in range(2):
+        client.post("/posts", json={"title": "Hi", "content": "There"}, headers=headers)
+    stats = auth.principal_cache.stats()
+    assert stats["hits"] >= 1 and stats["misses"] >= 1
+
+    body = client.get("/metrics").text
+    assert f'cache_lookups_total{{cache="principal",result="hit"}} {stats["hits"]}' in body
+    assert f'cache_lookups_total{{cache="principal",result="miss"}} {stats["misses"]}' in body
+    assert f'cache_entries{{cache="principal"}} {stats["size"]}' in body
+    assert "# TYPE cache_evictions_total counter" in body
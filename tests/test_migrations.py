@@ -0,0 +1,98 @@
+from sqlalchemy import create_engine, text
+from app import migrations
+
+# The schema as it was before migrations existed: no indexes beyond the primary keys
+LEGACY_SCHEMA = [
+    "CREATE TABLE users (id INTEGER PRIMARY KEY, username VARCHAR(150), hashed_password VARCHAR(200))",
+    "CREATE UNIQUE INDEX ix_users_username ON users (username)",
+    "CREATE TABLE posts (id INTEGER PRIMARY KEY, title VARCHAR(150) NOT NULL, content TEXT NOT NULL, "
+    "timestamp DATETIME, author_id INTEGER REFERENCES users(id))",
+    "CREATE TABLE comments (id INTEGER PRIMARY KEY, content TEXT NOT NULL, timestamp DATETIME, "
+    "post_id INTEGER REFERENCES posts(id), author_id INTEGER REFERENCES users(id))",
+]
+
+def query_plan(connection, sql):
+    return " ".join(row[-1] for row in connection.execute(text(f"EXPLAIN QUERY PLAN {sql}")))
+
+def legacy_engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    with engine.begin() as connection:
+        for statement in LEGACY_SCHEMA:
+            connection.execute(text(statement))
+        connection.execute(text("INSERT INTO users (id, username, hashed_password) VALUES (1, 'old', 'x')"))
+        connection.execute(text(
+            "INSERT INTO posts (title, content, timestamp, author_id) "
+            "SELECT 'title', 'content', datetime('now'), 1 FROM (WITH RECURSIVE n(i) AS "
+            "(SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < 500) SELECT i FROM n)"
+        ))
+        connection.execute(text("INSERT INTO comments (content, post_id, author_id) SELECT 'hi', id, 1 FROM posts"))
+    return engine
+
+def test_upgrade_indexes_a_populated_legacy_database(tmp_path):
+    engine = legacy_engine(tmp_path)
+    with engine.connect() as connection:
+        assert "SCAN comments" in query_plan(connection, "SELECT * FROM comments WHERE post_id = 1")
+
+    applied = migrations.upgrade(engine)
+    assert "v0001_hot_path_indexes" in applied
+    assert migrations.upgrade(engine) == []
+
+    with engine.connect() as connection:
+        assert connection.execute(text("SELECT count(*) FROM comments")).scalar() == 500
+        assert connection.execute(text("SELECT min(version), min(comments_version) FROM posts")).first() == (1, 0)
+        assert connection.execute(text("SELECT min(comment_count), max(comment_count) FROM posts")).first() == (1, 1)
+        assert "USING INDEX ix_comments_post_id" in query_plan(connection, "SELECT * FROM comments WHERE post_id = 1")
+        assert "USING INDEX ix_comments_author_id" in query_plan(connection, "SELECT * FROM comments WHERE author_id = 1")
+        assert "USING INDEX ix_posts_author_id" in query_plan(connection, "SELECT * FROM posts WHERE author_id = 1")
+        assert "USING INDEX ix_posts_timestamp_id" in query_plan(
+            connection, "SELECT * FROM posts ORDER BY timestamp DESC, id DESC LIMIT 10"
+        )
+    engine.dispose()
+
+def test_fresh_database_is_stamped(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'fresh.db'}")
+    assert migrations.upgrade(engine) == []
+    assert all(applied for _, applied in migrations.status(engine))
+    with engine.connect() as connection:
+        assert "USING INDEX ix_comments_post_id" in query_plan(connection, "SELECT * FROM comments WHERE post_id = 1")
+    engine.dispose()
+
+def test_upgrade_replaces_search_triggers(tmp_path):
+    engine = legacy_engine(tmp_path)
+    with engine.begin() as connection:
+        connection.execute(text("CREATE VIRTUAL TABLE posts_fts USING fts5(title, content, content='posts', content_rowid='id')"))
+        connection.execute(text(
+            "CREATE TRIGGER posts_fts_ai AFTER INSERT ON posts BEGIN "
+            "INSERT INTO posts_fts(rowid, title, content) VALUES (new.id, new.title, new.content); END"
+        ))
+
+    assert "v0006_search_triggers_plain_text" in migrations.upgrade(engine)
+    with engine.connect() as connection:
+        triggers = dict(connection.execute(text("SELECT name, sql FROM sqlite_master WHERE type = 'trigger'")).all())
+        compressed = {row[0] for row in connection.execute(text("SELECT name FROM sqlite_temp_master WHERE type = 'trigger'"))}
+    assert set(triggers) == {"posts_fts_ai", "posts_fts_ad", "posts_fts_bu", "posts_fts_au"}
+    # Only the app's own connections call decompress()
+    assert not any("decompress(" in sql for sql in triggers.values())
+    assert compressed == {f"{name}_compressed" for name in triggers}
+    engine.dispose()
+
+def test_upgrade_stops_id_reuse(tmp_path):
+    engine = legacy_engine(tmp_path)
+    with engine.begin() as connection:
+        connection.execute(text("CREATE VIRTUAL TABLE posts_fts USING fts5(title, content, content='posts', content_rowid='id')"))
+        connection.execute(text("INSERT INTO posts_fts(posts_fts) VALUES ('rebuild')"))
+
+    assert "v0005_autoincrement_ids" in migrations.upgrade(engine)
+    with engine.begin() as connection:
+        assert connection.execute(text("SELECT count(*), max(id) FROM posts")).first() == (500, 500)
+        assert connection.execute(text("SELECT count(*) FROM comments")).scalar() == 500
+        assert "USING INDEX ix_comments_post_id" in query_plan(connection, "SELECT * FROM comments WHERE post_id = 1")
+        triggers = {row[0] for row in connection.execute(text("SELECT name FROM sqlite_master WHERE type = 'trigger'"))}
+        assert triggers == {"posts_fts_ai", "posts_fts_ad", "posts_fts_bu", "posts_fts_au"}
+
+        connection.execute(text("DELETE FROM comments WHERE post_id = 500"))
+        connection.execute(text("DELETE FROM posts WHERE id = 500"))
+        connection.execute(text("INSERT INTO posts (title, content, author_id) VALUES ('new', 'body', 1)"))
+        assert connection.execute(text("SELECT max(id) FROM posts")).scalar() == 501
+        assert connection.execute(text("SELECT count(*) FROM posts_fts WHERE posts_fts MATCH 'new'")).scalar() == 1
+    engine.dispose()
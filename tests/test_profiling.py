@@ -0,0 +1,58 @@
+from sqlalchemy import create_engine, text
+from app import auth, profiling
+from tests.conftest import client
+
+def capture_all(monkeypatch, tmp_path):
+    monkeypatch.setattr(profiling.slow_queries, "threshold_ms", 0)
+    profiling.slow_queries.clear()
+    engine = create_engine(f"sqlite:///{tmp_path / 'profile.db'}")
+    profiling.instrument_engine(engine)
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE notes (id INTEGER PRIMARY KEY, body TEXT, author TEXT)"))
+        connection.execute(text("CREATE INDEX ix_notes_author ON notes (author)"))
+    return engine
+
+def test_slow_queries_are_captured_with_their_plan(monkeypatch, tmp_path):
+    engine = capture_all(monkeypatch, tmp_path)
+    token = profiling.current_route.set("GET /notes")
+    with engine.connect() as connection:
+        connection.execute(text("SELECT * FROM notes WHERE body = :body"), {"body": "secret"})
+        connection.execute(text("SELECT * FROM notes WHERE author = :author"), {"author": "ann"})
+    profiling.current_route.reset(token)
+    engine.dispose()
+
+    entries = {entry["statement"]: entry for entry in profiling.slow_queries.worst()}
+    scan = entries["SELECT * FROM notes WHERE body = ?"]
+    assert scan["full_scan"] is True
+    assert scan["plan"] == ["SCAN notes"]
+    assert scan["route"] == "GET /notes"
+    # Only the parameter types are kept, never the values
+    assert scan["parameters"] == ["str"]
+    indexed = entries["SELECT * FROM notes WHERE author = ?"]
+    assert indexed["full_scan"] is False
+    assert "USING INDEX ix_notes_author" in indexed["plan"][0]
+
+def test_materialized_subqueries_are_not_full_scans():
+    plan = ["MATERIALIZE hits", "SCAN posts_fts VIRTUAL TABLE INDEX 0:M2", "SCAN hits", "SEARCH posts USING INTEGER PRIMARY KEY (rowid=?)"]
+    assert profiling.full_scans(plan) == []
+    assert profiling.full_scans(["SCAN comments", "SCAN posts USING INDEX ix_posts_timestamp_id"]) == ["SCAN comments"]
+
+def test_slow_query_buffer_is_bounded():
+    log = profiling.SlowQueryLog(threshold_ms=0, size=3)
+    for duration in (5, 1, 9, 3, 7):
+        log.record({"duration_ms": duration})
+    assert [entry["duration_ms"] for entry in log.worst()] == [9, 7, 3]
+
+def test_admin_endpoint_requires_an_admin(monkeypatch, test_user):
+    client.post("/register", json=test_user)
+    token = client.post("/login", data=test_user).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    assert client.get("/admin/slow-queries", headers=headers).status_code == 403
+
+    monkeypatch.setattr(auth, "ADMIN_USERNAMES", {test_user["username"]})
+    profiling.slow_queries.clear()
+    profiling.slow_queries.record({"duration_ms": 250.0, "statement": "SELECT 1"})
+    response = client.get("/admin/slow-queries", headers=headers)
+    assert response.status_code == 200
+    assert response.json()["queries"] == [{"duration_ms": 250.0, "statement": "SELECT 1"}]
+    profiling.slow_queries.clear()
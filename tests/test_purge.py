@@ -0,0 +1,110 @@
+from sqlalchemy import create_engine, func, insert, select, text
+from app import database, maintenance, models, purge
+from app.main import get_purger
+from tests.conftest import app, client, engine, TestingSessionLocal
+
+def comments_of(post_id):
+    session = TestingSessionLocal()
+    count = session.scalar(select(func.count()).select_from(models.Comment).where(models.Comment.post_id == post_id))
+    session.close()
+    return count
+
+def post_with_comments(headers, test_post, count):
+    post_id = client.post("/posts", json=test_post, headers=headers).json()["id"]
+    response = client.post(f"/posts/{post_id}/comments/batch", json=[{"content": f"c{i}"} for i in range(count)], headers=headers)
+    assert response.json()["created"] == count
+    return post_id
+
+def test_delete_takes_small_threads_with_it(test_post, get_access_token):
+    headers = {"Authorization": f"Bearer {get_access_token}"}
+    post_id = post_with_comments(headers, test_post, 3)
+    kept = post_with_comments(headers, test_post, 2)
+
+    assert client.delete(f"/posts/{post_id}", headers=headers).json()["title"] == test_post["title"]
+    assert comments_of(post_id) == 0
+    assert comments_of(kept) == 2
+
+def test_big_threads_are_purged_in_the_background(test_post, get_access_token, monkeypatch):
+    monkeypatch.setattr(purge, "PURGE_INLINE_COMMENTS", 2)
+    purger = purge.CommentPurger(batch_size=2, pause_ms=0)
+    app.dependency_overrides[get_purger] = lambda: purger
+    try:
+        headers = {"Authorization": f"Bearer {get_access_token}"}
+        post_id = post_with_comments(headers, test_post, 5)
+        assert client.delete(f"/posts/{post_id}", headers=headers).status_code == 200
+        purger.join()
+    finally:
+        app.dependency_overrides.pop(get_purger, None)
+        purger.shutdown()
+    assert comments_of(post_id) == 0
+    assert purger.purged == 5
+
+def test_purge_spares_the_next_post(test_post, get_access_token, monkeypatch):
+    monkeypatch.setattr(purge, "PURGE_INLINE_COMMENTS", 2)
+    purger = purge.CommentPurger(batch_size=2, pause_ms=0)
+    purger._start = lambda: None  # queue the purge without running it yet
+    app.dependency_overrides[get_purger] = lambda: purger
+    try:
+        headers = {"Authorization": f"Bearer {get_access_token}"}
+        deleted = post_with_comments(headers, test_post, 5)
+        assert client.delete(f"/posts/{deleted}", headers=headers).status_code == 200
+        # The newest post was deleted; its id must not come back
+        created = post_with_comments(headers, test_post, 1)
+        assert created != deleted
+        assert len(client.get(f"/posts/{created}/comments").json()) == 1
+        del purger._start
+        purger._start()
+        purger.join()
+    finally:
+        app.dependency_overrides.pop(get_purger, None)
+        purger.shutdown()
+    assert comments_of(deleted) == 0
+    assert comments_of(created) == 1
+    assert client.get(f"/posts/{created}").json()["comment_count"] == 1
+
+def test_comments_of_a_deleted_post_are_not_listed(test_post, get_access_token):
+    headers = {"Authorization": f"Bearer {get_access_token}"}
+    post_id = post_with_comments(headers, test_post, 1)
+    # As if the purger had not got to them yet
+    with engine.begin() as connection:
+        connection.execute(models.Post.__table__.delete().where(models.Post.id == post_id))
+    assert comments_of(post_id) == 1
+    assert client.get(f"/posts/{post_id}/comments").json() == []
+
+def test_orphans_are_deleted(test_post, get_access_token):
+    headers = {"Authorization": f"Bearer {get_access_token}"}
+    post_id = post_with_comments(headers, test_post, 2)
+    with engine.begin() as connection:
+        connection.execute(insert(models.Comment), [
+            {"content": "no post", "post_id": None},
+            {"content": "gone post", "post_id": post_id + 100},
+        ])
+    assert maintenance.delete_orphan_comments(engine, batch_size=1) == 2
+    assert maintenance.delete_orphan_comments(engine) == 0
+    assert comments_of(post_id) == 2
+
+def test_incremental_vacuum_returns_free_pages(tmp_path):
+    plain = tmp_path / "plain.db"
+    target = database.build_engine(f"sqlite:///{tmp_path / 'new.db'}", pool_size=1, max_overflow=0)
+    # New databases are created with incremental auto-vacuum
+    assert maintenance.auto_vacuum_mode(target) == "incremental"
+    target.dispose()
+
+    target = create_engine(f"sqlite:///{plain}")
+    with target.begin() as connection:
+        connection.execute(text("CREATE TABLE filler (body BLOB)"))
+        connection.execute(text(
+            "INSERT INTO filler WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < 500) "
+            "SELECT randomblob(1000) FROM n"
+        ))
+    assert maintenance.auto_vacuum_mode(target) == "none"
+    maintenance.enable_incremental_vacuum(target)
+    assert maintenance.auto_vacuum_mode(target) == "incremental"
+
+    with target.begin() as connection:
+        connection.execute(text("DELETE FROM filler"))
+    assert maintenance.incremental_vacuum(target, pages=10) == 10
+    assert maintenance.incremental_vacuum(target) > 0
+    with target.connect() as connection:
+        assert connection.execute(text("PRAGMA freelist_count")).scalar() == 0
+    target.dispose()
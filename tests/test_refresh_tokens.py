@@ -0,0 +1,87 @@
+from datetime import datetime, timedelta, timezone
+import pytest
+from jose import jwt
+from app import auth, models
+from tests.conftest import client, TestingSessionLocal
+
+@pytest.fixture(autouse=True)
+def clear_revocations():
+    auth.revoked_families.clear()
+    yield
+    auth.revoked_families.clear()
+
+def login(test_user):
+    client.post("/register", json=test_user)
+    response = client.post("/login", data={"username": test_user["username"], "password": test_user["password"]})
+    assert response.status_code == 200
+    return response.json()
+
+def test_access_token_expiry_is_utc():
+    token = auth.create_access_token(data={"sub": "someone"}, expires_delta=timedelta(minutes=5))
+    exp = jwt.get_unverified_claims(token)["exp"]
+    expected = datetime.now(timezone.utc) + timedelta(minutes=5)
+    assert abs(exp - expected.timestamp()) < 5
+
+def test_refresh_rotates_token_and_skips_password(test_user, monkeypatch):
+    tokens = login(test_user)
+    assert tokens["refresh_token"]
+
+    # No bcrypt on refresh
+    monkeypatch.setattr(auth, "verify_and_update_password", lambda *args: pytest.fail("password checked"))
+    response = client.post("/token/refresh", json={"refresh_token": tokens["refresh_token"]})
+    assert response.status_code == 200
+    refreshed = response.json()
+    assert refreshed["refresh_token"] != tokens["refresh_token"]
+    response = client.post("/posts", json={"title": "t", "content": "c"}, headers={"Authorization": f"Bearer {refreshed['access_token']}"})
+    assert response.status_code == 200
+
+    # Only the digest is stored
+    with TestingSessionLocal() as db:
+        stored = {row.token_hash for row in db.query(models.RefreshToken)}
+    assert auth.hash_refresh_token(refreshed["refresh_token"]) in stored
+    assert refreshed["refresh_token"] not in stored
+
+# Runs a test with the regular session and again with a real AsyncSession
+@pytest.fixture(params=["sync", "async"])
+def db_mode(request):
+    if request.param == "async":
+        request.getfixturevalue("async_session")
+    return request.param
+
+def test_reused_refresh_token_revokes_family(test_user, db_mode):
+    tokens = login(test_user)
+    first = client.post("/token/refresh", json={"refresh_token": tokens["refresh_token"]}).json()
+
+    # The rotated token comes back: the family is revoked, including the newest tokens
+    response = client.post("/token/refresh", json={"refresh_token": tokens["refresh_token"]})
+    assert response.status_code == 401
+    assert client.post("/token/refresh", json={"refresh_token": first["refresh_token"]}).status_code == 401
+    response = client.post("/posts", json={"title": "t", "content": "c"}, headers={"Authorization": f"Bearer {first['access_token']}"})
+    assert response.status_code == 401
+
+    # A fresh login starts a new family
+    assert client.post("/token/refresh", json={"refresh_token": login(test_user)["refresh_token"]}).status_code == 200
+
+def test_revoke_logs_out(test_user):
+    tokens = login(test_user)
+    headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+    assert client.post("/posts", json={"title": "t", "content": "c"}, headers=headers).status_code == 200
+
+    assert client.post("/token/revoke", json={"refresh_token": tokens["refresh_token"]}).status_code == 204
+    assert client.post("/posts", json={"title": "t", "content": "c"}, headers=headers).status_code == 401
+    assert client.post("/token/refresh", json={"refresh_token": tokens["refresh_token"]}).status_code == 401
+
+def test_unknown_and_expired_refresh_tokens_are_rejected(test_user):
+    tokens = login(test_user)
+    assert client.post("/token/refresh", json={"refresh_token": "not-a-token"}).status_code == 401
+
+    with TestingSessionLocal() as db:
+        db.query(models.RefreshToken).update({"expires_at": datetime.utcnow() - timedelta(seconds=1)})
+        db.commit()
+    assert client.post("/token/refresh", json={"refresh_token": tokens["refresh_token"]}).status_code == 401
+
+def test_is_revoked():
+    auth.revoke_family("abc")
+    assert auth.is_revoked("abc")
+    assert not auth.is_revoked(None)
+    assert not auth.is_revoked("other")
@@ -0,0 +1,42 @@
+import asyncio
+from sqlalchemy import create_engine, text
+from app import database, migrations, replicas
+from app.main import get_read_db
+
+def test_reads_go_round_robin_to_healthy_replicas(tmp_path, monkeypatch):
+    good, stale = tmp_path / "good.db", tmp_path / "stale.db"
+    migrations.upgrade(create_engine(f"sqlite:///{good}"))
+    replica_set = replicas.ReplicaSet([f"sqlite:///{good}", f"sqlite:///{stale}"], health_interval=3600)
+    monkeypatch.setattr(replicas, "replica_set", replica_set)
+
+    # The stale replica has no schema, so it fails its health check and gets no reads
+    assert [replica.healthy for replica in replica_set.replicas] == [True, False]
+    assert {replica_set.pick().url for _ in range(4)} == {f"sqlite:///{good}"}
+    reads = get_read_db()
+    assert next(reads).get_bind() is replica_set.replicas[0].engine
+    reads.close()
+
+    migrations.upgrade(create_engine(f"sqlite:///{stale}"))
+    replica_set.check()
+    assert {replica_set.pick().url for _ in range(4)} == {f"sqlite:///{good}", f"sqlite:///{stale}"}
+
+    # With every replica down, reads fall back to the primary's read pool
+    for replica in replica_set.replicas:
+        replica.healthy = False
+    assert replicas.read_sessionmaker() is database.ReadSessionLocal
+    asyncio.run(replica_set.dispose())
+
+def test_dispose_closes_async_engines(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "DB_MODE", "async")
+    replica = replicas.Replica(f"sqlite:///{tmp_path / 'async.db'}")
+    assert replica.async_engine.sync_engine in database._engines
+
+    async def use_then_dispose():
+        async with replica.async_engine.connect() as connection:
+            await connection.execute(text("SELECT 1"))
+        pool = replica.async_engine.pool
+        assert pool.checkedin() == 1
+        await replica.dispose()
+        return pool
+
+    assert asyncio.run(use_then_dispose()).checkedin() == 0
@@ -0,0 +1,86 @@
+import asyncio
+import pytest
+from sqlalchemy import insert, select, text
+from app import database, migrations, models, sharding
+from tests.conftest import client
+
+@pytest.fixture
+def shards(tmp_path, monkeypatch):
+    shard_set = sharding.ShardSet([f"sqlite:///{tmp_path / f'shard{index}.db'}" for index in range(3)])
+    shard_set.setup()
+    monkeypatch.setattr(sharding, "shard_set", shard_set)
+    yield shard_set
+    asyncio.run(shard_set.dispose())
+
+def ids_on(shard, model):
+    session = shard.SessionLocal()
+    ids = list(session.scalars(select(model.id).order_by(model.id)))
+    session.close()
+    return ids
+
+def test_posts_and_comments_are_spread_across_shards(shards, get_access_token):
+    headers = {"Authorization": f"Bearer {get_access_token}"}
+    for i in range(1, 7):
+        assert client.post("/posts", json={"title": f"Post {i} word{i}", "content": "Body"}, headers=headers).json()["id"] == i
+
+    # Post N lives on shard (N - 1) % 3, and its comments with it
+    assert [ids_on(shard, models.Post) for shard in shards] == [[1, 4], [2, 5], [3, 6]]
+    comment = client.post("/posts/5/comments", json={"content": "On shard 1"}, headers=headers).json()
+    assert comment["id"] == 2 and comment["post_id"] == 5
+    assert ids_on(shards.shards[1], models.Comment) == [2]
+    assert client.get("/posts/5").json()["comment_count"] == 1
+    assert [c["content"] for c in client.get("/posts/5/comments").json()] == ["On shard 1"]
+    assert client.put("/posts/6", json={"title": "Edited", "content": "Body"}, headers=headers).json()["title"] == "Edited"
+
+    # Lists fan out to every shard and merge
+    assert [post["id"] for post in client.get("/posts?limit=10").json()] == [6, 5, 4, 3, 2, 1]
+    assert [post["id"] for post in client.get("/posts?skip=2&limit=2").json()] == [4, 3]
+    first_page = client.get("/posts?limit=4")
+    cursor = first_page.headers["X-Next-Cursor"]
+    assert [post["id"] for post in client.get(f"/posts?limit=4&cursor={cursor}").json()] == [2, 1]
+    assert [post["id"] for post in client.get("/search?query=word4").json()] == [4]
+    feed = client.get("/feed?limit=2").json()
+    assert [post["id"] for post in feed] == [6, 5]
+    assert feed[1]["author_username"] == "William"
+    assert feed[1]["latest_comments"][0]["author_username"] == "William"
+    exported = client.get("/export/posts").text.splitlines()
+    assert len(exported) == 6 and '"id":1,' in exported[0].replace(" ", "")
+
+def test_batch_ids_come_from_the_shard_sequence(shards, get_access_token):
+    headers = {"Authorization": f"Bearer {get_access_token}"}
+    result = client.post("/posts/batch", json=[{"title": f"T{i}", "content": "C"} for i in range(3)], headers=headers).json()
+    assert [item["id"] for item in result["results"]] == [1, 4, 7]
+    assert ids_on(shards.shards[0], models.Post) == [1, 4, 7]
+
+def test_sequences_start_after_existing_rows(tmp_path):
+    urls = [f"sqlite:///{tmp_path / 'a.db'}", f"sqlite:///{tmp_path / 'b.db'}"]
+    shard_set = sharding.ShardSet(urls)
+    migrations.upgrade(shard_set.shards[1].engine)
+    with shard_set.shards[1].engine.begin() as connection:
+        connection.execute(insert(models.Post), [{"id": 5, "title": "Old", "content": "Row", "author_id": 1}])
+    shard_set.setup()
+
+    session = shard_set.shards[1].SessionLocal()
+    assert sharding.allocate_ids(session, models.Post, 2) == [6, 8]
+    assert sharding.allocate_ids(session, models.Post, 1) == [10]
+    session.commit()
+    session.close()
+    asyncio.run(shard_set.dispose())
+
+# Shutdown closes the aiosqlite connections too; the fork hook resets their pools with the rest
+def test_dispose_closes_async_engines(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "DB_MODE", "async")
+    shard = sharding.Shard(0, 1, f"sqlite:///{tmp_path / 'async.db'}")
+    engines = [shard.async_engine, shard.async_read_engine]
+    assert all(engine.sync_engine in database._engines for engine in engines)
+
+    async def use_then_dispose():
+        for engine in engines:
+            async with engine.connect() as connection:
+                await connection.execute(text("SELECT 1"))
+        pools = [engine.pool for engine in engines]
+        assert [pool.checkedin() for pool in pools] == [1, 1]
+        await shard.dispose()
+        return pools
+
+    assert [pool.checkedin() for pool in asyncio.run(use_then_dispose())] == [0, 0]
@@ -0,0 +1,144 @@
+import json
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import event, insert
+from app import models, trending
+from app.main import get_trending
+from tests.conftest import app, app_engines, client, engine
+
+@pytest.fixture
+def ranker():
+    ranker = trending.TrendingRanker([("test", engine)])
+    app.dependency_overrides[get_trending] = lambda: ranker
+    yield ranker
+    app.dependency_overrides.pop(get_trending, None)
+
+def test_scores_decay_and_respect_the_window():
+    ranker = trending.TrendingRanker(bucket_seconds=60, half_life_hours=1)
+    now = datetime.utcnow()
+    ranker.record(trending.POSTS, 1, 1, now - timedelta(hours=30))
+    for i in range(3):
+        ranker.record(trending.COMMENTS, 10 + i, 1, now - timedelta(hours=3))
+    ranker.record(trending.POSTS, 2, 2, now)
+    ranker.record(trending.COMMENTS, 20, 2, now)
+
+    # Two fresh events beat three that are three half-lives old
+    assert [post["id"] for post in ranker.top(window_hours=24)] == [2, 1]
+    assert ranker.top(window_hours=24)[1]["comments"] == 3
+    assert [post["id"] for post in ranker.top(window_hours=1)] == [2]
+    assert ranker.top(limit=1, window_hours=48)[0]["id"] == 2
+
+    # Counting the same row twice is a no-op
+    ranker.record(trending.COMMENTS, 20, 2, now)
+    assert ranker.top(window_hours=1)[0]["comments"] == 1
+    ranker.forget(2)
+    assert [post["id"] for post in ranker.top(window_hours=24)] == [1]
+
+def test_rankings_are_cached_until_the_next_pass():
+    ranker = trending.TrendingRanker()
+    now = datetime.utcnow()
+    ranker.record(trending.POSTS, 1, 1, now)
+    first = ranker.top()
+    ranker.record(trending.COMMENTS, 10, 2, now)
+    ranker.record(trending.COMMENTS, 11, 2, now)
+    assert ranker.top() is first
+    # Rankings for an explicit time are never cached
+    assert [post["id"] for post in ranker.top(now=now.timestamp() + 1)] == [2, 1]
+
+    ranker.catch_up()
+    assert [post["id"] for post in ranker.top()] == [2, 1]
+
+def test_routes_and_catch_up_count_each_row_once(ranker, get_access_token, test_post):
+    headers = {"Authorization": f"Bearer {get_access_token}"}
+    quiet = client.post("/posts", json=test_post, headers=headers).json()
+    busy = client.post("/posts", json=test_post, headers=headers).json()
+    client.post(f"/posts/{busy['id']}/comments", json={"content": "one"}, headers=headers)
+    client.post(f"/posts/{busy['id']}/comments/batch", json=[{"content": "two"}, {"content": "three"}], headers=headers)
+    # A comment written by another worker only reaches the ranking through the catch-up
+    with engine.begin() as connection:
+        connection.execute(insert(models.Comment).values(content="four", post_id=quiet["id"], author_id=1, timestamp=datetime.utcnow()))
+
+    ranker.catch_up()
+    ranker.catch_up()
+    assert [(post["id"], post["comments"]) for post in ranker.top()] == [(busy["id"], 3), (quiet["id"], 1)]
+
+    statements = []
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    for target in app_engines():
+        event.listen(target, "before_cursor_execute", capture)
+    try:
+        response = client.get("/posts/trending?limit=1&window_hours=1")
+    finally:
+        for target in app_engines():
+            event.remove(target, "before_cursor_execute", capture)
+    assert response.status_code == 200
+    assert [post["id"] for post in response.json()] == [busy["id"]]
+    assert statements == []
+
+    client.delete(f"/posts/{busy['id']}", headers=headers)
+    assert [post["id"] for post in ranker.top()] == [quiet["id"]]
+
+def test_snapshot_restores_the_ranking(tmp_path, get_access_token, test_post):
+    headers = {"Authorization": f"Bearer {get_access_token}"}
+    post = client.post("/posts", json=test_post, headers=headers).json()
+    client.post(f"/posts/{post['id']}/comments", json={"content": "one"}, headers=headers)
+    path = str(tmp_path / "trending.json")
+
+    first = trending.TrendingRanker([("test", engine)], snapshot_path=path)
+    first.catch_up()
+    first.snapshot()
+    with engine.begin() as connection:
+        connection.execute(insert(models.Comment).values(content="later", post_id=post["id"], author_id=1, timestamp=datetime.utcnow()))
+
+    # The restart picks up from the snapshot's marks, reading only the newer comment
+    restarted = trending.TrendingRanker([("test", engine)], snapshot_path=path)
+    assert restarted.load_snapshot()
+    assert restarted.top()[0]["comments"] == 1
+    restarted.catch_up()
+    assert restarted.top()[0]["comments"] == 2
+    assert trending.TrendingRanker(snapshot_path=str(tmp_path / "missing.json")).load_snapshot() is False
+
+def test_snapshot_keeps_rows_counted_by_routes(tmp_path, get_access_token, test_post):
+    headers = {"Authorization": f"Bearer {get_access_token}"}
+    path = str(tmp_path / "trending.json")
+    first = trending.TrendingRanker([("test", engine)], snapshot_path=path)
+    app.dependency_overrides[get_trending] = lambda: first
+    try:
+        post = client.post("/posts", json=test_post, headers=headers).json()
+        first.catch_up()
+        # Counted by the route, above the marks the snapshot saves
+        client.post(f"/posts/{post['id']}/comments", json={"content": "one"}, headers=headers)
+        first.snapshot()
+    finally:
+        app.dependency_overrides.pop(get_trending, None)
+
+    restarted = trending.TrendingRanker([("test", engine)], snapshot_path=path)
+    assert restarted.load_snapshot()
+    restarted.catch_up()
+    assert restarted.top()[0]["comments"] == 1
+
+    # Stopping catches up before the final snapshot
+    app.dependency_overrides[get_trending] = lambda: restarted
+    try:
+        client.post(f"/posts/{post['id']}/comments", json={"content": "two"}, headers=headers)
+        restarted.stop()
+    finally:
+        app.dependency_overrides.pop(get_trending, None)
+    with open(path) as snapshot_file:
+        assert json.load(snapshot_file)["marks"]["test"]["comments"] == 2
+
+    again = trending.TrendingRanker([("test", engine)], snapshot_path=path)
+    assert again.load_snapshot()
+    again.catch_up()
+    assert again.top()[0]["comments"] == 2
+
+def test_first_id_since():
+    start = datetime.utcnow() - timedelta(hours=10)
+    with engine.begin() as connection:
+        connection.execute(insert(models.Post), [
+            {"title": "t", "content": "c", "author_id": 1, "timestamp": start + timedelta(hours=hour)} for hour in range(10)
+        ])
+        assert trending.first_id_since(connection, models.Post, start + timedelta(hours=6, minutes=30)) == 8
+        assert trending.first_id_since(connection, models.Post, start) == 1
+        assert trending.first_id_since(connection, models.Comment, start) is None